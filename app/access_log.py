@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Anonymized access log for the MagentaTV backend
+
+When ACCESS_LOG_FILE is set, every request is appended to the file as one
+JSON line with the route, parameters and timing. Clients are replaced by a
+salted hash and proxied URLs are dropped, so the log can be shared and
+replayed with benchmarks.replay.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+# Query parameters kept in the log, everything else is dropped
+LOGGED_PARAMS = ("days_back", "days_forward", "redirect", "proxy", "time_format", "tz", "trace", "account", "lang", "quality")
+
+# Routes whose path contains data that must not be logged
+REDACTED_ROUTES = {
+    "/api/proxy/<path:url>": "/api/proxy/-",
+    "/a/<account>/<language>/api/proxy/<path:url>": "/api/proxy/-"
+}
+
+_write_lock = threading.Lock()
+_salt = os.urandom(16)
+
+
+def client_hash(remote_addr, user_agent):
+    """
+    Anonymized client identifier
+
+    Args:
+        remote_addr (str): Client address
+        user_agent (str): Client User-Agent
+
+    Returns:
+        str: Salted hash, stable for the lifetime of the process
+    """
+    digest = hashlib.sha256(_salt + f"{remote_addr}|{user_agent}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def _before_request():
+    g.access_log_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop("access_log_start", None)
+    log_file = current_app.config["ACCESS_LOG_FILE"]
+    if start is None or not log_file:
+        return response
+
+    route = request.url_rule.rule if request.url_rule is not None else None
+    record = {
+        "ts": round(time.time(), 3),
+        "method": request.method,
+        "route": route,
+        "path": REDACTED_ROUTES.get(route, request.path),
+        "args": {key: request.args[key] for key in LOGGED_PARAMS if key in request.args},
+        "client": client_hash(request.remote_addr, request.headers.get("User-Agent", "")),
+        "status": response.status_code,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+    if request.method == "POST" and request.is_json and route and route.endswith("/api/streams"):
+        record["body"] = request.get_json(silent=True)
+
+    try:
+        with _write_lock, open(log_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logger.error(f"Error writing access log: {e}")
+
+    return response
+
+
+def init_access_log(app):
+    """
+    Register access log hooks
+
+    Args:
+        app (Flask): Application instance
+    """
+    app.before_request(_before_request)
+    app.after_request(_after_request)
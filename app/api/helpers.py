@@ -6,49 +6,193 @@ Helper functions for API endpoints
 
 import functools
 import logging
-from flask import current_app, request
+import re
+from flask import current_app, g, has_request_context, jsonify, request
+
+from app.services.results import is_error
 
 logger = logging.getLogger(__name__)
 
-# Global API instance
-_api_instance = None
+def get_pool():
+    """
+    Get the API client pool
+    
+    Returns:
+        ClientPool: Client pool of the current application
+    """
+    return current_app.extensions["client_pool"]
 
 
-@functools.lru_cache(maxsize=1)
-def get_api():
+def client_from_request():
     """
-    Get or create API instance
+    Get the client selected by the current request
+    
+    The client is selected by the /a/<account>/<language>/api URL prefix
+    or by the account and lang query parameters.
+    
+    Returns:
+        tuple: (account, language), None for values not given
+    """
+    if not has_request_context():
+        return None, None
+    
+    account = g.get("client_account") or request.args.get("account")
+    language = g.get("client_language") or request.args.get("lang")
+    return account, language
+
+
+def client_id_from_request():
+    """
+    Identifier of the device sending the current request
+    
+    Returns:
+        str: Anonymized hash of the client address and User-Agent
+    """
+    from app.access_log import client_hash
+    
+    return client_hash(request.remote_addr, request.headers.get("User-Agent", ""))
+
+
+def get_api(account=None, language=None):
+    """
+    Get API client
+    
+    Without arguments the client selected by the current request is
+    returned, or the default one outside of requests.
+    
+    Args:
+        account (str, optional): Account name
+        language (str, optional): Language
     
     Returns:
         MagentaTV: API client instance or None if initialization failed
     """
-    global _api_instance
+    if account is None and language is None:
+        account, language = client_from_request()
+    
+    return get_pool().get(account, language)
+
+
+def stream_scope():
+    """
+    Cache key scope for stream URLs of the current request
+    
+    Without an explicit account, stream URLs are resolved by any account
+    serving the language, so they are cached per language.
+    
+    Returns:
+        tuple: (scope, account, language)
+    """
+    account, language = client_from_request()
+    language = (language or current_app.config["LANGUAGE"]).lower()
+    return f"{account or '*'}/{language}", account, language
+
+
+def stream_quality():
+    """
+    Stream quality for the current request
     
-    if _api_instance is None:
-        # Import here to avoid circular import
-        from app.services import get_magenta_tv_service
+    The quality query parameter wins, then the first QUALITY_PROFILES
+    entry whose pattern matches the User-Agent, then QUALITY.
+    
+    Returns:
+        str: Quality profile (p1-p5)
+    
+    Raises:
+        ValueError: If the quality parameter is not a known profile
+    """
+    from app.services.magenta_tv import QUALITIES
+    
+    quality = request.args.get("quality")
+    if quality is not None:
+        if quality not in QUALITIES:
+            raise ValueError(f"Unknown quality: {quality}")
+        return quality
+    
+    user_agent = request.headers.get("User-Agent", "")
+    for profile in current_app.config["QUALITY_PROFILES"] or []:
+        try:
+            matched = re.search(profile["match"], user_agent, re.IGNORECASE)
+        except (KeyError, TypeError, re.error):
+            logger.warning(f"Invalid quality profile: {profile}")
+            continue
+        if matched and profile.get("quality") in QUALITIES:
+            return profile["quality"]
+    
+    return current_app.config["QUALITY"]
 
+
+def image_rewriter(server_url):
+    """
+    Image URL rewrite requested by the images query parameter
+    
+    images=1 points image links at the local image cache, images=WxH
+    (or images=W) also requests images resized to fit that size.
+    
+    Args:
+        server_url (str): Server URL used in the rewritten links
+    
+    Returns:
+        tuple: (rewrite function or None, cache key part of the rewrite; it
+            includes server_url, the rewritten links point at it)
+    
+    Raises:
+        ValueError: If the parameter is not 0, 1, W or WxH
+    """
+    value = request.args.get("images", "0")
+    if value == "0":
+        return None, ""
+    
+    width = height = None
+    if value != "1":
+        width, _, height = value.lower().partition("x")
+        width = int(width) if width else None
+        height = int(height) if height else None
+    
+    rewrite = current_app.extensions["image_cache"].rewriter(server_url, width, height)
+    return rewrite, f"{width or 0}x{height or 0}@{server_url}"
+
+
+def error_response(result, message, status=500):
+    """
+    JSON response for a failed client call
+    
+    Typed upstream errors keep their kind and map to their own HTTP status
+    (e.g. 404 for a missing channel, 504 for an upstream timeout).
+    
+    Args:
+        result: Result of the failed call (UpstreamError or None)
+        message (str): Error message
+        status (int): HTTP status if the result carries no error kind
         
-        # Check credentials
-        if not current_app.config.get("USERNAME") or not current_app.config.get("PASSWORD"):
-            logger.error("Credentials not set!")
-            return None
-            
-        # Create new instance
-        _api_instance = get_magenta_tv_service()
+    Returns:
+        tuple: (response, status code)
+    """
+    if is_error(result):
+        return jsonify({"success": False, "message": f"{message}: {result.message}", "error": result.to_dict()}), result.status_code
+    return jsonify({"success": False, "message": message}), status
+
+
+def with_app_context(fn):
+    """
+    Wrap a function so it runs in the current application context
+
+    Used for work submitted to thread pools from request handlers.
+    
+    Args:
+        fn (callable): Function to wrap
         
-        # Check if service was created
-        if _api_instance is None:
-            logger.error("Failed to create MagentaTV service!")
-            return None
-            
-        # Login
-        if not _api_instance.login():
-            logger.error("Failed to login to API!")
-            _api_instance = None
-            return None
-    
-    return _api_instance
+    Returns:
+        callable: Wrapped function
+    """
+    app = current_app._get_current_object()
+    
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with app.app_context():
+            return fn(*args, **kwargs)
+    
+    return wrapper
 
 
 def server_url_from_request():
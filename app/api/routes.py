@@ -5,9 +5,9 @@ API routes for the MagentaTV backend
 """
 from flask import (
     request, jsonify, Response, redirect, 
-    current_app, url_for, send_file
+    current_app, url_for, send_file, g
 )
-from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
 import os
 import json
 import io
@@ -16,13 +16,35 @@ import time
 import logging
 
 from app.api import api_bp
-from app.api.helpers import get_api, server_url_from_request
-from app.cache import get_from_cache, clear_cache
-from app.config import update_config
+from app.api.helpers import (
+    get_api, get_pool, client_from_request, client_id_from_request, stream_scope, stream_quality, image_rewriter,
+    server_url_from_request, with_app_context, error_response
+)
+from app.cache import (
+    get_from_cache, get_cached, get_cache_stats, clear_cache, clear_prefix, invalidate, make_key, is_stale
+)
+from app.config import update_config, public_config, validate_config
+from app.services.reconfigure import apply_config
+from app.metrics import PROXY_BYTES
+from app.profiling import profiler, hot_timer, get_timers, MODE_CPROFILE
+from app.tracing import span
+from app.services.magenta_tv import QUALITIES
+from app.services.playback import KIND_LIVE, KIND_CATCHUP
+from app.services.devices import select_devices, prune_devices
+from app.services.results import is_error
+from app.models import to_dicts, epg_to_dict
 
 logger = logging.getLogger(__name__)
 
 
+@api_bp.url_value_preprocessor
+def pull_client(endpoint, values):
+    """Take the client selection from the /a/<account>/<language>/api URL prefix"""
+    if values:
+        g.client_account = values.pop("account", None)
+        g.client_language = values.pop("language", None)
+
+
 # Root endpoint
 @api_bp.route('/')
 def index():
@@ -34,12 +56,18 @@ def index():
         "endpoints": {
             "channels": f"{base_url}/api/channels",
             "stream": f"{base_url}/api/stream/<channel_id>",
+            "streams": f"{base_url}/api/streams",
             "epg": f"{base_url}/api/epg/<channel_id>",
             "catchup": f"{base_url}/api/catchup/<channel_id>/<start_time>-<end_time>",
             "devices": f"{base_url}/api/devices",
+            "devices_prune": f"{base_url}/api/devices/prune",
             "playlist": f"{base_url}/api/playlist.m3u",
+            "image": f"{base_url}/api/image/<hash>",
             "status": f"{base_url}/api/status",
-            "config": f"{base_url}/api/config"
+            "sessions": f"{base_url}/api/sessions",
+            "cache_stats": f"{base_url}/api/cache/stats",
+            "config": f"{base_url}/api/config",
+            "metrics": f"{base_url}/metrics"
         }
     })
 
@@ -50,28 +78,31 @@ def config_endpoint():
     """Get and set configuration"""
     if request.method == 'POST':
         # Update configuration
-        data = request.get_json()
+        data = request.get_json(silent=True)
         if not data:
             return jsonify({"success": False, "message": "Invalid data format"}), 400
-
-        config = update_config(data)
         
-        # Reset API instance
-        get_api.cache_clear()
+        # Values are checked before anything is changed or saved
+        try:
+            data = validate_config(data, current_app.config)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        # Apply the changes to the running application, saved only if they applied
+        try:
+            applied = apply_config(current_app._get_current_object(), data)
+        except Exception as e:
+            logger.error(f"Failed to apply configuration: {e}")
+            return jsonify({"success": False, "message": f"Failed to apply configuration: {e}"}), 500
 
-        return jsonify({"success": True, "config": config})
+        config = update_config(data, current_app.extensions.get("config_file"))
+
+        return jsonify({"success": True, "config": public_config(config), "applied": applied})
     
     else:
-        # Safe serialization for config
-        config = {
-            k.lower(): str(v) if isinstance(v, timedelta) else v
-            for k, v in current_app.config.items()
-            if k != 'PASSWORD'
-        }
-
         return jsonify({
             "success": True, 
-            "config": config
+            "config": public_config(current_app.config)
         })
 
 
@@ -83,20 +114,35 @@ def status():
     if api is None:
         return jsonify({"success": False, "message": "API is not initialized"}), 500
 
-    config = {
-        k.lower(): str(v) if isinstance(v, timedelta) else v
-        for k, v in current_app.config.items()
-        if k not in ('PASSWORD', 'SECRET_KEY')
-    }
+    epg_sync = current_app.extensions.get("epg_sync")
 
     return jsonify({
         "success": True,
         "status": "online",
         "language": api.language,
         "quality": api.quality,
+        "device_id": api.device_id,
         "refresh_token_valid": bool(api.refresh_token),
         "token_expires": int(api.token_expires - time.time()),
-        "config": config
+        "redirects": api.get_redirect_stats(),
+        "circuits": api.get_circuit_status(),
+        "rate_limit": api.get_rate_limit_status(),
+        "epg_sync": epg_sync.status() if epg_sync else None,
+        "clients": get_pool().status(),
+        "prefetch": current_app.extensions["prefetcher"].status(),
+        "zap_predictor": current_app.extensions["zap_predictor"].status(),
+        "channel_registry": current_app.extensions["channel_registry"].status(),
+        "config": public_config(current_app.config)
+    })
+
+
+# Playback sessions endpoint
+@api_bp.route('/sessions')
+def sessions():
+    """Get active playback sessions with counts per channel, client and account"""
+    return jsonify({
+        "success": True,
+        **current_app.extensions["playback"].status()
     })
 
 
@@ -108,16 +154,80 @@ def channels():
     if api is None:
         return jsonify({"success": False, "message": "API is not initialized"}), 500
         
-    #channels_data = get_from_cache("channels", api.get_channels)
-    channels_data = api.get_channels()
+    channels_data = get_from_cache(make_key("channels", api.key), api.get_channels)
     
     if not channels_data:
-        return jsonify({"success": False, "message": "Failed to get channels list"}), 500
+        return error_response(channels_data, "Failed to get channels list")
         
-    return jsonify({
-        "success": True,
-        "channels": channels_data
-    })
+    with span("serialize"):
+        return jsonify({
+            "success": True,
+            "stale": is_stale(),
+            "channels": to_dicts(channels_data)
+        })
+
+
+def load_channels(api):
+    """Channel list loader of a client for the channel registry"""
+    return lambda: get_from_cache(make_key("channels", api.key), api.get_channels)
+
+
+def check_channel(api, channel_id):
+    """
+    Check a requested channel ID against the channel registry
+    
+    Malformed and unknown IDs are refused without an upstream call.
+    
+    Returns:
+        UpstreamError: invalid or not_found error, None if the ID may be requested
+    """
+    if not current_app.config["CHANNEL_REGISTRY_CHECK"]:
+        return None
+    return current_app.extensions["channel_registry"].check(api.key, channel_id, load_channels(api))
+
+
+def prefetch_stream(scope, channel_id, quality, account, language):
+    """Resolve a stream URL into the cache in the background"""
+    current_app.extensions["prefetcher"].submit(
+        make_key("stream", scope, channel_id, quality),
+        get_pool().call,
+        "get_stream_url",
+        channel_id,
+        quality,
+        account=account,
+        language=language,
+        tags=(make_key("channel", channel_id),)
+    )
+
+
+def prefetch_after_zap(api, scope, channel_id, quality, account, language):
+    """
+    Warm the streams a client is likely to request next
+    
+    The next-lower quality of the channel (adaptive players fall back to
+    it) and, with ZAP_PREDICT_ENABLED, the neighbouring channels in the
+    playlist and the client's most watched channels.
+    """
+    config = current_app.config
+    
+    index = QUALITIES.index(quality)
+    if index > 0 and config["STREAM_QUALITY_PREFETCH"]:
+        prefetch_stream(scope, channel_id, QUALITIES[index - 1], account, language)
+    
+    if not config["ZAP_PREDICT_ENABLED"]:
+        return
+    
+    predictor = current_app.extensions["zap_predictor"]
+    client_id = client_id_from_request()
+    predictor.record(client_id, channel_id)
+    order = current_app.extensions["channel_registry"].order(api.key, load_channels(api))
+    predicted = predictor.predict(
+        client_id, channel_id, order,
+        neighbours=config["ZAP_PREDICT_NEIGHBOURS"],
+        favourites=config["ZAP_PREDICT_FAVOURITES"]
+    )
+    for predicted_id in predicted:
+        prefetch_stream(scope, predicted_id, quality, account, language)
 
 
 # Stream endpoint
@@ -126,26 +236,129 @@ def stream(channel_id):
     """
     Get stream URL for channel
     
-    With redirect=1 parameter, redirects directly to stream
+    With redirect=1 parameter, redirects directly to stream. The quality
+    comes from the quality parameter or the client's quality profile.
     """
     api = get_api()
     if api is None:
         return jsonify({"success": False, "message": "API is not initialized"}), 500
+    
+    try:
+        quality = stream_quality()
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    error = check_channel(api, channel_id)
+    if error is not None:
+        return error_response(error, "Failed to get stream")
         
-    # Get stream info
-    stream_info = get_from_cache(f"stream_{channel_id}", api.get_stream_url, channel_id)
+    # Get stream info, without an explicit account any account serving the language resolves it
+    scope, account, language = stream_scope()
+    stream_info = get_from_cache(
+        make_key("stream", scope, channel_id, quality),
+        get_pool().call,
+        "get_stream_url",
+        channel_id,
+        quality,
+        account=account,
+        language=language,
+        tags=(make_key("channel", channel_id),)
+    )
     
     if not stream_info:
-        return jsonify({"success": False, "message": "Failed to get stream"}), 404
+        return error_response(stream_info, "Failed to get stream", 404)
+    
+    current_app.extensions["playback"].start(
+        client_id_from_request(), channel_id, KIND_LIVE, account, language, quality, stream_info.url
+    )
+    prefetch_after_zap(api, scope, channel_id, quality, account, language)
     
     # Redirect to stream or return info
     if request.args.get('redirect', '0') == '1':
-        return redirect(stream_info["url"])
+        return redirect(stream_info.url)
     else:
-        return jsonify({
-            "success": True,
-            "stream": stream_info
-        })
+        with span("serialize"):
+            return jsonify({
+                "success": True,
+                "stale": is_stale(),
+                "quality": quality,
+                "stream": stream_info.to_dict()
+            })
+
+
+# Batch stream endpoint
+@api_bp.route('/streams', methods=['POST'])
+def streams():
+    """
+    Get stream URLs for multiple channels
+    
+    Expects JSON body {"channels": [channel_id, ...]}. Cached streams are
+    returned directly, missing ones are resolved concurrently.
+    """
+    api = get_api()
+    if api is None:
+        return jsonify({"success": False, "message": "API is not initialized"}), 500
+    
+    try:
+        quality = stream_quality()
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    data = request.get_json(silent=True) or {}
+    channel_ids = data.get("channels")
+    if not isinstance(channel_ids, list) or not channel_ids:
+        return jsonify({"success": False, "message": "Expected a non-empty list of channels"}), 400
+    
+    max_channels = current_app.config["STREAM_BATCH_MAX"]
+    if len(channel_ids) > max_channels:
+        return jsonify({"success": False, "message": f"At most {max_channels} channels per request"}), 400
+    
+    # Deduplicate, keep order
+    channel_ids = list(dict.fromkeys(str(channel_id) for channel_id in channel_ids))
+    
+    # Unknown channels are refused, cache hits are returned, only misses go upstream
+    scope, account, language = stream_scope()
+    results = {channel_id: check_channel(api, channel_id) for channel_id in channel_ids}
+    results.update(
+        (channel_id, get_cached(make_key("stream", scope, channel_id, quality)))
+        for channel_id, error in list(results.items()) if error is None
+    )
+    missing = [channel_id for channel_id, stream_info in results.items() if stream_info is None]
+    
+    if missing:
+        @with_app_context
+        def resolve(channel_id):
+            try:
+                return get_from_cache(
+                    make_key("stream", scope, channel_id, quality),
+                    get_pool().call,
+                    "get_stream_url",
+                    channel_id,
+                    quality,
+                    account=account,
+                    language=language,
+                    tags=(make_key("channel", channel_id),)
+                )
+            except Exception as e:
+                logger.error(f"Error resolving stream for channel {channel_id}: {e}")
+                return None
+        
+        workers = min(len(missing), current_app.config["STREAM_BATCH_WORKERS"])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results.update(zip(missing, executor.map(resolve, missing)))
+    
+    return jsonify({
+        "success": True,
+        "quality": quality,
+        "streams": {
+            channel_id: stream_info.to_dict()
+            for channel_id, stream_info in results.items() if stream_info
+        },
+        "errors": {
+            channel_id: stream_info.kind if is_error(stream_info) else "Failed to get stream"
+            for channel_id, stream_info in results.items() if not stream_info
+        }
+    })
 
 
 # EPG endpoint
@@ -160,22 +373,47 @@ def epg(channel_id):
     days_back = int(request.args.get('days_back', 1))
     days_forward = int(request.args.get('days_forward', 1))
     
-    # Get EPG
-    epg_data = get_from_cache(
-        f"epg_{channel_id}_{days_back}_{days_forward}", 
-        api.get_epg, 
-        channel_id, 
-        days_back, 
-        days_forward
-    )
+    error = check_channel(api, channel_id)
+    if error is not None:
+        return error_response(error, "Failed to get EPG")
+    
+    # Get EPG from the background sync window, or from the API if it isn't synchronized yet
+    # (the sync worker covers the default language)
+    epg_sync = current_app.extensions.get("epg_sync")
+    epg_data = None
+    if epg_sync and api.language == current_app.config["LANGUAGE"].lower():
+        epg_data = epg_sync.get_epg(channel_id, days_back, days_forward)
+    
+    if epg_data is None:
+        epg_data = get_from_cache(
+            make_key("epg", api.key, channel_id, days_back, days_forward), 
+            api.get_epg, 
+            channel_id, 
+            days_back, 
+            days_forward,
+            tags=(make_key("channel", channel_id),)
+        )
     
     if not epg_data:
-        return jsonify({"success": False, "message": "Failed to get EPG"}), 404
-        
-    return jsonify({
-        "success": True,
-        "epg": epg_data
-    })
+        return error_response(epg_data, "Failed to get EPG", 404)
+    
+    try:
+        image_url, _ = image_rewriter(server_url_from_request())
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid images parameter"}), 400
+    
+    with span("serialize"):
+        return jsonify({
+            "success": True,
+            "stale": is_stale(),
+            # Times are kept as UTC timestamps and formatted only for the response
+            "epg": epg_to_dict(
+                epg_data,
+                time_format=request.args.get('time_format'),
+                tz=request.args.get('tz', current_app.config["TIMEZONE"]),
+                image_url=image_url
+            )
+        })
 
 
 # Catchup endpoint
@@ -198,26 +436,48 @@ def catchup(channel_id, time_range):
     except (ValueError, TypeError) as e:
         return jsonify({"success": False, "message": f"Invalid time format: {e}"}), 400
     
-    # Get catchup stream info
+    try:
+        quality = stream_quality()
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    error = check_channel(api, channel_id)
+    if error is not None:
+        return error_response(error, "Failed to get catchup stream")
+    
+    # Get catchup stream info, spread across accounts like live streams
+    scope, account, language = stream_scope()
     stream_info = get_from_cache(
-        f"catchup_{channel_id}_{start_time}_{end_time}", 
-        api.get_catchup_by_time, 
+        make_key("catchup", scope, channel_id, start_time, end_time, quality), 
+        get_pool().call,
+        "get_catchup_by_time", 
         channel_id, 
         start_time, 
-        end_time
+        end_time,
+        quality,
+        account=account,
+        language=language,
+        tags=(make_key("channel", channel_id),)
     )
     
     if not stream_info:
-        return jsonify({"success": False, "message": "Failed to get catchup stream"}), 404
+        return error_response(stream_info, "Failed to get catchup stream", 404)
+    
+    current_app.extensions["playback"].start(
+        client_id_from_request(), channel_id, KIND_CATCHUP, account, language, quality, stream_info.url
+    )
     
     # Redirect to stream or return info
     if request.args.get('redirect', '0') == '1':
-        return redirect(stream_info["url"])
+        return redirect(stream_info.url)
     else:
-        return jsonify({
-            "success": True,
-            "stream": stream_info
-        })
+        with span("serialize"):
+            return jsonify({
+                "success": True,
+                "stale": is_stale(),
+                "quality": quality,
+                "stream": stream_info.to_dict()
+            })
 
 
 # Devices endpoint
@@ -229,15 +489,70 @@ def devices():
         return jsonify({"success": False, "message": "API is not initialized"}), 500
     
     # Get devices list
-    #devices_data = get_from_cache("devices", api.get_devices)
-    devices_data = api.get_devices()
+    devices_data = get_from_cache(
+        make_key("devices", api.key), api.get_devices, timeout=current_app.config["DEVICES_CACHE_TIMEOUT"]
+    )
     
-    if devices_data is None:
-        return jsonify({"success": False, "message": "Failed to get devices list"}), 500
+    if not isinstance(devices_data, list):
+        return error_response(devices_data, "Failed to get devices list")
         
     return jsonify({
         "success": True,
-        "devices": devices_data
+        "stale": is_stale(),
+        "devices": to_dicts(devices_data)
+    })
+
+
+# Bulk device prune endpoint
+@api_bp.route('/devices/prune', methods=['POST'])
+def prune_devices_endpoint():
+    """
+    Delete registered devices in bulk
+    
+    Expects JSON body with optional filters: {"types": ["mobile", "stb"],
+    "name": "substring", "ids": [...], "keep": [...], "limit": N,
+    "dry_run": true}. Without filters all devices except the current one
+    are selected. dry_run defaults to true and only lists the selection,
+    values other than true or false are rejected.
+    """
+    api = get_api()
+    if api is None:
+        return jsonify({"success": False, "message": "API is not initialized"}), 500
+    
+    data = request.get_json(silent=True) or {}
+    types = data.get("types")
+    ids = data.get("ids")
+    keep = data.get("keep")
+    limit = data.get("limit")
+    if (any(value is not None and not isinstance(value, list) for value in (types, ids, keep))
+            or (limit is not None and (not isinstance(limit, int) or limit < 1))):
+        return jsonify({"success": False, "message": "Invalid prune filters"}), 400
+    
+    # Only an explicit false deletes, other values must not pass for a dry run
+    dry_run = data.get("dry_run", True)
+    if not isinstance(dry_run, bool):
+        return jsonify({"success": False, "message": "Invalid dry_run, expected true or false"}), 400
+    
+    # Selection is always made from a fresh list
+    devices_data = api.get_devices()
+    if not isinstance(devices_data, list):
+        return error_response(devices_data, "Failed to get devices list")
+    
+    selected = select_devices(devices_data, types=types, name=data.get("name"), ids=ids, keep=keep, limit=limit)
+    
+    deleted, failed = [], []
+    if not dry_run and selected:
+        deleted, failed = prune_devices(
+            with_app_context(api.delete_device), selected, current_app.config["DEVICE_PRUNE_WORKERS"]
+        )
+        clear_cache(make_key("devices", api.key))
+    
+    return jsonify({
+        "success": not failed,
+        "dry_run": dry_run,
+        "selected": to_dicts(selected),
+        "deleted": deleted,
+        "failed": failed
     })
 
 
@@ -250,14 +565,17 @@ def delete_device(device_id):
         return jsonify({"success": False, "message": "API is not initialized"}), 500
     
     # Delete device
-    success = api.delete_device(device_id)
+    result = api.delete_device(device_id)
     
     # Clear cache
-    clear_cache("devices")
+    clear_cache(make_key("devices", api.key))
+    
+    if not result:
+        return error_response(result, "Failed to delete device")
     
     return jsonify({
-        "success": success,
-        "message": "Device deleted" if success else "Failed to delete device"
+        "success": True,
+        "message": "Device deleted"
     })
 
 
@@ -269,15 +587,31 @@ def playlist():
     if api is None:
         return jsonify({"success": False, "message": "API is not initialized"}), 500
     
+    # Logos from the local image cache (opt-in)
+    try:
+        image_url, images = image_rewriter(server_url_from_request())
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid images parameter"}), 400
+    
     # Generate playlist
     server_url = ""
     if request.args.get('proxy', '1') == '1':
         server_url = server_url_from_request()
+        # Links in the playlist keep the selected client
+        if any(client_from_request()):
+            server_url += f"/a/{api.account}/{api.language}"
         
-    playlist_content = get_from_cache(f"playlist_{server_url}", api.generate_m3u_playlist, server_url)
+    playlist_content = get_from_cache(
+        make_key("playlist", api.key, server_url, images),
+        api.generate_m3u_playlist,
+        server_url,
+        image_url,
+        # Direct stream URLs are resolved in the default quality
+        tags=() if server_url else ("quality",)
+    )
     
     if not playlist_content:
-        return jsonify({"success": False, "message": "Failed to generate playlist"}), 500
+        return error_response(playlist_content, "Failed to generate playlist")
     
     # Return playlist as file
     response = Response(playlist_content, mimetype='application/x-mpegURL')
@@ -285,16 +619,138 @@ def playlist():
     return response
 
 
+# Image endpoint
+@api_bp.route('/image/<image_hash>')
+def image(image_hash):
+    """
+    Get a channel logo or EPG image from the local image cache
+    
+    Optional w and h resize the image to fit, format re-encodes it
+    (jpeg, png, webp).
+    """
+    from app.services.image_cache import FORMATS
+    
+    try:
+        width = int(request.args['w']) if request.args.get('w') else None
+        height = int(request.args['h']) if request.args.get('h') else None
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid image size"}), 400
+    
+    output_format = request.args.get('format')
+    if output_format is not None and output_format not in FORMATS:
+        return jsonify({"success": False, "message": f"Unsupported format: {output_format}"}), 400
+    
+    result = current_app.extensions["image_cache"].get(image_hash.lower(), width, height, output_format)
+    if result is None:
+        return jsonify({"success": False, "message": "Image not found"}), 404
+    
+    path, mimetype = result
+    return send_file(os.path.abspath(path), mimetype=mimetype, max_age=86400)
+
+
 # Clear cache endpoint
 @api_bp.route('/cache/clear')
 def clear_cache_endpoint():
-    """Clear cache"""
-    key = request.args.get('key', None)
-    clear_cache(key)
+    """
+    Clear cache
+    
+    Without parameters the whole cache is cleared. Otherwise one of:
+    key (exact key), prefix (key prefix), namespace or tag (e.g.
+    channel:123); namespaces and tags also clear their dependents.
+    """
+    key = request.args.get('key')
+    prefix = request.args.get('prefix')
+    tag = request.args.get('tag') or request.args.get('namespace')
+    
+    if key:
+        clear_cache(key)
+        message = f"Cache key {key} cleared"
+    elif prefix:
+        message = f"{clear_prefix(prefix)} cache entries with prefix {prefix} cleared"
+    elif tag:
+        message = f"{invalidate(tag)} cache entries for {tag} cleared"
+    else:
+        clear_cache()
+        current_app.extensions["channel_registry"].invalidate()
+        message = "Cache all cleared"
+    
+    return jsonify({
+        "success": True,
+        "message": message
+    })
+
+
+# Cache statistics endpoint
+@api_bp.route('/cache/stats')
+def cache_stats():
+    """Get cache statistics, top=N sets the number of hottest keys"""
+    try:
+        top = int(request.args.get('top', 10))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid top parameter"}), 400
+    
+    return jsonify({
+        "success": True,
+        "stats": get_cache_stats(top)
+    })
+
+
+# Profiling endpoint
+@api_bp.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def profile_endpoint():
+    """
+    Control runtime profiling
+    
+    POST starts a session: {"mode": "sampling"|"cprofile", "duration": seconds,
+    "requests": N, "interval_ms": 5, "all_threads": false}
+    GET returns the status, or the result with format=folded|pstats
+    DELETE stops the running session
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"success": False, "message": "Invalid data format"}), 400
+        try:
+            started = profiler.start(
+                mode=data.get("mode", "sampling"),
+                duration=data.get("duration"),
+                requests=data.get("requests"),
+                interval_ms=data.get("interval_ms", 5),
+                all_threads=data.get("all_threads", False)
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+        
+        if not started:
+            return jsonify({"success": False, "message": "Profiling is already running"}), 409
+        return jsonify({"success": True, "profile": profiler.status()})
+    
+    if request.method == 'DELETE':
+        profiler.stop()
+        return jsonify({"success": True, "profile": profiler.status()})
+    
+    output_format = request.args.get('format')
+    if output_format in ('folded', 'pstats'):
+        # cProfile results can only be read after the session ends
+        if profiler.mode == MODE_CPROFILE and profiler.active:
+            return jsonify({"success": False, "message": "Profiling is still running"}), 409
+        
+        if output_format == 'folded':
+            content = profiler.folded()
+        else:
+            content = profiler.pstats_text(sort=request.args.get('sort', 'cumulative'))
+        return Response(content, mimetype='text/plain')
     
+    return jsonify({"success": True, "profile": profiler.status()})
+
+
+# Hot-path timers endpoint
+@api_bp.route('/admin/profile/timers')
+def profile_timers():
+    """Get hot-path timers, reset=1 resets them"""
     return jsonify({
         "success": True,
-        "message": f"Cache {'key ' + key if key else 'all'} cleared"
+        "timers": get_timers(reset=request.args.get('reset', '0') == '1')
     })
 
 
@@ -305,6 +761,9 @@ def proxy(url):
     if not url.startswith('http'):
         url = 'https://' + url
     
+    # Segment requests keep the playback session of the client alive
+    current_app.extensions["playback"].heartbeat(client_id_from_request(), url)
+    
     # Get parameters from request
     headers = {}
     for key, value in request.headers.items():
@@ -315,9 +774,15 @@ def proxy(url):
     try:
         response = requests.get(url, headers=headers, stream=True)
         
+        def generate():
+            with hot_timer("proxy_stream"):
+                for chunk in response.iter_content(chunk_size=1024):
+                    PROXY_BYTES.inc(len(chunk))
+                    yield chunk
+        
         # Create response
         flask_response = Response(
-            response=response.iter_content(chunk_size=1024),
+            response=generate(),
             status=response.status_code,
             headers=dict(response.headers)
         )
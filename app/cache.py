@@ -2,69 +2,427 @@
 # -*- coding: utf-8 -*-
 """
 Cache implementation for the MagentaTV backend
+
+Keys are namespaced as "<namespace>:<part>:<part>" (see make_key). Every
+entry is tagged with its namespace and can carry further tags; invalidating
+a tag drops all entries carrying it. Dependency edges between tags propagate
+invalidation, e.g. a changed channel list invalidates the playlists.
+
+Fetch results that are errors (see app.services.results) follow their own
+policy: not_found is cached negatively for NEGATIVE_CACHE_TIMEOUT seconds,
+transient errors are never cached and expired data is served instead.
+
+Concurrent misses of one key share a single fetch: the first request
+fetches, the others wait for its result.
 """
+import sys
 import time
 import threading
 import logging
+from flask import current_app, g, has_request_context
+
+from app.tracing import span
+from app.services.results import is_error, ERROR_NOT_FOUND
 
 logger = logging.getLogger(__name__)
 
+# Separator of key parts
+KEY_SEPARATOR = ":"
+
 # Global cache variables
 cache = {}
 cache_expiry = {}
+cache_meta = {}        # key -> {"stored", "timeout" (explicit or None), "tags", "hits", "size" (computed lazily)}
+tag_index = {}         # tag -> set of keys
+dependencies = {}      # tag -> set of dependent tags
 cache_lock = threading.Lock()
 
+# Fetches in progress by key, joined by concurrent misses (guarded by cache_lock)
+_in_flight = {}
+
+# Cache event listeners (metrics, tracing) - see add_listener
+listeners = []
+
+# Expired entries are kept for stale-while-error serving and pruned periodically
+PRUNE_INTERVAL = 60
+_last_prune = 0
+
+# Counters by namespace, see get_cache_stats
+namespace_stats = {}
+stats_lock = threading.Lock()
+
+# Entry age buckets reported by get_cache_stats (upper bound in seconds, label)
+AGE_BUCKETS = ((60, "<1m"), (300, "<5m"), (900, "<15m"), (3600, "<1h"), (21600, "<6h"), (86400, "<24h"))
+
+
+def add_listener(listener):
+    """
+    Register a cache event listener
+    
+    The listener is called as listener(event, cache_key, **data) for events:
+    - "hit": data served from cache
+    - "miss": data not in cache, fetch_time (s) is the duration of the fetch
+    - "stale": fetch failed and expired data was served, age (s) is the time since expiry
+    - "negative": a not_found result was cached
+    - "coalesced": a miss waited for the fetch of a concurrent request
+    - "evict": entry removed, reason is "expired", "invalidated" or "cleared"
+    
+    Args:
+        listener (callable): Listener function
+    """
+    if listener not in listeners:
+        listeners.append(listener)
+
+
+def _notify(event, cache_key, **data):
+    """Update the statistics and call registered listeners"""
+    _record(event, cache_key, **data)
+    for listener in listeners:
+        try:
+            listener(event, cache_key, **data)
+        except Exception as e:
+            logger.error(f"Error in cache listener for {event}: {e}")
+
+
+def _record(event, cache_key, fetch_time=None, **data):
+    """Update the namespace counters"""
+    with stats_lock:
+        stats = namespace_stats.get(get_namespace(cache_key))
+        if stats is None:
+            stats = namespace_stats[get_namespace(cache_key)] = {
+                "hits": 0, "misses": 0, "stale": 0, "negative": 0, "coalesced": 0,
+                "evictions": 0, "fetches": 0, "fetch_time": 0.0
+            }
+        if event == "hit":
+            stats["hits"] += 1
+        elif event == "miss":
+            stats["misses"] += 1
+            stats["fetches"] += 1
+            stats["fetch_time"] += fetch_time
+        elif event == "stale":
+            stats["stale"] += 1
+        elif event == "negative":
+            stats["negative"] += 1
+        elif event == "coalesced":
+            stats["coalesced"] += 1
+        elif event == "evict":
+            stats["evictions"] += 1
+
+
+def _notify_evicted(keys, reason):
+    for key in keys:
+        _notify("evict", key, reason=reason)
+
+
+def make_key(namespace, *parts):
+    """
+    Build a namespaced cache key
+    
+    Args:
+        namespace (str): Namespace (e.g. "stream")
+        *parts: Key parts
+        
+    Returns:
+        str: Cache key (e.g. "stream:*/cz:123")
+    """
+    return KEY_SEPARATOR.join([namespace, *(str(part) for part in parts)])
+
+
+def get_namespace(cache_key):
+    """
+    Get the namespace of a cache key
+    
+    Args:
+        cache_key (str): Cache key (e.g. "stream:*/cz:123")
+        
+    Returns:
+        str: Namespace (e.g. "stream")
+    """
+    return cache_key.split(KEY_SEPARATOR, 1)[0]
+
+
+def add_dependency(tag, dependent_tag):
+    """
+    Register a dependency edge between tags
+    
+    Invalidating tag also invalidates dependent_tag (and its dependents).
+    Namespaces are tags, so "channels" -> "playlist" drops all playlists
+    when the channel list changes.
+    
+    Args:
+        tag (str): Source tag
+        dependent_tag (str): Tag invalidated with it
+    """
+    dependencies.setdefault(tag, set()).add(dependent_tag)
+
 
 def init_cache():
     """
     Initialize the cache
     """
-    global cache, cache_expiry
-    
     with cache_lock:
-        cache = {
-            "channels": {},
-            "streams": {},
-            "epg": {},
-            "devices": {}
-        }
-        cache_expiry = {}
+        cache.clear()
+        cache_expiry.clear()
+        cache_meta.clear()
+        tag_index.clear()
+    
+    # Outputs built from the channel list
+    add_dependency("channels", "playlist")
+    # Stream and catchup keys include the quality, playlists with direct
+    # stream URLs use the default quality and are tagged "quality"
     
     logger.debug("Cache initialized")
 
 
-def get_from_cache(cache_key, fetch_function, *args, **kwargs):
+def get_from_cache(cache_key, fetch_function, *args, tags=(), timeout=None, **kwargs):
     """
     Get data from cache or using the provided function
     
     Args:
-        cache_key (str): Cache key
+        cache_key (str): Cache key, see make_key
         fetch_function (callable): Function to fetch data if not in cache
         *args, **kwargs: Arguments to pass to the fetch function
+        tags (iterable): Tags of the entry in addition to its namespace
+        timeout (int, optional): Entry timeout in seconds, defaults to CACHE_TIMEOUT
         
     Returns:
         any: Data from cache or function
     """
+    with span(f"cache.{get_namespace(cache_key)}"):
+        return _get_from_cache(cache_key, fetch_function, args, kwargs, tags, timeout)
+
+
+class _Flight:
+    """Fetch of one key in progress, shared by concurrent misses"""
+    __slots__ = ("done", "result", "error", "stale")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.stale = False
+
+
+def _get_from_cache(cache_key, fetch_function, args, kwargs, tags, timeout):
+    now = time.time()
+    stale = None
+    previous = None
+    flight = None
+    leader = False
     with cache_lock:
         # Check cache
-        if cache_key in cache and time.time() < cache_expiry.get(cache_key, 0):
+        if cache_key in cache and now < cache_expiry.get(cache_key, 0):
             logger.debug(f"Data retrieved from cache: {cache_key}")
-            return cache[cache_key]
+            data = cache[cache_key]
+            cache_meta[cache_key]["hits"] += 1
+        else:
+            data = None
+            previous = cache.get(cache_key)
+            # Keep expired data as a fallback in case the fetch fails (expired errors are not worth serving)
+            if (cache_key in cache_expiry and not is_error(previous)
+                    and now < cache_expiry[cache_key] + current_app.config["CACHE_STALE_MAX_AGE"]):
+                stale = previous
+            flight = _in_flight.get(cache_key)
+            if flight is None:
+                flight = _in_flight[cache_key] = _Flight()
+                leader = True
     
+    if data is not None:
+        _notify("hit", cache_key)
+        return data
+    
+    if not leader:
+        # Another request is fetching the same key, share its result
+        flight.done.wait()
+        _notify("coalesced", cache_key)
+        if flight.error is not None:
+            raise flight.error
+        if flight.stale and has_request_context():
+            g.setdefault("stale_cache_keys", []).append(cache_key)
+        return flight.result
+    
+    try:
+        flight.result = _fetch(cache_key, fetch_function, args, kwargs, tags, timeout, now, stale, previous)
+        flight.stale = stale is not None and flight.result is stale
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with cache_lock:
+            _in_flight.pop(cache_key, None)
+        flight.done.set()
+
+
+def _fetch(cache_key, fetch_function, args, kwargs, tags, timeout, now, stale, previous):
+    """Fetch and store an entry, falling back to stale data on failure"""
     # Fetch data
-    data = fetch_function(*args, **kwargs)
+    start = time.perf_counter()
+    try:
+        data = fetch_function(*args, **kwargs)
+    except Exception as e:
+        if stale is None:
+            raise
+        logger.warning(f"Error fetching {cache_key}, serving stale data: {e}")
+        _serve_stale(cache_key, now)
+        return stale
+    finally:
+        _notify("miss", cache_key, fetch_time=time.perf_counter() - start)
+    
+    if is_error(data) and data.kind != ERROR_NOT_FOUND:
+        # Transient errors are answered from expired data, nothing is cached
+        if stale is not None and data.transient:
+            _serve_stale(cache_key, now)
+            return stale
+        return data
+    
+    if data is None:
+        if stale is not None:
+            _serve_stale(cache_key, now)
+        return stale
+    
+    if is_error(data):
+        # Missing objects are remembered briefly, so they do not reach upstream on every request
+        timeout = current_app.config["NEGATIVE_CACHE_TIMEOUT"]
+        _notify("negative", cache_key)
     
     # Store in cache
-    if data is not None:
-        with cache_lock:
-            from flask import current_app
-            cache[cache_key] = data
-            cache_expiry[cache_key] = time.time() + current_app.config["CACHE_TIMEOUT"]
-            logger.debug(f"Data stored in cache: {cache_key}")
+    with cache_lock:
+        _store(cache_key, data, tags, timeout)
+        logger.debug(f"Data stored in cache: {cache_key}")
+        pruned = _prune_expired(now)
+    _notify_evicted(pruned, "expired")
+    
+    # Refetched data changed, drop what was built from it
+    namespace = get_namespace(cache_key)
+    if previous is not None and namespace in dependencies and previous != data:
+        logger.info(f"Cache entry {cache_key} changed, invalidating dependents")
+        for dependent_tag in dependencies[namespace]:
+            invalidate(dependent_tag)
+    
+    return data
+
+
+def _store(cache_key, data, tags, timeout):
+    """Store an entry and index its tags (cache_lock must be held)"""
+    _remove(cache_key)
+    now = time.time()
+    all_tags = frozenset((get_namespace(cache_key), *tags))
+    cache[cache_key] = data
+    cache_expiry[cache_key] = now + (timeout if timeout is not None else current_app.config["CACHE_TIMEOUT"])
+    cache_meta[cache_key] = {"stored": now, "timeout": timeout, "tags": all_tags, "hits": 0, "size": None}
+    for tag in all_tags:
+        tag_index.setdefault(tag, set()).add(cache_key)
+
+
+def _remove(cache_key):
+    """Remove an entry and its tag index (cache_lock must be held)"""
+    cache.pop(cache_key, None)
+    cache_expiry.pop(cache_key, None)
+    meta = cache_meta.pop(cache_key, None)
+    if meta is None:
+        return False
+    for tag in meta["tags"]:
+        keys = tag_index.get(tag)
+        if keys is not None:
+            keys.discard(cache_key)
+            if not keys:
+                del tag_index[tag]
+    return True
+
+
+def _serve_stale(cache_key, now):
+    """Mark the current response as served from expired data"""
+    with cache_lock:
+        age = now - cache_expiry.get(cache_key, now)
+    logger.info(f"Serving stale cache entry {cache_key} ({int(age)} s past expiry)")
+    _notify("stale", cache_key, age=age)
+    if has_request_context():
+        g.setdefault("stale_cache_keys", []).append(cache_key)
+
+
+def _prune_expired(now):
+    """
+    Drop entries past the stale window, at most once per PRUNE_INTERVAL (cache_lock must be held)
+    
+    Returns:
+        list: Removed keys
+    """
+    global _last_prune
+    
+    if now - _last_prune < PRUNE_INTERVAL:
+        return []
+    _last_prune = now
+    
+    limit = now - current_app.config["CACHE_STALE_MAX_AGE"]
+    keys = [key for key, expiry in cache_expiry.items() if expiry < limit]
+    for key in keys:
+        _remove(key)
+    return keys
+
+
+def is_stale():
+    """
+    Check whether the current response contains stale cache data
     
+    Returns:
+        bool: True if expired data was served because the fetch failed
+    """
+    return has_request_context() and bool(g.get("stale_cache_keys"))
+
+
+def add_stale_headers(response):
+    """
+    Mark responses containing stale data (after_request hook)
+    
+    Args:
+        response (Response): Flask response
+        
+    Returns:
+        Response: Response with X-Cache-Status and Warning headers if stale
+    """
+    if is_stale():
+        response.headers["X-Cache-Status"] = "STALE"
+        response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
+def get_cached(cache_key):
+    """
+    Get data from cache without fetching it
+    
+    Args:
+        cache_key (str): Cache key
+        
+    Returns:
+        any: Cached data or None if the key is missing or expired
+    """
+    with cache_lock:
+        if cache_key in cache and time.time() < cache_expiry.get(cache_key, 0):
+            data = cache[cache_key]
+            cache_meta[cache_key]["hits"] += 1
+        else:
+            return None
+    
+    # Misses are counted by get_from_cache when the data is fetched
+    _notify("hit", cache_key)
     return data
 
 
+def is_cached(cache_key):
+    """
+    Check whether a key holds valid data, without counting a hit
+    
+    Args:
+        cache_key (str): Cache key
+        
+    Returns:
+        bool: True if the key is cached and not expired
+    """
+    with cache_lock:
+        return cache_key in cache and time.time() < cache_expiry.get(cache_key, 0)
+
+
 def clear_cache(cache_key=None):
     """
     Clear cache entries
@@ -78,25 +436,94 @@ def clear_cache(cache_key=None):
     with cache_lock:
         if cache_key is None:
             # Clear all cache
-            global cache, cache_expiry
-            cache = {
-                "channels": {},
-                "streams": {},
-                "epg": {},
-                "devices": {}
-            }
-            cache_expiry = {}
+            keys = list(cache_meta)
+            cache.clear()
+            cache_expiry.clear()
+            cache_meta.clear()
+            tag_index.clear()
             logger.debug("All cache entries cleared")
-        elif cache_key in cache:
+        elif _remove(cache_key):
             # Clear specific entry
-            del cache[cache_key]
-            if cache_key in cache_expiry:
-                del cache_expiry[cache_key]
+            keys = [cache_key]
             logger.debug(f"Cache entry cleared: {cache_key}")
-            
+        else:
+            keys = []
+    
+    _notify_evicted(keys, "cleared")
     return True
 
 
+def invalidate(tag):
+    """
+    Clear all entries with a tag and the tags depending on it
+    
+    Args:
+        tag (str): Tag or namespace (e.g. "playlist", "channel:123")
+        
+    Returns:
+        int: Number of cleared entries
+    """
+    # Follow dependency edges
+    tags = {tag}
+    pending = [tag]
+    while pending:
+        for dependent_tag in dependencies.get(pending.pop(), ()):
+            if dependent_tag not in tags:
+                tags.add(dependent_tag)
+                pending.append(dependent_tag)
+    
+    with cache_lock:
+        keys = set()
+        for current_tag in tags:
+            keys.update(tag_index.get(current_tag, ()))
+        for key in keys:
+            _remove(key)
+    
+    _notify_evicted(keys, "invalidated")
+    logger.debug(f"Invalidated {len(keys)} cache entries for tags {', '.join(sorted(tags))}")
+    return len(keys)
+
+
+def clear_prefix(prefix):
+    """
+    Clear all cache entries whose key starts with a prefix
+    
+    Args:
+        prefix (str): Key prefix (e.g. "epg:default/cz:123:")
+        
+    Returns:
+        int: Number of cleared entries
+    """
+    with cache_lock:
+        keys = [key for key in cache_expiry if key.startswith(prefix)]
+        for key in keys:
+            _remove(key)
+    
+    _notify_evicted(keys, "invalidated")
+    logger.debug(f"Cleared {len(keys)} cache entries with prefix {prefix}")
+    return len(keys)
+
+
+def rescale_expiry(old_timeout, new_timeout):
+    """
+    Move the expiry of existing entries to a new cache timeout
+    
+    Entries keep their age, they expire as if they had been stored with
+    the new timeout. Entries stored with an explicit timeout are kept.
+    
+    Args:
+        old_timeout (int): Timeout the entries were stored with
+        new_timeout (int): New timeout
+    """
+    delta = new_timeout - old_timeout
+    with cache_lock:
+        for key, meta in cache_meta.items():
+            if meta["timeout"] is None:
+                cache_expiry[key] += delta
+    
+    logger.debug(f"Cache expiry moved by {delta} s")
+
+
 def get_cache_info():
     """
     Get information about current cache state
@@ -112,4 +539,120 @@ def get_cache_info():
             "expires_in": {k: int(v - current_time) for k, v in cache_expiry.items()}
         }
         
-    return info
\ No newline at end of file
+    return info
+
+
+def approx_size(obj):
+    """
+    Approximate deep memory size of an object
+    
+    Follows containers, slots and instance dictionaries; objects shared
+    with other entries (interned strings, small ints) are counted too.
+    
+    Args:
+        obj (any): Object to measure
+        
+    Returns:
+        int: Size in bytes
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, type):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current)
+        
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif isinstance(current, (str, bytes, int, float, bool)) or current is None:
+            continue
+        else:
+            slots = getattr(type(current), "__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            stack.extend(getattr(current, name) for name in slots if hasattr(current, name))
+            if hasattr(current, "__dict__"):
+                stack.append(current.__dict__)
+    return total
+
+
+def _age_bucket(age):
+    for limit, label in AGE_BUCKETS:
+        if age < limit:
+            return label
+    return ">=24h"
+
+
+def get_cache_stats(top=10):
+    """
+    Get cache statistics for tuning timeouts and capacity
+    
+    Args:
+        top (int): Number of hottest keys to return
+        
+    Returns:
+        dict: Entry counts and approximate memory per namespace, hit, miss,
+              stale and eviction counters, fetch latency averages, the entry
+              age distribution and the hottest keys
+    """
+    now = time.time()
+    with cache_lock:
+        entries = [(key, cache[key], cache_expiry[key], cache_meta[key]) for key in cache_meta]
+    
+    namespaces = {}
+    ages = {label: 0 for _, label in AGE_BUCKETS}
+    ages[">=24h"] = 0
+    hot = []
+    for key, value, expiry, meta in entries:
+        # Entries do not change once stored, the size is computed once
+        if meta["size"] is None:
+            meta["size"] = approx_size(value)
+        
+        namespace = namespaces.setdefault(get_namespace(key), {"entries": 0, "expired": 0, "bytes": 0})
+        namespace["entries"] += 1
+        namespace["bytes"] += meta["size"]
+        if expiry <= now:
+            namespace["expired"] += 1
+        
+        age = now - meta["stored"]
+        ages[_age_bucket(age)] += 1
+        hot.append((meta["hits"], key, int(age), meta["size"]))
+    
+    with stats_lock:
+        counters = {name: dict(stats) for name, stats in namespace_stats.items()}
+    
+    for name in set(namespaces) | set(counters):
+        namespace = namespaces.setdefault(name, {"entries": 0, "expired": 0, "bytes": 0})
+        stats = counters.get(name, {
+            "hits": 0, "misses": 0, "stale": 0, "negative": 0, "coalesced": 0, "evictions": 0, "fetches": 0, "fetch_time": 0.0
+        })
+        lookups = stats["hits"] + stats["misses"]
+        namespace.update({
+            "avg_entry_bytes": namespace["bytes"] // namespace["entries"] if namespace["entries"] else 0,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+            "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else None,
+            "stale": stats["stale"],
+            "negative": stats["negative"],
+            "coalesced": stats["coalesced"],
+            "evictions": stats["evictions"],
+            "avg_fetch_ms": round(stats["fetch_time"] * 1000 / stats["fetches"], 2) if stats["fetches"] else None
+        })
+    
+    hot.sort(reverse=True)
+    return {
+        "entries": len(entries),
+        "bytes": sum(namespace["bytes"] for namespace in namespaces.values()),
+        "namespaces": dict(sorted(namespaces.items())),
+        "age": ages,
+        "hot_keys": [
+            {"key": key, "hits": hits, "age": age, "bytes": size}
+            for hits, key, age, size in hot[:top]
+        ]
+    }
@@ -5,6 +5,7 @@ Configuration management for the MagentaTV backend
 """
 import os
 import json
+from datetime import timedelta
 
 
 # Default configuration
@@ -12,16 +13,219 @@ DEFAULT_CONFIG = {
     "USERNAME": "",                # Přihlašovací jméno
     "PASSWORD": "",                # Heslo
     "LANGUAGE": "cz",              # Jazyk ("cz" nebo "sk")
+    "ACCOUNTS": [],                # Další účty: [{"name", "username", "password", "languages"}]
+    "DEVICE_ID": "",               # Pevné ID zařízení výchozího účtu (prázdné = uložené v DATA_DIR/device_identity.json)
     "QUALITY": "p5",               # Kvalita streamu (p1-p5, kde p5 je nejvyšší)
+    "QUALITY_PROFILES": [],        # Kvalita podle User-Agent klienta: [{"match": "regex", "quality": "p2"}]
+    "STREAM_QUALITY_PREFETCH": False,  # Načtení nižší kvality streamu na pozadí pro adaptivní přehrávače (další 2 požadavky na API na přepnutí)
+    "PREFETCH_WORKERS": 2,         # Souběžné požadavky při načítání do cache na pozadí
+    "ZAP_PREDICT_ENABLED": False,  # Předběžné získání streamů kanálů, na které klient pravděpodobně přepne
+    "ZAP_PREDICT_NEIGHBOURS": 1,   # Počet sousedních kanálů v playlistu na každou stranu
+    "ZAP_PREDICT_FAVOURITES": 3,   # Počet nejsledovanějších kanálů klienta
+    "PLAYBACK_SESSION_TIMEOUT": 300,   # Doba v sekundách bez požadavku klienta, po které sledování končí
+    "PLAYBACK_STREAM_LIMIT": 0,    # Počet souběžných streamů povolený poskytovatelem (0 = neznámý)
+    "STREAM_REDIRECT_MODE": "eager",   # Řešení přesměrování streamu (eager, lazy, background)
+    "STREAM_REDIRECT_CACHE_TIMEOUT": 300,  # Platnost výsledných URL v režimu background
     "APP_VERSION": "4.0.25-hf.0",             
+    "API_BASE_URL": "",            # Adresa API (prázdné = https://{language}go.magio.tv)
     "HOST": "0.0.0.0",             # Adresa, na které bude server poslouchat
     "PORT": 5000,                  # Port serveru
     "CACHE_TIMEOUT": 3600,         # Platnost cache v sekundách (1 hodina)
+    "CACHE_STALE_MAX_AGE": 86400,  # Jak dlouho po vypršení lze při výpadku API vrátit zastaralá data
+    "NEGATIVE_CACHE_TIMEOUT": 60,  # Jak dlouho si cache pamatuje neexistující kanály a pořady
+    "CHANNEL_REGISTRY_CHECK": True,    # Odmítnutí neznámých ID kanálů bez dotazu na API
+    "CIRCUIT_FAILURE_THRESHOLD": 5,    # Počet chyb endpointu po sobě, po kterém se požadavky dočasně nezkouší
+    "CIRCUIT_RESET_TIMEOUT": 30,   # Doba v sekundách před zkušebním požadavkem na nedostupný endpoint
+    "UPSTREAM_MIN_TIMEOUT": 2,     # Minimální adaptivní timeout požadavků na API v sekundách
+    "UPSTREAM_RATE_LIMIT": 0,      # Maximální počet požadavků na API za sekundu (0 = bez omezení), přepnutí na kanál mimo cache stojí 2 požadavky, např. limit 10 = cca 5 přepnutí/s
+    "UPSTREAM_BURST": 0,           # Počet požadavků na API, které lze odeslat najednou (0 = požadavky za jednu sekundu)
+    "STREAM_BATCH_WORKERS": 8,     # Souběžné požadavky při hromadném získání streamů
+    "STREAM_BATCH_MAX": 50,        # Maximální počet kanálů v jednom hromadném požadavku
+    "DEVICES_CACHE_TIMEOUT": 300,  # Platnost seznamu zařízení v cache v sekundách
+    "DEVICE_PRUNE_WORKERS": 4,     # Souběžné požadavky při hromadném odstranění zařízení
+    "IMAGE_CACHE_MAX_AGE": 604800, # Platnost log a obrázků EPG uložených na disku v sekundách (7 dní)
+    "TIMEZONE": "Europe/Prague",   # Časové pásmo pro výstup EPG
     "DATA_DIR": "data",            # Složka pro ukládání dat
+    "EPG_SYNC_ENABLED": False,     # Synchronizace EPG na pozadí
+    "EPG_SYNC_DAYS_BACK": 7,       # Počet dní archivu držených v paměti
+    "EPG_SYNC_DAYS_FORWARD": 3,    # Počet dní dopředu držených v paměti
+    "EPG_SYNC_INTERVAL": 900,      # Interval synchronizace v sekundách
+    "EPG_SYNC_SHARD_SIZE": 20,     # Počet kanálů v jednom požadavku
+    "EPG_SYNC_WORKERS": 2,         # Maximální počet souběžných požadavků
+    "EPG_SYNC_JITTER": 0.5,        # Náhodné zpoždění požadavků (podíl časového slotu)
+    "ACCESS_LOG_FILE": "",         # Anonymizovaný access log pro přehrávání zátěže (prázdné = vypnuto)
+    "TRACE_SAMPLE_RATE": 0.0,      # Podíl požadavků s tracingem (0-1), jinak jen s ?trace=1
+    "TRACE_LOG": False,            # Logování tracingu jako JSON
     "DEBUG": False                  # Debug mód
 }
 
 
+# Settings never returned by the API
+SECRET_SETTINGS = ("PASSWORD", "SECRET_KEY")
+
+# Allowed values of settings with a fixed set of values
+SETTING_CHOICES = {
+    "LANGUAGE": ("cz", "sk"),
+    "QUALITY": ("p1", "p2", "p3", "p4", "p5"),
+    "STREAM_REDIRECT_MODE": ("eager", "lazy", "background")
+}
+
+
+def public_config(config):
+    """
+    Configuration safe to return from the API
+
+    Secrets are left out: PASSWORD, SECRET_KEY and the password of each
+    account in ACCOUNTS.
+
+    Args:
+        config (dict): Configuration, keys in upper case
+
+    Returns:
+        dict: Configuration with lowercase keys and without secrets
+    """
+    public = {}
+    for key, value in config.items():
+        if key.upper() in SECRET_SETTINGS:
+            continue
+        if key.upper() == "ACCOUNTS" and isinstance(value, list):
+            value = [
+                {k: v for k, v in account.items() if k.lower() != "password"} if isinstance(account, dict) else account
+                for account in value
+            ]
+        elif isinstance(value, timedelta):
+            value = str(value)
+        public[key.lower()] = value
+    return public
+
+
+def _coerce(key, value):
+    """
+    Convert a posted value to the type of its default
+
+    Args:
+        key (str): Setting name, upper case
+        value (any): Posted value
+
+    Returns:
+        any: Converted value
+
+    Raises:
+        ValueError: If the value cannot be converted or is out of range
+    """
+    default = DEFAULT_CONFIG[key]
+    if isinstance(default, bool):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ("true", "1", "false", "0"):
+            return value.lower() in ("true", "1")
+        raise ValueError("expected a boolean")
+
+    if isinstance(default, (int, float)):
+        if isinstance(value, bool):
+            raise ValueError("expected a number")
+        try:
+            number = float(value) if isinstance(default, float) else int(value)
+        except (TypeError, ValueError):
+            raise ValueError("expected a number") from None
+        if isinstance(default, int) and isinstance(value, float) and value != number:
+            raise ValueError("expected a whole number")
+        if number < 0:
+            raise ValueError("must not be negative")
+        return number
+
+    if isinstance(default, list):
+        if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+            raise ValueError("expected a list of objects")
+        return value
+
+    if not isinstance(value, str):
+        raise ValueError("expected a string")
+    if key in SETTING_CHOICES and value.lower() not in SETTING_CHOICES[key]:
+        raise ValueError(f"expected one of {', '.join(SETTING_CHOICES[key])}")
+    return value.lower() if key in SETTING_CHOICES else value
+
+
+def validate_config(new_config, current_config=None):
+    """
+    Validate posted configuration values
+
+    Known settings are converted to the type of their default, e.g. the
+    string "60" to the number 60; unknown settings are ignored. Accounts
+    posted without a password keep their current password.
+
+    Args:
+        new_config (dict): Posted values, keys in any case
+        current_config (dict, optional): Current configuration
+
+    Returns:
+        dict: Converted values, keys in upper case
+
+    Raises:
+        ValueError: If any value is invalid, naming all invalid settings
+    """
+    if not isinstance(new_config, dict):
+        raise ValueError("Invalid data format")
+
+    values = {}
+    errors = []
+    for key, value in new_config.items():
+        key_upper = str(key).upper()
+        if key_upper not in DEFAULT_CONFIG:
+            continue
+        try:
+            values[key_upper] = _coerce(key_upper, value)
+        except ValueError as e:
+            errors.append(f"{key.lower()}: {e}")
+
+    if errors:
+        raise ValueError(f"Invalid configuration: {'; '.join(errors)}")
+
+    if "ACCOUNTS" in values and current_config is not None:
+        values["ACCOUNTS"] = keep_account_passwords(values["ACCOUNTS"], current_config.get("ACCOUNTS"))
+    return values
+
+
+def keep_account_passwords(accounts, current_accounts):
+    """
+    Restore account passwords left out of a configuration update
+
+    public_config returns accounts without passwords, so accounts posted
+    back unchanged keep the password of the account with the same name.
+
+    Args:
+        accounts (list): Posted accounts
+        current_accounts (list): Accounts of the current configuration
+
+    Returns:
+        list: Accounts with passwords
+    """
+    if not isinstance(accounts, list):
+        return accounts
+    passwords = {
+        account.get("name"): account.get("password")
+        for account in current_accounts or () if isinstance(account, dict)
+    }
+    return [
+        {**account, "password": passwords.get(account.get("name"), "")}
+        if isinstance(account, dict) and "password" not in account else account
+        for account in accounts
+    ]
+
+
+def _read_config_file(config_file):
+    """Read the values stored in a configuration file, keys as stored"""
+    if not os.path.exists(config_file):
+        return {}
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            loaded_config = json.load(f)
+    except Exception as e:
+        print(f"Error loading config: {e}")
+        return {}
+    return loaded_config if isinstance(loaded_config, dict) else {}
+
+
 def load_config(config_file=None):
     """
     Load configuration from file
@@ -39,17 +243,13 @@ def load_config(config_file=None):
     if config_file is None:
         config_file = os.path.join(config["DATA_DIR"], "config.json")
     
-    # Load config from file if exists
-    if os.path.exists(config_file):
-        try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                loaded_config = json.load(f)
-                # Update config with loaded values
-                for key, value in loaded_config.items():
-                    if key.upper() in config:
-                        config[key.upper()] = value
-        except Exception as e:
-            print(f"Error loading config: {e}")
+    # Update config with loaded values
+    for key, value in _read_config_file(config_file).items():
+        if key.upper() in config:
+            try:
+                config[key.upper()] = _coerce(key.upper(), value)
+            except ValueError as e:
+                print(f"Ignoring invalid config value {key}: {e}")
     
     return config
 
@@ -87,6 +287,9 @@ def update_config(new_config, config_file=None):
     """
     Update configuration with new values and save to file
 
+    Only settings already stored in the file and changed settings are
+    written, defaults stay in DEFAULT_CONFIG.
+
     Args:
         new_config (dict): New configuration values
         config_file (str, optional): Path to the configuration file
@@ -94,16 +297,27 @@ def update_config(new_config, config_file=None):
     Returns:
         dict: Updated configuration
     """
+    if config_file is None:
+        config_file = os.path.join(DEFAULT_CONFIG["DATA_DIR"], "config.json")
+    
     # Load current config
     config = load_config(config_file)
+    stored = _read_config_file(config_file)
+    stored_keys = {key.upper(): key for key in stored}
     
     # Update config
+    changed = False
     for key, value in new_config.items():
         key_upper = key.upper()
-        if key_upper in config:
-            config[key_upper] = value
+        if key_upper not in config:
+            continue
+        if key_upper in stored_keys or config[key_upper] != value:
+            stored[stored_keys.get(key_upper, key.lower())] = value
+            changed = True
+        config[key_upper] = value
     
     # Save updated config
-    save_config(config, config_file)
+    if changed:
+        save_config(stored, config_file)
     
     return config
\ No newline at end of file
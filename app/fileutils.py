@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+File helpers for the MagentaTV backend
+
+State in DATA_DIR is shared by worker processes and survives crashes, so
+files are replaced atomically and writers can hold a lock across processes.
+"""
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def atomic_write(path, data):
+    """
+    Write a file atomically, readers see the old or the new content, never a part
+
+    Args:
+        path (str): File path
+        data (bytes or str): Content, str is written as UTF-8
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data):
+    """
+    Write JSON data atomically
+
+    Args:
+        path (str): File path
+        data (any): JSON-serializable data
+    """
+    atomic_write(path, json.dumps(data, indent=2))
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Exclusive lock shared by threads and processes
+
+    Processes are synchronized through an flock on path + ".lock" where
+    available, threads of this process through an in-memory lock.
+
+    Args:
+        path (str): Path of the protected file
+    """
+    with _thread_locks_lock:
+        thread_lock = _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
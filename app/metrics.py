@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus-style metrics for the MagentaTV backend
+
+Metrics are collected through the MagentaTV client hooks, the cache
+listeners and Flask request hooks, and exposed in the Prometheus text
+format on /metrics.
+"""
+import bisect
+import threading
+import time
+import logging
+from flask import Response, g, request
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# All registered metrics
+registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """
+    Monotonic counter with labels
+    """
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        """Increase the counter"""
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        """Get current values by label values"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge:
+    """
+    Gauge with labels, set directly or read from a function when rendered
+    """
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._function = None
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def set(self, value, **labels):
+        """Set the gauge"""
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function):
+        """Read the values from function() -> {label values: value} when rendered"""
+        self._function = function
+
+    def collect(self):
+        """Get current values by label values"""
+        if self._function is not None:
+            try:
+                return dict(self._function())
+            except Exception as e:
+                logger.error(f"Error collecting gauge {self.name}: {e}")
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram with labels and fixed buckets
+    """
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, **labels):
+        """Record an observation"""
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                values[index] += 1
+            values[-2] += value
+            values[-1] += 1
+
+    def collect(self):
+        """Get bucket counts, sum and count by label values"""
+        with self._lock:
+            return {key: list(values) for key, values in self._values.items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, values in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {values[-1]}")
+        return lines
+
+
+# HTTP server
+HTTP_REQUEST_DURATION = Histogram(
+    "magenta_http_request_duration_seconds", "Request handling time by route", ("route", "method"))
+HTTP_REQUESTS = Counter(
+    "magenta_http_requests_total", "Requests by route and status", ("route", "method", "status"))
+
+# Upstream API
+UPSTREAM_REQUEST_DURATION = Histogram(
+    "magenta_upstream_request_duration_seconds", "Upstream API request time by endpoint", ("endpoint",))
+UPSTREAM_ERRORS = Counter(
+    "magenta_upstream_errors_total", "Upstream API errors by endpoint and kind", ("endpoint", "kind"))
+UPSTREAM_QUEUE_WAIT = Histogram(
+    "magenta_upstream_queue_wait_seconds", "Time requests waited for the upstream rate limiter", ("priority",))
+TOKEN_REFRESHES = Counter(
+    "magenta_token_refreshes_total", "Successful logins and token refreshes", ("kind",))
+
+# Cache
+CACHE_HITS = Counter("magenta_cache_hits_total", "Cache hits by namespace", ("namespace",))
+CACHE_MISSES = Counter("magenta_cache_misses_total", "Cache misses by namespace", ("namespace",))
+CACHE_EVICTIONS = Counter(
+    "magenta_cache_evictions_total", "Removed cache entries by namespace and reason", ("namespace", "reason"))
+CACHE_STALE = Counter("magenta_cache_stale_total", "Expired entries served after a failed fetch", ("namespace",))
+CACHE_NEGATIVE = Counter("magenta_cache_negative_total", "Not-found results cached by namespace", ("namespace",))
+CACHE_COALESCED = Counter(
+    "magenta_cache_coalesced_total", "Misses that shared the fetch of a concurrent request", ("namespace",))
+
+# Proxy
+PROXY_BYTES = Counter("magenta_proxy_bytes_total", "Bytes transferred through the proxy endpoint")
+
+# Playback
+PLAYBACK_SESSIONS = Gauge(
+    "magenta_playback_sessions", "Active playback sessions by kind and account", ("kind", "account"))
+
+
+def render():
+    """
+    Render all metrics in the Prometheus text format
+
+    Returns:
+        str: Metrics exposition
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def on_upstream_event(event, **data):
+    """MagentaTV client hook"""
+    if event == "request":
+        endpoint = data["endpoint"]
+        UPSTREAM_REQUEST_DURATION.observe(data["duration"], endpoint=endpoint)
+        if data["error"] is not None:
+            UPSTREAM_ERRORS.inc(endpoint=endpoint, kind="transport")
+        elif data["status"] >= 400:
+            UPSTREAM_ERRORS.inc(endpoint=endpoint, kind="http")
+    elif event == "rejected":
+        UPSTREAM_ERRORS.inc(endpoint=data["endpoint"], kind="rejected")
+    elif event == "throttled":
+        if data["wait"] is None:
+            UPSTREAM_ERRORS.inc(endpoint=data["endpoint"], kind="throttled")
+        else:
+            UPSTREAM_QUEUE_WAIT.observe(data["wait"], priority=data["priority"])
+    elif event == "circuit_open":
+        UPSTREAM_ERRORS.inc(endpoint=data["endpoint"], kind="circuit_open")
+    elif event == "token":
+        TOKEN_REFRESHES.inc(kind=data["kind"])
+
+
+def on_cache_event(event, cache_key, **data):
+    """Cache listener"""
+    from app.cache import get_namespace
+
+    if event == "hit":
+        CACHE_HITS.inc(namespace=get_namespace(cache_key))
+    elif event == "miss":
+        CACHE_MISSES.inc(namespace=get_namespace(cache_key))
+    elif event == "stale":
+        CACHE_STALE.inc(namespace=get_namespace(cache_key))
+    elif event == "negative":
+        CACHE_NEGATIVE.inc(namespace=get_namespace(cache_key))
+    elif event == "coalesced":
+        CACHE_COALESCED.inc(namespace=get_namespace(cache_key))
+    elif event == "evict":
+        CACHE_EVICTIONS.inc(namespace=get_namespace(cache_key), reason=data["reason"])
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, route=route, method=request.method)
+        HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+
+def metrics_endpoint():
+    """Metrics in the Prometheus text format"""
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    """
+    Register metrics hooks and the /metrics endpoint
+
+    Args:
+        app (Flask): Application instance
+    """
+    from app.cache import add_listener
+    from app.services.magenta_tv import MagentaTV
+
+    MagentaTV.add_hook(on_upstream_event)
+    add_listener(on_cache_event)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
+
+    logger.debug("Metrics initialized")
@@ -13,6 +13,7 @@ from app.models.channel import Channel
 from app.models.stream import Stream
 from app.models.program import Program
 from app.models.device import Device
+from app.models.serialization import to_dicts, epg_to_dict
 
 # Export all models
-__all__ = ['Channel', 'Stream', 'Program', 'Device']
\ No newline at end of file
+__all__ = ['Channel', 'Stream', 'Program', 'Device', 'to_dicts', 'epg_to_dict']
\ No newline at end of file
@@ -3,19 +3,24 @@
 """
 Channel model
 """
+from dataclasses import dataclass
 
 
+@dataclass(slots=True)
 class Channel:
     """
     Represents a TV channel
     """
-    def __init__(self, id, name, logo=None, group=None, has_archive=False, original_name=None):
-        self.id = id
-        self.name = name
-        self.original_name = original_name or name
-        self.logo = logo
-        self.group = group or "Other"
-        self.has_archive = has_archive
+    id: int
+    name: str
+    logo: str = None
+    group: str = None
+    has_archive: bool = False
+    original_name: str = None
+
+    def __post_init__(self):
+        self.original_name = self.original_name or self.name
+        self.group = self.group or "Other"
         
     def to_dict(self):
         """Convert to dictionary representation"""
@@ -38,4 +43,4 @@ class Channel:
             logo=data.get("logo"),
             group=data.get("group", "Other"),
             has_archive=data.get("has_archive", False)
-        )
\ No newline at end of file
+        )
@@ -3,17 +3,18 @@
 """
 Device model
 """
+from dataclasses import dataclass
 
 
+@dataclass(slots=True)
 class Device:
     """
     Represents a registered device
     """
-    def __init__(self, id, name, type="other", is_this_device=False):
-        self.id = id
-        self.name = name
-        self.type = type
-        self.is_this_device = is_this_device
+    id: str
+    name: str
+    type: str = "other"
+    is_this_device: bool = False
         
     def to_dict(self):
         """Convert to dictionary representation"""
@@ -32,4 +33,4 @@ class Device:
             name=data.get("name", ""),
             type=data.get("type", "other"),
             is_this_device=data.get("is_this_device", False)
-        )
\ No newline at end of file
+        )
@@ -3,40 +3,58 @@
 """
 Program model
 """
+from dataclasses import dataclass, field
 
 
+@dataclass(slots=True)
 class Program:
     """
     Represents a TV program
+
+    Start and end times are UTC epoch seconds; they are formatted only
+    when the program is serialized.
     """
-    def __init__(self, schedule_id, title, start_time, end_time, 
-                 description=None, duration=0, category=None, 
-                 year=None, episode=None, images=None):
-        self.schedule_id = schedule_id
-        self.title = title
-        self.start_time = start_time
-        self.end_time = end_time
-        self.description = description or ""
-        self.duration = duration
-        self.category = category or ""
-        self.year = year
-        self.episode = episode
-        self.images = images or []
+    schedule_id: int
+    title: str
+    start_timestamp: int
+    end_timestamp: int
+    description: str = None
+    duration: int = 0
+    category: str = None
+    year: int = None
+    episode: str = None
+    images: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.description = self.description or ""
+        self.category = self.category or ""
+        self.images = self.images or []
         
-    def to_dict(self):
-        """Convert to dictionary representation"""
-        return {
+    def to_dict(self, formatter=None, image_url=None):
+        """
+        Convert to dictionary representation
+
+        Args:
+            formatter (callable, optional): Timestamp formatter adding
+                start_time and end_time strings (see app.timeutils)
+            image_url (callable, optional): Rewrites image URLs
+        """
+        data = {
             "schedule_id": self.schedule_id,
             "title": self.title,
-            "start_time": self.start_time,
-            "end_time": self.end_time,
+            "start_timestamp": self.start_timestamp,
+            "end_timestamp": self.end_timestamp,
             "description": self.description,
             "duration": self.duration,
             "category": self.category,
             "year": self.year,
             "episode": self.episode,
-            "images": self.images
+            "images": [image_url(image) for image in self.images] if image_url else self.images
         }
+        if formatter is not None:
+            data["start_time"] = formatter(self.start_timestamp)
+            data["end_time"] = formatter(self.end_timestamp)
+        return data
     
     @classmethod
     def from_dict(cls, data):
@@ -44,12 +62,12 @@ class Program:
         return cls(
             schedule_id=data.get("schedule_id"),
             title=data.get("title", ""),
-            start_time=data.get("start_time"),
-            end_time=data.get("end_time"),
+            start_timestamp=data.get("start_timestamp"),
+            end_timestamp=data.get("end_timestamp"),
             description=data.get("description"),
             duration=data.get("duration", 0),
             category=data.get("category"),
             year=data.get("year"),
             episode=data.get("episode"),
             images=data.get("images", [])
-        )
\ No newline at end of file
+        )
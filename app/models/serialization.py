@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk serialization of models
+
+All responses built from models go through these functions, so this is
+the single place for any faster serialization path.
+"""
+from app.timeutils import TimestampFormatter
+
+
+def to_dicts(items, **kwargs):
+    """
+    Serialize a list of models
+
+    Args:
+        items (iterable): Model instances
+        **kwargs: Arguments passed to each model's to_dict
+
+    Returns:
+        list: List of dictionaries
+    """
+    if kwargs:
+        return [item.to_dict(**kwargs) for item in items]
+    return [item.to_dict() for item in items]
+
+
+def epg_to_dict(epg_data, time_format=None, tz=None, image_url=None):
+    """
+    Serialize EPG data with formatted start and end times
+
+    Args:
+        epg_data (dict): Lists of Program models by channel ID
+        time_format (str, optional): strftime format or "iso"
+        tz (str, optional): Timezone name for the output
+        image_url (callable, optional): Rewrites program image URLs
+
+    Returns:
+        dict: Lists of program dictionaries by channel ID
+    """
+    # One formatter for the whole response so shared boundaries are
+    # converted only once
+    formatter = TimestampFormatter(time_format, tz)
+
+    return {
+        channel_id: [program.to_dict(formatter, image_url) for program in programs]
+        for channel_id, programs in epg_data.items()
+    }
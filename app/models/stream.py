@@ -3,17 +3,22 @@
 """
 Stream model
 """
+from dataclasses import dataclass, field
 
 
+@dataclass(slots=True)
 class Stream:
     """
     Represents a media stream
     """
-    def __init__(self, url, headers=None, content_type=None, is_live=True):
-        self.url = url
-        self.headers = headers or {}
-        self.content_type = content_type or "application/vnd.apple.mpegurl"
-        self.is_live = is_live
+    url: str
+    headers: dict = field(default_factory=dict)
+    content_type: str = None
+    is_live: bool = True
+
+    def __post_init__(self):
+        self.headers = self.headers or {}
+        self.content_type = self.content_type or "application/vnd.apple.mpegurl"
         
     def to_dict(self):
         """Convert to dictionary representation"""
@@ -32,4 +37,4 @@ class Stream:
             headers=data.get("headers", {}),
             content_type=data.get("content_type"),
             is_live=data.get("is_live", True)
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Runtime profiling for the MagentaTV backend
+
+Profiling is switched on from the admin endpoint for a time window or for
+the next N requests, so a running server can be profiled with its warm
+cache. Two modes are supported:
+
+- sampling: a background thread samples the stacks of request threads
+  and aggregates them into folded stacks (flamegraph.pl / speedscope input)
+- cprofile: requests are run under cProfile, one request at a time
+
+Hot-path timers are always on and only accumulate counts and durations.
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from flask import g
+
+logger = logging.getLogger(__name__)
+
+MODE_SAMPLING = "sampling"
+MODE_CPROFILE = "cprofile"
+MODES = (MODE_SAMPLING, MODE_CPROFILE)
+
+# Maximum stack depth recorded by the sampler
+MAX_STACK_DEPTH = 128
+
+# Hot-path timers: name -> [count, total seconds, max seconds]
+_timers = {}
+_timers_lock = threading.Lock()
+
+
+@contextmanager
+def hot_timer(name):
+    """
+    Measure a hot code path
+
+    Args:
+        name (str): Timer name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with _timers_lock:
+            timer = _timers.get(name)
+            if timer is None:
+                _timers[name] = [1, duration, duration]
+            else:
+                timer[0] += 1
+                timer[1] += duration
+                if duration > timer[2]:
+                    timer[2] = duration
+
+
+def get_timers(reset=False):
+    """
+    Get hot-path timer statistics
+
+    Args:
+        reset (bool): Reset the timers after reading
+
+    Returns:
+        dict: Count, total, average and maximum time in ms by timer name
+    """
+    with _timers_lock:
+        timers = {name: list(values) for name, values in _timers.items()}
+        if reset:
+            _timers.clear()
+
+    return {
+        name: {
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "avg_ms": round(total * 1000 / count, 3),
+            "max_ms": round(maximum * 1000, 3)
+        }
+        for name, (count, total, maximum) in timers.items()
+    }
+
+
+def _positive_number(name, value, integer=False):
+    """
+    Convert a session parameter to a positive number
+
+    Args:
+        name (str): Parameter name used in the error message
+        value (any): Posted value, numbers and numeric strings are accepted
+        integer (bool): Require a whole number
+
+    Returns:
+        int | float: Converted value
+
+    Raises:
+        ValueError: If the value is not a positive number
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"{name}: expected a number")
+    try:
+        number = int(value) if integer else float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}: expected a {'whole ' if integer else ''}number") from None
+    if integer and isinstance(value, float) and value != number:
+        raise ValueError(f"{name}: expected a whole number")
+    if number <= 0:
+        raise ValueError(f"{name}: must be positive")
+    return number
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """
+    Profiling session controlled from the admin endpoint
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.mode = None
+        self.started = None
+        self.finished = None
+        self.deadline = None
+        self.remaining_requests = None
+        self.all_threads = False
+        self.interval = 0.005
+        self.requests = 0
+        self.samples = 0
+
+        # Sampling state
+        self._stacks = {}
+        self._request_threads = set()
+        self._sampler = None
+        self._stop = threading.Event()
+
+        # cProfile state
+        self._profile = None
+        self._profile_lock = threading.Lock()
+
+    @property
+    def active(self):
+        return self.mode is not None and self.finished is None
+
+    def start(self, mode=MODE_SAMPLING, duration=None, requests=None, interval_ms=5, all_threads=False):
+        """
+        Start a profiling session
+
+        The session ends after duration seconds, after the given number of
+        requests, or when stopped, whichever comes first.
+
+        Args:
+            mode (str): "sampling" or "cprofile"
+            duration (float, optional): Session length in seconds
+            requests (int, optional): Number of requests to profile
+            interval_ms (float): Sampling interval in milliseconds
+            all_threads (bool): Sample all threads, not only request threads
+
+        Returns:
+            bool: True if the session was started, False if one is already running
+
+        Raises:
+            ValueError: If a parameter is missing or has the wrong type
+        """
+        if not isinstance(mode, str) or mode not in MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        if duration is None and requests is None:
+            raise ValueError("Either duration or requests must be set")
+        if duration is not None:
+            duration = _positive_number("duration", duration)
+        if requests is not None:
+            requests = _positive_number("requests", requests, integer=True)
+        interval_ms = _positive_number("interval_ms", interval_ms)
+        if not isinstance(all_threads, bool):
+            raise ValueError("all_threads: expected a boolean")
+
+        with self._lock:
+            if self.active:
+                return False
+
+            self.mode = mode
+            self.started = time.time()
+            self.finished = None
+            self.deadline = time.time() + duration if duration else None
+            self.remaining_requests = requests
+            self.all_threads = all_threads
+            self.interval = max(0.001, interval_ms / 1000)
+            self.requests = 0
+            self.samples = 0
+            self._stacks = {}
+            self._request_threads = set()
+            self._profile = cProfile.Profile() if mode == MODE_CPROFILE else None
+            self._stop.clear()
+
+        if mode == MODE_SAMPLING or self.deadline:
+            self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._sampler.start()
+
+        logger.info(f"Profiling started: mode={mode}, duration={duration}, requests={requests}")
+        return True
+
+    def stop(self):
+        """Stop the running session"""
+        with self._lock:
+            if not self.active:
+                return
+            self.finished = time.time()
+        self._stop.set()
+        logger.info("Profiling stopped")
+
+    def _run(self):
+        """Sampler thread, also enforces the session deadline"""
+        own_ident = threading.get_ident()
+        while not self._stop.is_set():
+            if self.deadline and time.time() >= self.deadline:
+                self.stop()
+                break
+
+            if self.mode == MODE_SAMPLING:
+                self._sample(own_ident)
+                self._stop.wait(self.interval)
+            else:
+                self._stop.wait(0.1)
+
+    def _sample(self, own_ident):
+        frames = sys._current_frames()
+        with self._lock:
+            idents = None if self.all_threads else set(self._request_threads)
+            for ident, frame in frames.items():
+                if ident == own_ident or (idents is not None and ident not in idents):
+                    continue
+
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def before_request(self):
+        """Flask before_request hook"""
+        if not self.active:
+            return
+
+        if self.mode == MODE_SAMPLING:
+            with self._lock:
+                self._request_threads.add(threading.get_ident())
+            g.profiling = True
+        elif self._profile_lock.acquire(blocking=False):
+            # cProfile can profile only one request at a time
+            g.profiling = True
+            self._profile.enable()
+
+    def teardown_request(self, exc=None):
+        """Flask teardown_request hook"""
+        if not g.pop("profiling", False):
+            return
+
+        if self.mode == MODE_SAMPLING:
+            with self._lock:
+                self._request_threads.discard(threading.get_ident())
+        else:
+            self._profile.disable()
+            self._profile_lock.release()
+
+        with self._lock:
+            self.requests += 1
+            finish = False
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+                finish = self.remaining_requests <= 0
+        if finish:
+            self.stop()
+
+    def status(self):
+        """
+        Get session status
+
+        Returns:
+            dict: Mode, state and counters of the last session
+        """
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "active": self.active,
+                "started": int(self.started) if self.started else None,
+                "finished": int(self.finished) if self.finished else None,
+                "deadline": int(self.deadline) if self.deadline else None,
+                "remaining_requests": self.remaining_requests,
+                "requests": self.requests,
+                "samples": self.samples
+            }
+
+    def folded(self):
+        """
+        Get the result as folded stacks ("frame;frame;frame count" lines)
+
+        In cprofile mode, caller;callee pairs weighted by microseconds of
+        own time are returned, as cProfile does not keep full stacks.
+
+        Returns:
+            str: Folded stacks
+        """
+        if self.mode == MODE_CPROFILE and self._profile is not None:
+            stats = pstats.Stats(self._profile)
+            lines = []
+            for (filename, _, name), (_, _, tottime, _, callers) in stats.stats.items():
+                callee = f"{os.path.basename(filename)}:{name}"
+                if not callers:
+                    lines.append(f"{callee} {int(tottime * 1e6)}")
+                for (caller_file, _, caller_name), caller_stats in callers.items():
+                    weight = int(caller_stats[2] * 1e6)
+                    if weight:
+                        lines.append(f"{os.path.basename(caller_file)}:{caller_name};{callee} {weight}")
+            return "\n".join(lines) + "\n"
+
+        with self._lock:
+            stacks = dict(self._stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+    def pstats_text(self, sort="cumulative", limit=50):
+        """
+        Get the cProfile result as text
+
+        Returns:
+            str: pstats output or an empty string outside cprofile mode
+        """
+        if self._profile is None:
+            return ""
+
+        output = io.StringIO()
+        pstats.Stats(self._profile, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+# Global profiler instance
+profiler = Profiler()
+
+
+def init_profiling(app):
+    """
+    Register profiling hooks
+
+    Args:
+        app (Flask): Application instance
+    """
+    app.before_request(profiler.before_request)
+    app.teardown_request(profiler.teardown_request)
+
+    logger.debug("Profiling initialized")
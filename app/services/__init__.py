@@ -13,21 +13,48 @@ import os
 logger = logging.getLogger(__name__)
 
 # Lazy load the MagentaTV service
-def get_magenta_tv_service():
+def get_magenta_tv_service(username=None, password=None, language=None, account=None):
     """
     Get an instance of the MagentaTV service
     
+    Args:
+        username (str, optional): Account username, defaults to USERNAME
+        password (str, optional): Account password, defaults to PASSWORD
+        language (str, optional): Language, defaults to LANGUAGE
+        account (str, optional): Account name, defaults to the USERNAME/PASSWORD account
+    
     Returns:
         MagentaTV: An instance of the MagentaTV service
     """
-    from app.services.magenta_tv import MagentaTV
+    from app.services.magenta_tv import MagentaTV, DEFAULT_ACCOUNT, token_file_path
+    
+    account = account or DEFAULT_ACCOUNT
+    language = language or current_app.config["LANGUAGE"]
+    
+    # Every client of an account uses the account's stored device identity
+    device_id = None
+    identity = current_app.extensions.get("device_identity")
+    if identity is not None:
+        device_id = identity.get(account, [token_file_path(current_app.config["DATA_DIR"], account, language)])
     
     try:
         return MagentaTV(
-            username=current_app.config["USERNAME"],
-            password=current_app.config["PASSWORD"],
-            language=current_app.config["LANGUAGE"],
-            quality=current_app.config["QUALITY"]
+            username=username or current_app.config["USERNAME"],
+            password=password or current_app.config["PASSWORD"],
+            language=language,
+            quality=current_app.config["QUALITY"],
+            redirect_mode=current_app.config["STREAM_REDIRECT_MODE"],
+            redirect_cache_timeout=current_app.config["STREAM_REDIRECT_CACHE_TIMEOUT"],
+            base_url=current_app.config["API_BASE_URL"] or None,
+            breaker_settings={
+                "failure_threshold": current_app.config["CIRCUIT_FAILURE_THRESHOLD"],
+                "reset_timeout": current_app.config["CIRCUIT_RESET_TIMEOUT"],
+                "min_timeout": current_app.config["UPSTREAM_MIN_TIMEOUT"]
+            },
+            rate_limit=current_app.config["UPSTREAM_RATE_LIMIT"],
+            rate_burst=current_app.config["UPSTREAM_BURST"],
+            account=account,
+            device_id=device_id
         )
     except Exception as e:
         logger.error(f"Failed to initialize MagentaTV service: {e}")
@@ -50,6 +77,7 @@ def create_app(config_file=None):
     from app.config import load_config
     app_config = load_config(config_file)
     app.config.update(app_config)
+    app.extensions["config_file"] = config_file
     
     # Ensure data directory exists
     os.makedirs(app.config["DATA_DIR"], exist_ok=True)
@@ -61,13 +89,82 @@ def create_app(config_file=None):
     )
     
     # Initialize cache
-    from app.cache import init_cache
+    from app.cache import init_cache, add_stale_headers
     with app.app_context():
         init_cache()
+    app.after_request(add_stale_headers)
+    
+    # Initialize metrics
+    from app.metrics import init_metrics
+    init_metrics(app)
+    
+    # Initialize tracing
+    from app.tracing import init_tracing
+    init_tracing(app)
+    
+    # Initialize profiling hooks
+    from app.profiling import init_profiling
+    init_profiling(app)
+    
+    # Initialize access log
+    from app.access_log import init_access_log
+    init_access_log(app)
+    
+    # Initialize the API client pool
+    from app.services.client_pool import ClientPool
+    pool = app.extensions["client_pool"] = ClientPool(app)
     
-    # Register blueprints
+    # Resolve device identities before any client logs in
+    from app.services.device_identity import DeviceIdentityStore
+    from app.services.magenta_tv import DEFAULT_ACCOUNT, token_file_path
+    identity = DeviceIdentityStore(app.config["DATA_DIR"], seed=app.config["DEVICE_ID"], default_account=DEFAULT_ACCOUNT)
+    app.extensions["device_identity"] = identity
+    accounts = pool.accounts()
+    if not identity.validate(
+        accounts,
+        lambda account: [token_file_path(app.config["DATA_DIR"], account, language) for language in accounts[account]["languages"]]
+    ):
+        logger.error("Device identity cannot be stored, every start will register a new device")
+    
+    # Initialize background prefetching
+    from app.services.prefetch import Prefetcher
+    app.extensions["prefetcher"] = Prefetcher(app, workers=app.config["PREFETCH_WORKERS"])
+    
+    from app.services.zap_predictor import ZapPredictor
+    app.extensions["zap_predictor"] = ZapPredictor()
+    
+    # Initialize the channel registry used to refuse unknown channel IDs
+    from app.services.channel_registry import ChannelRegistry
+    app.extensions["channel_registry"] = ChannelRegistry()
+    
+    # Initialize playback session tracking
+    from app.services.playback import PlaybackTracker
+    from app.metrics import PLAYBACK_SESSIONS
+    playback = PlaybackTracker(
+        session_timeout=app.config["PLAYBACK_SESSION_TIMEOUT"],
+        stream_limit=app.config["PLAYBACK_STREAM_LIMIT"]
+    )
+    app.extensions["playback"] = playback
+    PLAYBACK_SESSIONS.set_function(playback.gauge_values)
+    
+    # Initialize the image cache
+    from app.services.image_cache import ImageCache
+    app.extensions["image_cache"] = ImageCache(
+        os.path.join(app.config["DATA_DIR"], "images"),
+        max_age=app.config["IMAGE_CACHE_MAX_AGE"]
+    )
+    
+    # Register blueprints, the second registration selects the client by URL prefix
     from app.api import api_bp
     app.register_blueprint(api_bp)
+    app.register_blueprint(api_bp, url_prefix="/a/<account>/<language>/api", name="api_client")
+    
+    # Start background EPG synchronization (only once with the debug reloader)
+    if app.config["EPG_SYNC_ENABLED"] and (not app.config["DEBUG"] or os.environ.get("WERKZEUG_RUN_MAIN")):
+        from app.services.epg_sync import EPGSyncWorker
+        epg_sync = EPGSyncWorker.from_config(app)
+        app.extensions["epg_sync"] = epg_sync
+        epg_sync.start()
     
     logger.info(f"Application initialized with configuration: {app.config['LANGUAGE']}")
     return app
\ No newline at end of file
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory channel registry
+
+Channel IDs of each client key (account/language) in playlist order, read
+from the cached channel list. Routes check requested channel IDs against
+the registry before any upstream call, so malformed and unknown IDs from
+scanners or misconfigured clients are refused locally. The zap predictor
+uses the same order to find neighbouring channels.
+
+If the channel list cannot be loaded, IDs are not refused: the upstream
+API decides and its not_found answers are cached negatively.
+"""
+import threading
+import time
+
+from app.services.results import UpstreamError, ERROR_INVALID, ERROR_NOT_FOUND
+
+# Seconds before the channel list of a client key is read again
+ORDER_TTL = 60
+
+# Seconds before a failed or empty channel list is read again, so an
+# upstream outage does not cost a channel list request per checked ID
+FAILED_TTL = 10
+
+# Longest accepted channel ID
+MAX_CHANNEL_ID_LENGTH = 12
+
+
+def valid_channel_id(channel_id):
+    """Check that a channel ID has the numeric form the upstream API expects"""
+    channel_id = str(channel_id)
+    return 0 < len(channel_id) <= MAX_CHANNEL_ID_LENGTH and channel_id.isascii() and channel_id.isdigit()
+
+
+class ChannelRegistry:
+    """
+    Known channel IDs by client key
+    """
+    def __init__(self, ttl=ORDER_TTL, failed_ttl=FAILED_TTL):
+        """
+        Args:
+            ttl (int): Seconds before a channel list is read again
+            failed_ttl (int): Seconds before a failed channel list is read again
+        """
+        self.ttl = ttl
+        self.failed_ttl = failed_ttl
+        self._orders = {}
+        self._lock = threading.Lock()
+        self.stats = {"known": 0, "invalid": 0, "unknown": 0, "unverified": 0}
+
+    def order(self, key, load):
+        """
+        Channel IDs in playlist order with their positions
+
+        Args:
+            key (str): Client key (account/language), channel lists differ per client
+            load (callable): Returns the channel list, called at most every ttl
+                seconds, or every failed_ttl seconds while it fails
+
+        Returns:
+            tuple: (list of channel IDs, dict of position by channel ID)
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._orders.get(key)
+        if entry is not None and now < entry[0]:
+            return entry[1], entry[2]
+
+        # Loaded outside the lock, concurrent loads share the cached channel list
+        channels = load() or []
+        ids = [str(channel.id) for channel in channels]
+        positions = {channel_id: index for index, channel_id in enumerate(ids)}
+        with self._lock:
+            self._orders[key] = (now + (self.ttl if ids else self.failed_ttl), ids, positions)
+        return ids, positions
+
+    def check(self, key, channel_id, load):
+        """
+        Check a requested channel ID
+
+        Args:
+            key (str): Client key (account/language)
+            channel_id (str): Requested channel ID
+            load (callable): Returns the channel list
+
+        Returns:
+            UpstreamError: invalid or not_found error, None if the request may go upstream
+        """
+        if not valid_channel_id(channel_id):
+            result = "invalid"
+            error = UpstreamError(ERROR_INVALID, f"Invalid channel ID: {str(channel_id)[:32]}", "registry")
+        else:
+            _, positions = self.order(key, load)
+            if not positions:
+                result, error = "unverified", None
+            elif str(channel_id) in positions:
+                result, error = "known", None
+            else:
+                result = "unknown"
+                error = UpstreamError(ERROR_NOT_FOUND, f"Unknown channel: {channel_id}", "registry")
+
+        with self._lock:
+            self.stats[result] += 1
+        return error
+
+    def invalidate(self, key=None):
+        """
+        Drop channel lists so they are read again
+
+        Args:
+            key (str, optional): Client key, all if not given
+        """
+        with self._lock:
+            if key is None:
+                self._orders.clear()
+            else:
+                self._orders.pop(key, None)
+
+    def status(self):
+        """
+        Get registry state
+
+        Returns:
+            dict: Known channels by client key and check counters
+        """
+        with self._lock:
+            return {
+                "channels": {key: len(entry[1]) for key, entry in self._orders.items()},
+                **self.stats
+            }
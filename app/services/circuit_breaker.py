@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker for upstream API endpoints
+
+Each upstream endpoint gets its own breaker. After a number of consecutive
+failures the circuit opens and requests fail immediately instead of waiting
+out their timeout; after a cool-down a single probe request is let through
+to test whether the endpoint recovered. Request timeouts adapt to the
+observed latency of the endpoint.
+"""
+import threading
+import time
+
+import requests
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Smoothing factor of the latency averages
+EWMA_ALPHA = 0.2
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised instead of sending a request while the circuit is open
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker with an adaptive timeout for one endpoint
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, min_timeout=2, timeout_factor=4):
+        """
+        Args:
+            name (str): Endpoint name
+            failure_threshold (int): Consecutive failures that open the circuit
+            reset_timeout (float): Seconds before an open circuit lets a probe through
+            min_timeout (float): Lower bound of the adaptive timeout in seconds
+            timeout_factor (float): Number of latency deviations added to the average latency
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.timeout_factor = timeout_factor
+
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probe_in_flight = False
+        self.latency = None
+        self.deviation = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def configure(self, failure_threshold=None, reset_timeout=None, min_timeout=None, timeout_factor=None):
+        """Change the breaker settings, the current state is kept"""
+        with self._lock:
+            if failure_threshold is not None:
+                self.failure_threshold = failure_threshold
+            if reset_timeout is not None:
+                self.reset_timeout = reset_timeout
+            if min_timeout is not None:
+                self.min_timeout = min_timeout
+            if timeout_factor is not None:
+                self.timeout_factor = timeout_factor
+
+    def allow(self):
+        """
+        Check whether a request may be sent
+
+        Returns:
+            bool: True if the request may go upstream
+        """
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+
+            if self.state == STATE_OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = STATE_HALF_OPEN
+                self.probe_in_flight = False
+
+            if self.state == STATE_HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def timeout(self, default):
+        """
+        Timeout for the next request
+
+        Args:
+            default (float): Configured timeout, used as the upper bound
+
+        Returns:
+            float: Adaptive timeout in seconds
+        """
+        with self._lock:
+            if self.latency is None or self.state != STATE_CLOSED:
+                return default
+            adaptive = self.latency + self.timeout_factor * self.deviation
+        return min(default, max(self.min_timeout, adaptive))
+
+    def record_success(self, duration):
+        """Record a successful request and its duration in seconds"""
+        with self._lock:
+            if self.latency is None:
+                self.latency = duration
+            else:
+                self.deviation += EWMA_ALPHA * (abs(duration - self.latency) - self.deviation)
+                self.latency += EWMA_ALPHA * (duration - self.latency)
+            self.failures = 0
+            self.state = STATE_CLOSED
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        """Record a failed request (transport error, timeout or server error)"""
+        with self._lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = STATE_OPEN
+                self.opened_at = time.time()
+
+    def status(self):
+        """
+        Get breaker state
+
+        Returns:
+            dict: State, failure count and latency statistics
+        """
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "deviation_ms": round(self.deviation * 1000, 1)
+            }
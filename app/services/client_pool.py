@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool of MagentaTV clients
+
+One process can serve several subscriptions and both languages. Clients
+are keyed by (account, language) and created and logged in on first use;
+each has its own token file, HTTP session and cache keys. The account
+from USERNAME/PASSWORD is named "default", further accounts come from the
+ACCOUNTS setting:
+
+    "accounts": [
+        {"name": "family", "username": "...", "password": "...", "languages": ["cz", "sk"]}
+    ]
+
+Clients are created under a per-key lock, so concurrent first requests
+share a single login. Failed logins are retried with exponential backoff
+instead of being remembered forever. Reconfiguration swaps the clients
+atomically; requests already holding the old client finish with it and
+retired clients are closed after a grace period.
+"""
+import itertools
+import threading
+import time
+import logging
+
+from app.services.magenta_tv import DEFAULT_ACCOUNT, DEFAULT_BASE_URL
+from app.services.results import is_error, ERROR_AUTH_EXPIRED
+
+logger = logging.getLogger(__name__)
+
+# Login attempts when a client is created
+LOGIN_ATTEMPTS = 3
+
+# Delay before the second login attempt, doubled for each further attempt
+LOGIN_RETRY_DELAY = 0.5
+
+# After a failed creation, the client is not retried for this many seconds,
+# doubled for each consecutive failure up to MAX_BACKOFF
+MIN_BACKOFF = 5
+MAX_BACKOFF = 300
+
+# Seconds before a replaced client is closed
+RETIRE_GRACE = 120
+
+
+class ClientPool:
+    """
+    MagentaTV clients keyed by (account, language)
+    """
+    def __init__(self, app):
+        """
+        Args:
+            app (Flask): Application, its config holds the accounts
+        """
+        self.app = app
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._failures = {}
+        self._generation = 0
+        self._turn = itertools.count()
+
+    def accounts(self):
+        """
+        Configured accounts
+
+        Returns:
+            dict: Account settings (username, password, languages) by account name
+        """
+        config = self.app.config
+        accounts = {}
+        if config.get("USERNAME") and config.get("PASSWORD"):
+            accounts[DEFAULT_ACCOUNT] = {
+                "username": config["USERNAME"],
+                "password": config["PASSWORD"],
+                "languages": [config["LANGUAGE"].lower()]
+            }
+
+        for account in config.get("ACCOUNTS") or []:
+            name = account.get("name")
+            if not name or not account.get("username") or not account.get("password"):
+                logger.warning(f"Skipping incomplete account configuration: {name}")
+                continue
+            languages = account.get("languages") or [account.get("language") or config["LANGUAGE"]]
+            accounts[name] = {
+                "username": account["username"],
+                "password": account["password"],
+                "languages": [language.lower() for language in languages]
+            }
+        return accounts
+
+    def accounts_for(self, language):
+        """
+        Names of the accounts serving a language, in configuration order
+
+        Args:
+            language (str): Language code
+
+        Returns:
+            list: Account names
+        """
+        return [name for name, account in self.accounts().items() if language in account["languages"]]
+
+    def _resolve_key(self, account, language):
+        language = (language or self.app.config["LANGUAGE"]).lower()
+        if account is None:
+            names = self.accounts_for(language)
+            account = names[0] if names else None
+        return account, language
+
+    def get(self, account=None, language=None):
+        """
+        Get a logged-in client
+
+        Args:
+            account (str, optional): Account name, defaults to the first account serving the language
+            language (str, optional): Language, defaults to LANGUAGE
+
+        Returns:
+            MagentaTV: Client or None if the account is unknown or the login failed
+        """
+        account, language = self._resolve_key(account, language)
+        if account is None:
+            logger.error(f"No account configured for language {language}")
+            return None
+
+        key = (account, language)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        with self._key_lock(key):
+            # Another request may have created the client while this one waited
+            generation = self._generation
+            client = self._clients.get(key)
+            if client is not None:
+                return client
+
+            failure = self._failures.get(key)
+            if failure is not None and time.time() < failure["retry_at"]:
+                logger.debug(f"Client {account}/{language} is backing off after {failure['count']} failures")
+                return None
+
+            client = self._create(account, language)
+            with self._lock:
+                if client is None:
+                    count = failure["count"] + 1 if failure else 1
+                    self._failures[key] = {
+                        "count": count,
+                        "retry_at": time.time() + min(MAX_BACKOFF, MIN_BACKOFF * 2 ** (count - 1))
+                    }
+                    return None
+
+                self._failures.pop(key, None)
+                if self._generation == generation:
+                    self._clients = {**self._clients, key: client}
+                    return client
+
+        # The pool was reset during the login - the client was created with
+        # the previous configuration, it serves only this request
+        self._retire([client])
+        return client
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+        return lock
+
+    def _create(self, account, language):
+        """Create and log in a client, retrying the login with backoff"""
+        from app.services import get_magenta_tv_service
+
+        settings = self.accounts().get(account)
+        if settings is None or language not in settings["languages"]:
+            logger.error(f"Account {account} is not configured for language {language}")
+            return None
+
+        with self.app.app_context():
+            client = get_magenta_tv_service(settings["username"], settings["password"], language, account)
+            if client is None:
+                logger.error(f"Failed to create MagentaTV client {account}/{language}")
+                return None
+
+            for attempt in range(LOGIN_ATTEMPTS):
+                if attempt:
+                    time.sleep(LOGIN_RETRY_DELAY * 2 ** (attempt - 1))
+                if client.login():
+                    break
+                logger.warning(f"Login of client {account}/{language} failed (attempt {attempt + 1})")
+            else:
+                logger.error(f"Failed to login client {account}/{language}")
+                client.close()
+                return None
+
+        logger.info(f"MagentaTV client {account}/{language} ready")
+        return client
+
+    def call(self, method, *args, account=None, language=None):
+        """
+        Call a client method, spreading calls across accounts
+
+        Without an account, calls rotate over all accounts serving the
+        language; if a client fails with a transient error, the next one is
+        tried. Missing objects and invalid requests fail the same way on
+        every account and are returned at once. A call refused for an
+        expired token is repeated once, the client logs in again first.
+
+        Args:
+            method (str): Name of the MagentaTV method
+            *args: Method arguments
+            account (str, optional): Use only this account
+            language (str, optional): Language, defaults to LANGUAGE
+
+        Returns:
+            any: Result of the first successful call, the last UpstreamError,
+                or None if no client is available
+        """
+        if account is not None:
+            client = self.get(account, language)
+            return self._call(client, method, args) if client is not None else None
+
+        language = (language or self.app.config["LANGUAGE"]).lower()
+        names = self.accounts_for(language)
+
+        result = None
+        start = next(self._turn)
+        for index in range(len(names)):
+            client = self.get(names[(start + index) % len(names)], language)
+            if client is None:
+                continue
+            result = self._call(client, method, args)
+            if result is not None and not (is_error(result) and result.transient):
+                return result
+        return result
+
+    @staticmethod
+    def _call(client, method, args):
+        """Call a client method, once more if the token was refused"""
+        result = getattr(client, method)(*args)
+        if is_error(result) and result.kind == ERROR_AUTH_EXPIRED:
+            result = getattr(client, method)(*args)
+        return result
+
+    def clients(self):
+        """
+        Created clients
+
+        Returns:
+            list: MagentaTV clients
+        """
+        return list(self._clients.values())
+
+    def reset(self):
+        """
+        Replace all clients, they are recreated with the current configuration on next use
+        
+        Requests that already hold a client keep using it; replaced clients
+        are closed after RETIRE_GRACE seconds.
+        """
+        with self._lock:
+            retired = list(self._clients.values())
+            self._clients = {}
+            self._generation += 1
+            self._failures = {}
+        self._retire(retired)
+
+    def reconfigure(self):
+        """
+        Replace the clients whose account settings changed
+        
+        Clients whose credentials, languages or API address changed are
+        retired like in reset(), the others are kept with their tokens.
+        
+        Returns:
+            list: Keys of the replaced clients
+        """
+        accounts = self.accounts()
+        base_url = self.app.config["API_BASE_URL"] or DEFAULT_BASE_URL
+        
+        with self._lock:
+            kept = {}
+            retired = []
+            for key, client in self._clients.items():
+                account, language = key
+                settings = accounts.get(account)
+                if (settings is None or language not in settings["languages"]
+                        or client.username != settings["username"]
+                        or client.password != settings["password"]
+                        or client.base_url != base_url.format(language=language).rstrip("/")):
+                    retired.append(client)
+                else:
+                    kept[key] = client
+            if retired:
+                self._clients = kept
+                self._failures = {}
+                self._generation += 1
+        
+        self._retire(retired)
+        return [client.key for client in retired]
+
+    def _retire(self, clients):
+        """Close replaced clients after the grace period"""
+        if not clients:
+            return
+
+        def close():
+            for client in clients:
+                client.close()
+
+        timer = threading.Timer(RETIRE_GRACE, close)
+        timer.daemon = True
+        timer.start()
+        logger.info(f"Retired {len(clients)} MagentaTV clients")
+
+    def status(self):
+        """
+        Get pool state
+
+        Returns:
+            dict: Languages by configured account and created clients
+        """
+        now = time.time()
+        return {
+            "accounts": {name: account["languages"] for name, account in self.accounts().items()},
+            "clients": sorted(client.key for client in self.clients()),
+            "backoff": {
+                f"{account}/{language}": {"failures": failure["count"], "retry_in": max(0, int(failure["retry_at"] - now))}
+                for (account, language), failure in list(self._failures.items())
+            }
+        }
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stable device identity
+
+The upstream service registers a device for every new device ID and a new
+ID always means a full login. The device ID of each account is therefore
+kept in DATA_DIR/device_identity.json, shared by all worker processes and
+containers mounting the same DATA_DIR, and reused by every client and
+login of the account (in all languages).
+
+The ID of an account is taken from, in this order:
+- DEVICE_ID for the default account, if configured
+- the identity file
+- an existing token file of the account (migration from older versions)
+- a new random ID, stored for the next start
+"""
+import json
+import os
+import uuid
+import logging
+
+from app.fileutils import atomic_write_json, file_lock
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_FILE = "device_identity.json"
+
+# Longest accepted device ID
+MAX_DEVICE_ID_LENGTH = 64
+
+
+def valid_device_id(device_id):
+    """Check that a device ID can be sent upstream"""
+    return (
+        isinstance(device_id, str)
+        and 0 < len(device_id) <= MAX_DEVICE_ID_LENGTH
+        and all(char.isalnum() or char in "-_" for char in device_id)
+    )
+
+
+class DeviceIdentityStore:
+    """
+    Device IDs by account, persisted in DATA_DIR
+    """
+    def __init__(self, data_dir, seed=None, default_account="default"):
+        """
+        Args:
+            data_dir (str): Data folder
+            seed (str, optional): Configured device ID of the default account (DEVICE_ID)
+            default_account (str): Name of the account the seed belongs to
+        """
+        self.path = os.path.join(data_dir, IDENTITY_FILE)
+        self.default_account = default_account
+        self.seed = seed or None
+        if self.seed is not None and not valid_device_id(self.seed):
+            logger.error(f"Ignoring invalid DEVICE_ID {self.seed!r}")
+            self.seed = None
+        self._ids = {}
+
+    def _read(self):
+        """Device IDs from the identity file, invalid entries are skipped"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Unreadable device identity file {self.path}: {e}")
+            return {}
+
+        devices = data.get("devices") if isinstance(data, dict) else None
+        if not isinstance(devices, dict):
+            logger.error(f"Invalid device identity file {self.path}")
+            return {}
+        return {account: device_id for account, device_id in devices.items() if valid_device_id(device_id)}
+
+    def get(self, account, token_files=()):
+        """
+        Device ID of an account, created and stored if it has none
+
+        Args:
+            account (str): Account name
+            token_files (iterable): Token files of the account to migrate the ID from
+
+        Returns:
+            str: Device ID
+        """
+        device_id = self._ids.get(account)
+        if device_id is not None:
+            return device_id
+
+        # Other processes may be creating the same identity, the file decides
+        with file_lock(self.path):
+            devices = self._read()
+            device_id = devices.get(account)
+            source = "identity file"
+
+            if account == self.default_account and self.seed is not None and device_id != self.seed:
+                device_id, source = self.seed, "DEVICE_ID"
+            if device_id is None:
+                device_id = _device_id_from_tokens(token_files)
+                source = "token file"
+            if device_id is None:
+                device_id, source = str(uuid.uuid4()), "new"
+
+            if devices.get(account) != device_id:
+                devices[account] = device_id
+                try:
+                    atomic_write_json(self.path, {"devices": devices})
+                except OSError as e:
+                    logger.error(f"Failed to save device identity: {e}")
+
+        logger.info(f"Device identity of account {account}: {device_id} ({source})")
+        self._ids[account] = device_id
+        return device_id
+
+    def validate(self, accounts, token_files=None):
+        """
+        Check the identity file at startup and resolve the identities of all accounts
+
+        Resolving all identities up front makes concurrently starting
+        workers agree on them before any of them logs in.
+
+        Args:
+            accounts (iterable): Account names
+            token_files (callable, optional): Returns the token files of an account
+
+        Returns:
+            bool: True if the identity file is usable
+        """
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    json.load(f)
+            except (OSError, ValueError) as e:
+                # Keep the damaged file for inspection, identities are migrated again
+                broken = self.path + ".broken"
+                logger.error(f"Device identity file is damaged ({e}), moving it to {broken}")
+                try:
+                    os.replace(self.path, broken)
+                except OSError:
+                    return False
+
+        for account in accounts:
+            self.get(account, token_files(account) if token_files else ())
+        return os.access(os.path.dirname(self.path) or ".", os.W_OK)
+
+    def status(self):
+        """
+        Get the identities in use
+
+        Returns:
+            dict: Device ID by account
+        """
+        return dict(self._ids)
+
+
+def _device_id_from_tokens(token_files):
+    """Device ID from the first readable token file"""
+    for path in token_files:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                device_id = json.load(f).get("device_id")
+        except (OSError, ValueError, AttributeError):
+            continue
+        if valid_device_id(device_id):
+            return device_id
+    return None
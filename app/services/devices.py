@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bulk pruning of registered devices
+
+Every redeployed container registers a new device, so the account's
+device limit fills up. Pruning selects devices by filters and deletes
+them concurrently with bounded parallelism. The device of the running
+client is never selected.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def select_devices(devices, types=None, name=None, ids=None, keep=None, limit=None):
+    """
+    Select devices to prune
+
+    Args:
+        devices (list): Device models
+        types (list, optional): Device types to select (mobile, stb)
+        name (str, optional): Case-insensitive substring of the device name
+        ids (list, optional): Only these device IDs
+        keep (list, optional): Device IDs that are never selected
+        limit (int, optional): Maximum number of selected devices
+
+    Returns:
+        list: Selected devices, in registry order
+    """
+    keep = {str(device_id) for device_id in keep or ()}
+    ids = {str(device_id) for device_id in ids} if ids else None
+    name = name.lower() if name else None
+
+    selected = []
+    for device in devices:
+        if device.is_this_device or str(device.id) in keep:
+            continue
+        if types and device.type not in types:
+            continue
+        if name and name not in (device.name or "").lower():
+            continue
+        if ids is not None and str(device.id) not in ids:
+            continue
+        selected.append(device)
+    return selected[:limit] if limit else selected
+
+
+def prune_devices(delete, devices, workers=4):
+    """
+    Delete devices concurrently
+
+    Args:
+        delete (callable): Deletes one device ID, returns True on success
+        devices (list): Devices to delete
+        workers (int): Maximum number of concurrent deletions
+
+    Returns:
+        tuple: (deleted device IDs, failed device IDs)
+    """
+    if not devices:
+        return [], []
+
+    def run(device):
+        try:
+            return delete(device.id)
+        except Exception as e:
+            logger.error(f"Error deleting device {device.id}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(devices)))) as executor:
+        results = list(executor.map(run, devices))
+
+    deleted = [device.id for device, success in zip(devices, results) if success]
+    failed = [device.id for device, success in zip(devices, results) if not success]
+    logger.info(f"Pruned {len(deleted)} devices, {len(failed)} failed")
+    return deleted, failed
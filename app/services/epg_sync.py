@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background EPG synchronization
+
+Keeps a rolling window of EPG days (archive days back and days forward)
+for every channel in memory, so EPG requests are answered without waiting
+on the upstream API. Channels are fetched in shards on a bounded pool and
+the work of one sync cycle is spread over the sync interval with jitter.
+"""
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.magenta_tv import DAY_SECONDS
+from app.services.rate_limiter import request_priority, PRIORITY_BACKGROUND
+from app.services.results import is_error, ERROR_NOT_FOUND
+
+logger = logging.getLogger(__name__)
+
+# Days older than yesterday are not expected to change any more,
+# so they are fetched only once
+VOLATILE_DAYS_BACK = 1
+
+# Extra time fetched after the end of a day, so programs running over
+# midnight are returned by the upstream filter
+DAY_OVERLAP = 6 * 3600
+
+
+class EPGSyncWorker:
+    """
+    Scheduled rolling-window EPG synchronization
+    """
+    def __init__(self, app, days_back=7, days_forward=3, interval=900,
+                 shard_size=20, workers=2, jitter=0.5):
+        """
+        Args:
+            app (Flask): Application, used for the app context in worker threads
+            days_back (int): Number of archive days to keep
+            days_forward (int): Number of days ahead to keep
+            interval (int): Seconds between sync cycles
+            shard_size (int): Number of channels per upstream request
+            workers (int): Maximum number of concurrent upstream requests
+            jitter (float): Random delay added to each task, as a fraction of its time slot
+        """
+        self.app = app
+        self.days_back = days_back
+        self.days_forward = days_forward
+        self.interval = interval
+        self.shard_size = max(1, shard_size)
+        self.workers = max(1, workers)
+        self.jitter = jitter
+
+        # channel_id -> {day_start: [Program]}
+        self._store = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.stats = {
+            "cycles": 0,
+            "last_cycle_start": None,
+            "last_cycle_duration": None,
+            "fetches": 0,
+            "errors": 0,
+            "days_changed": 0,
+            "days_unchanged": 0
+        }
+
+    @classmethod
+    def from_config(cls, app):
+        """Create a worker from the application configuration"""
+        config = app.config
+        return cls(
+            app,
+            days_back=config["EPG_SYNC_DAYS_BACK"],
+            days_forward=config["EPG_SYNC_DAYS_FORWARD"],
+            interval=config["EPG_SYNC_INTERVAL"],
+            shard_size=config["EPG_SYNC_SHARD_SIZE"],
+            workers=config["EPG_SYNC_WORKERS"],
+            jitter=config["EPG_SYNC_JITTER"]
+        )
+
+    def configure(self, config):
+        """
+        Apply changed settings, used from the next sync cycle on
+
+        Args:
+            config (dict): Application configuration
+        """
+        self.days_back = config["EPG_SYNC_DAYS_BACK"]
+        self.days_forward = config["EPG_SYNC_DAYS_FORWARD"]
+        self.interval = config["EPG_SYNC_INTERVAL"]
+        self.shard_size = max(1, config["EPG_SYNC_SHARD_SIZE"])
+        self.workers = max(1, config["EPG_SYNC_WORKERS"])
+        self.jitter = config["EPG_SYNC_JITTER"]
+
+    def start(self):
+        """Start the background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="epg-sync", daemon=True)
+        self._thread.start()
+        logger.info("EPG sync worker started")
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        logger.info("EPG sync worker stopped")
+
+    def _run(self):
+        with request_priority(PRIORITY_BACKGROUND):
+            self._loop()
+
+    def _loop(self):
+        first = True
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                # The first cycle fills the cache as fast as the pool allows,
+                # later cycles are spread over the interval
+                self.run_cycle(spread=not first)
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"EPG sync cycle failed: {e}")
+            first = False
+            self._stop.wait(max(0, self.interval - (time.time() - started)))
+
+    def _window(self):
+        """Day starts (UTC) of the rolling window"""
+        today = int(time.time()) // DAY_SECONDS * DAY_SECONDS
+        return [today + offset * DAY_SECONDS for offset in range(-self.days_back, self.days_forward + 1)]
+
+    def run_cycle(self, spread=True):
+        """
+        Run one synchronization cycle
+
+        Args:
+            spread (bool): Spread upstream requests over the sync interval
+        """
+        from app.api.helpers import get_api
+
+        started = time.time()
+        self.stats["last_cycle_start"] = int(started)
+
+        with self.app.app_context():
+            api = get_api()
+            if api is None:
+                logger.warning("EPG sync skipped, API is not initialized")
+                return
+            channels = api.get_channels()
+
+        if not channels:
+            logger.warning("EPG sync skipped, channel list is empty")
+            return
+
+        days = self._window()
+        channel_ids = [channel.id for channel in channels]
+        self._prune(set(channel_ids), days[0])
+
+        # Only missing days and days that can still change are fetched
+        volatile_from = days[self.days_back - VOLATILE_DAYS_BACK] if self.days_back >= VOLATILE_DAYS_BACK else days[0]
+        shards = [channel_ids[i:i + self.shard_size] for i in range(0, len(channel_ids), self.shard_size)]
+        tasks = [
+            (shard, day)
+            for day in days
+            for shard in shards
+            if day >= volatile_from or not self._has_day(shard, day)
+        ]
+        if not tasks:
+            return
+
+        # Today's EPG of the channels being watched first
+        playback = self.app.extensions.get("playback")
+        hot = set(playback.hot_channels()) if playback is not None else set()
+        if hot:
+            today = days[self.days_back]
+            tasks.sort(key=lambda task: not (task[1] == today and hot.intersection(map(str, task[0]))))
+
+        slot = self.interval * 0.8 / len(tasks) if spread else 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="epg-sync") as executor:
+            for index, (shard, day) in enumerate(tasks):
+                if slot:
+                    delay = started + index * slot + random.uniform(0, slot * self.jitter) - time.time()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                elif self._stop.is_set():
+                    break
+                executor.submit(self._sync_shard_day, api, shard, day)
+
+        self.stats["cycles"] += 1
+        self.stats["last_cycle_duration"] = round(time.time() - started, 3)
+        logger.info(f"EPG sync cycle finished: {len(tasks)} tasks in {self.stats['last_cycle_duration']} s")
+
+    def _sync_shard_day(self, api, shard, day):
+        """Fetch one day for a shard of channels and apply the differences"""
+        try:
+            with self.app.app_context(), request_priority(PRIORITY_BACKGROUND):
+                epg_data = api.get_epg(shard, start_timestamp=day, end_timestamp=day + DAY_SECONDS + DAY_OVERLAP)
+        except Exception as e:
+            epg_data = None
+            logger.error(f"EPG sync fetch failed: {e}")
+
+        # A day without programs is a valid result, other errors are retried next cycle
+        if is_error(epg_data) and epg_data.kind == ERROR_NOT_FOUND:
+            epg_data = {}
+
+        day_end = day + DAY_SECONDS
+        with self._lock:
+            self.stats["fetches"] += 1
+            if epg_data is None or is_error(epg_data):
+                self.stats["errors"] += 1
+                return
+
+            for channel_id in shard:
+                # Programs belong to the day they start in
+                programs = [
+                    program for program in epg_data.get(channel_id, ())
+                    if day <= program.start_timestamp < day_end
+                ]
+                days = self._store.setdefault(channel_id, {})
+                if days.get(day) == programs:
+                    self.stats["days_unchanged"] += 1
+                else:
+                    days[day] = programs
+                    self.stats["days_changed"] += 1
+
+    def _has_day(self, shard, day):
+        with self._lock:
+            return all(day in self._store.get(channel_id, ()) for channel_id in shard)
+
+    def _prune(self, channel_ids, first_day):
+        """Drop removed channels and days that left the window"""
+        with self._lock:
+            for channel_id in list(self._store):
+                if channel_id not in channel_ids:
+                    del self._store[channel_id]
+                    continue
+                days = self._store[channel_id]
+                for day in [day for day in days if day < first_day]:
+                    del days[day]
+
+    def get_epg(self, channel_id, days_back=1, days_forward=1):
+        """
+        Get EPG from the synchronized window
+
+        Args:
+            channel_id (int|str): Channel ID
+            days_back (int): Number of days back
+            days_forward (int): Number of days forward
+
+        Returns:
+            dict: Programs by channel ID in the same form as MagentaTV.get_epg,
+                  or None if the requested range is not synchronized
+        """
+        try:
+            channel_id = int(channel_id)
+        except (TypeError, ValueError):
+            return None
+
+        if days_back > self.days_back or days_forward > self.days_forward:
+            return None
+
+        today = int(time.time()) // DAY_SECONDS * DAY_SECONDS
+        programs = []
+        with self._lock:
+            days = self._store.get(channel_id)
+            if days is None:
+                return None
+            for offset in range(-days_back, days_forward + 1):
+                day_programs = days.get(today + offset * DAY_SECONDS)
+                if day_programs is None:
+                    return None
+                programs.extend(day_programs)
+
+        return {channel_id: programs}
+
+    def status(self):
+        """
+        Get synchronization status
+
+        Returns:
+            dict: Worker configuration, counters and store size
+        """
+        with self._lock:
+            channels = len(self._store)
+            days = sum(len(days) for days in self._store.values())
+
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "days_back": self.days_back,
+            "days_forward": self.days_forward,
+            "interval": self.interval,
+            "channels": channels,
+            "channel_days": days,
+            **self.stats
+        }
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local cache of channel logos and EPG images
+
+Playlists and EPG responses can point clients at /api/image/<hash>
+instead of the upstream CDN, so each image is downloaded once for the
+whole network. Images are stored under DATA_DIR/images; resized and
+re-encoded variants are created on request (width, height, format) when
+Pillow is installed, otherwise the original image is served.
+
+Only images whose URL was registered by a playlist or EPG rewrite are
+fetched, so the endpoint cannot be used as an open proxy. The registered
+URL is stored next to the image (<hash>.url), so every worker sharing
+DATA_DIR can serve it, also after a restart. Downloads that are not
+images are refused.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+import requests
+
+from app.fileutils import atomic_write
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Largest width or height of a resized image
+MAX_DIMENSION = 1920
+
+# Output formats of resized images: (Pillow format, mimetype)
+FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp")
+}
+
+# Mimetypes recognized from the first bytes of the original image
+_SIGNATURES = (
+    (b"\x89PNG", "image/png"),
+    (b"\xff\xd8", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"RIFF", "image/webp")
+)
+
+FETCH_TIMEOUT = 10
+
+# Largest accepted original image in bytes
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+
+# Registered URLs kept in memory, older ones are read from disk again
+MAX_REMEMBERED_URLS = 10000
+
+# Locks shared by image hashes, downloads of different images rarely wait for each other
+LOCK_STRIPES = 64
+
+_HASH = re.compile(r"^[0-9a-f]{20}$")
+
+
+def image_hash(url):
+    """
+    Identifier of an image URL
+
+    Args:
+        url (str): Upstream image URL
+
+    Returns:
+        str: Hex digest used in /api/image/<hash>
+    """
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:20]
+
+
+def sniff_mimetype(data):
+    """Mimetype of image data, application/octet-stream if unknown"""
+    for signature, mimetype in _SIGNATURES:
+        if data.startswith(signature):
+            return mimetype
+    return "application/octet-stream"
+
+
+class ImageCache:
+    """
+    Disk cache of upstream images with resized variants
+    """
+    def __init__(self, directory, max_age=604800):
+        """
+        Args:
+            directory (str): Folder for the cached images
+            max_age (int): Seconds before an original image is downloaded again
+        """
+        self.directory = directory
+        self.max_age = max_age
+        self.session = requests.Session()
+        self._urls = OrderedDict()
+        self._lock = threading.Lock()
+        self._hash_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def register(self, url):
+        """
+        Allow an image URL to be served and get its identifier
+
+        Args:
+            url (str): Upstream image URL
+
+        Returns:
+            str: Image hash
+        """
+        digest = image_hash(url)
+        with self._lock:
+            if digest in self._urls:
+                self._urls.move_to_end(digest)
+                return digest
+            self._remember(digest, url)
+
+        url_path = self._path(digest, ".url")
+        if not os.path.exists(url_path):
+            try:
+                atomic_write(url_path, url)
+            except OSError as e:
+                logger.warning(f"Failed to store image URL {url}: {e}")
+        return digest
+
+    def _remember(self, digest, url):
+        """Keep a registered URL in memory (self._lock must be held)"""
+        self._urls[digest] = url
+        if len(self._urls) > MAX_REMEMBERED_URLS:
+            self._urls.popitem(last=False)
+
+    def _url(self, digest):
+        """Registered URL of an image hash, from memory or from disk"""
+        with self._lock:
+            url = self._urls.get(digest)
+        if url is not None:
+            return url
+        try:
+            with open(self._path(digest, ".url"), "r", encoding="utf-8") as f:
+                url = f.read().strip()
+        except OSError:
+            return None
+        # The file name is the hash of its content, a mismatch means a damaged file
+        if not url.startswith("http") or image_hash(url) != digest:
+            return None
+        with self._lock:
+            self._remember(digest, url)
+        return url
+
+    def rewriter(self, server_url, width=None, height=None):
+        """
+        Build a function rewriting upstream image URLs to local ones
+
+        Args:
+            server_url (str): Server URL used in the rewritten links
+            width (int, optional): Width requested in the rewritten links
+            height (int, optional): Height requested in the rewritten links
+
+        Returns:
+            callable: Function mapping an upstream URL to a local URL
+        """
+        query = "&".join(
+            f"{name}={value}" for name, value in (("w", width), ("h", height)) if value
+        )
+        suffix = f"?{query}" if query else ""
+
+        def rewrite(url):
+            if not url or not isinstance(url, str) or not url.startswith("http"):
+                return url
+            return f"{server_url}/api/image/{self.register(url)}{suffix}"
+
+        return rewrite
+
+    def _path(self, digest, variant=""):
+        return os.path.join(self.directory, digest[:2], digest + variant)
+
+    def _hash_lock(self, digest):
+        return self._hash_locks[int(digest[:4], 16) % LOCK_STRIPES]
+
+    def get(self, digest, width=None, height=None, output_format=None):
+        """
+        Get a cached image, downloading or resizing it if needed
+
+        Args:
+            digest (str): Image hash
+            width (int, optional): Maximum width
+            height (int, optional): Maximum height
+            output_format (str, optional): Output format (jpeg, png, webp)
+
+        Returns:
+            tuple: (path, mimetype) or None if the image is unknown or unavailable
+        """
+        if not _HASH.match(digest):
+            return None
+
+        original = self._original(digest)
+        if original is None:
+            return None
+
+        path, mimetype = original
+        if Image is None or not (width or height or output_format):
+            return path, mimetype
+
+        width = min(width, MAX_DIMENSION) if width else None
+        height = min(height, MAX_DIMENSION) if height else None
+        output_format = output_format or ("png" if mimetype in ("image/png", "image/gif") else "jpeg")
+        pil_format, variant_mimetype = FORMATS[output_format]
+
+        variant = self._path(digest, f"_{width or 0}x{height or 0}.{output_format}")
+        if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+            return variant, variant_mimetype
+
+        with self._hash_lock(digest):
+            if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(path):
+                return variant, variant_mimetype
+            try:
+                with Image.open(path) as image:
+                    image.thumbnail((width or MAX_DIMENSION, height or MAX_DIMENSION))
+                    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+                        image = image.convert("RGB")
+                    buffer = io.BytesIO()
+                    image.save(buffer, pil_format)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to resize image {digest}: {e}")
+                return path, mimetype
+            atomic_write(variant, buffer.getvalue())
+        return variant, variant_mimetype
+
+    def _original(self, digest):
+        """Path and mimetype of the original image, downloaded if missing or old"""
+        path = self._path(digest)
+        if self._fresh(path):
+            return path, self._mimetype(path)
+
+        url = self._url(digest)
+        if url is None:
+            # Unknown URL - serve what is on disk, even if old
+            return (path, self._mimetype(path)) if os.path.exists(path) else None
+
+        with self._hash_lock(digest):
+            # Another request may have downloaded the image while this one waited
+            if self._fresh(path):
+                return path, self._mimetype(path)
+            try:
+                response = self.session.get(url, timeout=FETCH_TIMEOUT)
+                response.raise_for_status()
+                content = response.content
+                mimetype = sniff_mimetype(content)
+                if mimetype == "application/octet-stream" or len(content) > MAX_IMAGE_SIZE:
+                    raise ValueError(f"not an image ({response.headers.get('Content-Type')}, {len(content)} bytes)")
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Failed to download image {url}: {e}")
+                return (path, self._mimetype(path)) if os.path.exists(path) else None
+            atomic_write(path, content)
+        return path, mimetype
+
+    def _fresh(self, path):
+        try:
+            return time.time() - os.path.getmtime(path) < self.max_age
+        except OSError:
+            return False
+
+    @staticmethod
+    def _mimetype(path):
+        with open(path, "rb") as f:
+            return sniff_mimetype(f.read(16))
+
+    def close(self):
+        """Close the HTTP session"""
+        self.session.close()
@@ -9,17 +9,80 @@ import os
 import json
 import time
 import uuid
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
-from datetime import datetime, timedelta
 import logging
 from flask import current_app
 
+from app.fileutils import atomic_write_json, file_lock
+from app.models import Channel, Device, Program, Stream
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.results import (
+    UpstreamError, is_error, error_from_exception, error_from_response, decode_response,
+    ERROR_AUTH_EXPIRED, ERROR_NOT_FOUND, ERROR_INVALID
+)
+from app.services.rate_limiter import (
+    RateLimiter, RateLimitedError, request_priority, current_priority,
+    PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_NAMES
+)
+from app.timeutils import utc_api_time
+from app.profiling import hot_timer
+from app.tracing import traced
+
 logger = logging.getLogger(__name__)
 
+# Počet sekund ve dni
+DAY_SECONDS = 86400
+
+# Název účtu z přihlašovacích údajů USERNAME/PASSWORD
+DEFAULT_ACCOUNT = "default"
+
+# Výchozí adresa API
+DEFAULT_BASE_URL = "https://{language}go.magio.tv"
+
+# Strategie řešení přesměrování URL streamů
+REDIRECT_EAGER = "eager"
+REDIRECT_LAZY = "lazy"
+REDIRECT_BACKGROUND = "background"
+REDIRECT_MODES = (REDIRECT_EAGER, REDIRECT_LAZY, REDIRECT_BACKGROUND)
+
+# Profily kvality streamu od nejnižší po nejvyšší
+QUALITIES = ("p1", "p2", "p3", "p4", "p5")
+
+# Výchozí priorita endpointů, pokud ji vlákno nenastaví (viz request_priority)
+ENDPOINT_PRIORITIES = {
+    "stream-url": PRIORITY_INTERACTIVE,
+    "redirect": PRIORITY_INTERACTIVE
+}
+
+
+def token_file_path(data_dir, account, language):
+    """
+    Cesta k souboru s tokeny klienta
+    
+    Args:
+        data_dir (str): Složka pro ukládání dat
+        account (str): Název účtu
+        language (str): Kód jazyka
+        
+    Returns:
+        str: Cesta k souboru (výchozí účet si ponechává původní název)
+    """
+    language = language.lower()
+    name = f"token_{language}.json" if account == DEFAULT_ACCOUNT else f"token_{account}_{language}.json"
+    return os.path.join(data_dir, name)
+
 
 class MagentaTV:
-    def __init__(self, username, password, language="cz", quality="p5"):
+    # Posluchači událostí klienta (metriky, tracing) - viz add_hook
+    hooks = []
+
+    def __init__(self, username, password, language="cz", quality="p5",
+                 redirect_mode=REDIRECT_EAGER, redirect_cache_timeout=300, base_url=None,
+                 breaker_settings=None, rate_limit=0, rate_burst=None, account=DEFAULT_ACCOUNT,
+                 device_id=None):
         """
         Inicializace MagentaTV API klienta
         
@@ -28,14 +91,54 @@ class MagentaTV:
             password (str): Heslo
             language (str): Kód jazyka (cz, sk)
             quality (str): Kvalita streamu (p1-p5, kde p5 je nejvyšší)
+            redirect_mode (str): Strategie přesměrování URL streamu (eager, lazy, background)
+            redirect_cache_timeout (int): Platnost výsledných URL v režimu background v sekundách
+            base_url (str, optional): Adresa API, může obsahovat {language} (výchozí https://{language}go.magio.tv)
+            breaker_settings (dict, optional): Parametry jističů endpointů (viz CircuitBreaker)
+            rate_limit (float): Maximální počet požadavků na API za sekundu (0 = bez omezení)
+            rate_burst (int, optional): Počet požadavků, které lze odeslat najednou
+            account (str): Název účtu, odlišuje soubory s tokeny a cache více klientů
+            device_id (str, optional): Trvalé ID zařízení (viz DeviceIdentityStore),
+                bez něj se použije ID ze souboru s tokeny nebo nové
         """
         self.username = username
         self.password = password
         self.language = language.lower()
+        self.account = account
+        
+        # Identifikace klienta v poolu a v klíčích cache
+        self.key = f"{account}/{self.language}"
         self.quality = quality
         
+        # Strategie řešení přesměrování URL streamů
+        if redirect_mode not in REDIRECT_MODES:
+            logger.warning(f"Neznámá strategie přesměrování {redirect_mode}, použije se {REDIRECT_EAGER}")
+            redirect_mode = REDIRECT_EAGER
+        self.redirect_mode = redirect_mode
+        self.redirect_cache_timeout = redirect_cache_timeout
+        self._redirect_cache = {}
+        self._redirect_pending = set()
+        self._redirect_lock = threading.Lock()
+        self._redirect_executor = None
+        self._closed = False
+        self.redirect_stats = {
+            "resolved": 0,
+            "resolve_time": 0.0,
+            "lazy": 0,
+            "cache_hits": 0,
+            "cache_misses": 0
+        }
+        
+        # Jističe jednotlivých endpointů
+        self.breaker_settings = breaker_settings or {}
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        
+        # Omezení počtu požadavků na API
+        self.rate_limiter = RateLimiter(rate_limit, rate_burst) if rate_limit else None
+        
         # URL podle jazyka
-        self.base_url = f"https://{self.language}go.magio.tv"
+        self.base_url = (base_url or DEFAULT_BASE_URL).format(language=self.language).rstrip("/")
         
         # User-Agent
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 MagioGO/4.0.21"
@@ -44,7 +147,8 @@ class MagentaTV:
         self.session = requests.Session()
         
         # Informace o zařízení
-        self.device_id = str(uuid.uuid4())
+        self._fixed_device_id = device_id is not None
+        self.device_id = device_id or str(uuid.uuid4())
         self.device_name = "Android TV"
         self.device_type = "OTT_STB"
         
@@ -53,8 +157,11 @@ class MagentaTV:
         self.refresh_token = None
         self.token_expires = 0
         
+        # Zámek pro přihlášení a obnovení tokenu při souběžných požadavcích
+        self._token_lock = threading.RLock()
+        
         # Soubor pro uložení přihlašovacích údajů
-        self.token_file = os.path.join(current_app.config["DATA_DIR"], f"token_{language}.json")
+        self.token_file = token_file_path(current_app.config["DATA_DIR"], account, self.language)
         
         # Načtení tokenů při inicializaci
         self._load_tokens()
@@ -65,28 +172,237 @@ class MagentaTV:
             try:
                 with open(self.token_file, 'r') as f:
                     data = json.load(f)
-                    self.access_token = data.get("access_token")
-                    self.refresh_token = data.get("refresh_token")
-                    self.token_expires = data.get("expires", 0)
-                    self.device_id = data.get("device_id", self.device_id)
+                
+                # Tokeny vydané jinému zařízení nelze obnovit
+                token_device_id = data.get("device_id")
+                if self._fixed_device_id and token_device_id and token_device_id != self.device_id:
+                    logger.warning(f"Tokeny v {self.token_file} patří jinému zařízení, bude nutné nové přihlášení")
+                    return
+                
+                self.access_token = data.get("access_token")
+                self.refresh_token = data.get("refresh_token")
+                self.token_expires = data.get("expires", 0)
+                self.device_id = token_device_id or self.device_id
                 logger.info("Tokeny načteny ze souboru")
             except Exception as e:
                 logger.error(f"Chyba při načítání tokenů: {e}")
 
     def _save_tokens(self):
-        """Uložení tokenů do souboru"""
+        """Uložení tokenů do souboru (atomicky, přerušený zápis nepoškodí původní soubor)"""
         try:
-            with open(self.token_file, 'w') as f:
-                json.dump({
-                    "access_token": self.access_token,
-                    "refresh_token": self.refresh_token,
-                    "expires": self.token_expires,
-                    "device_id": self.device_id
-                }, f)
+            atomic_write_json(self.token_file, {
+                "access_token": self.access_token,
+                "refresh_token": self.refresh_token,
+                "expires": self.token_expires,
+                "device_id": self.device_id
+            })
             logger.info("Tokeny uloženy do souboru")
         except Exception as e:
             logger.error(f"Chyba při ukládání tokenů: {e}")
 
+    def update_settings(self, quality=None, redirect_mode=None, redirect_cache_timeout=None,
+                        breaker_settings=None, rate_limit=None, rate_burst=None):
+        """
+        Změna nastavení klienta za běhu, bez nového přihlášení
+        
+        Args:
+            quality (str, optional): Kvalita streamu
+            redirect_mode (str, optional): Strategie přesměrování URL streamu
+            redirect_cache_timeout (int, optional): Platnost výsledných URL v režimu background
+            breaker_settings (dict, optional): Parametry jističů endpointů
+            rate_limit (float, optional): Maximální počet požadavků na API za sekundu (0 = bez omezení)
+            rate_burst (int, optional): Počet požadavků, které lze odeslat najednou
+        """
+        if quality is not None:
+            self.quality = quality
+        if redirect_mode is not None:
+            if redirect_mode in REDIRECT_MODES:
+                self.redirect_mode = redirect_mode
+            else:
+                logger.warning(f"Neznámá strategie přesměrování {redirect_mode}, ponechává se {self.redirect_mode}")
+        if redirect_cache_timeout is not None:
+            self.redirect_cache_timeout = redirect_cache_timeout
+        if breaker_settings is not None:
+            self.breaker_settings = breaker_settings
+            for breaker in list(self.breakers.values()):
+                breaker.configure(**breaker_settings)
+        if rate_limit is not None:
+            if not rate_limit:
+                self.rate_limiter = None
+            elif self.rate_limiter is None:
+                self.rate_limiter = RateLimiter(rate_limit, rate_burst)
+            else:
+                self.rate_limiter.configure(rate_limit, rate_burst)
+
+    def close(self):
+        """Uzavření HTTP session a vláken klienta, další přesměrování na pozadí se už nespouštějí"""
+        with self._redirect_lock:
+            self._closed = True
+            executor = self._redirect_executor
+            self._redirect_executor = None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        self.session.close()
+
+    @classmethod
+    def add_hook(cls, hook):
+        """
+        Registrace posluchače událostí klienta
+        
+        Posluchač se volá jako hook(event, **data) pro události:
+        - "request": endpoint, duration (s), status (HTTP status nebo None), error (výjimka nebo None)
+        - "rejected": endpoint - API vrátilo success=false
+        - "token": kind ("login" nebo "refresh") - úspěšné přihlášení / obnovení tokenu
+        - "circuit_open": endpoint - požadavek nebyl odeslán, jistič endpointu je rozpojený
+        - "throttled": endpoint, priority, wait (s nebo None) - požadavek čekal ve frontě omezovače,
+          wait None znamená, že se na odeslání nedočkal
+        
+        Args:
+            hook (callable): Posluchač
+        """
+        if hook not in cls.hooks:
+            cls.hooks.append(hook)
+
+    def _emit(self, event, **data):
+        """Předání události registrovaným posluchačům"""
+        for hook in self.hooks:
+            try:
+                hook(event, **data)
+            except Exception as e:
+                logger.error(f"Chyba v posluchači události {event}: {e}")
+
+    def _get_breaker(self, endpoint):
+        """Jistič endpointu, vytvoří se při prvním použití"""
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self.breakers.get(endpoint)
+                if breaker is None:
+                    breaker = self.breakers[endpoint] = CircuitBreaker(endpoint, **self.breaker_settings)
+        return breaker
+
+    def get_rate_limit_status(self):
+        """
+        Získání stavu omezovače požadavků
+        
+        Returns:
+            dict: Stav omezovače nebo None, pokud je omezení vypnuté
+        """
+        return self.rate_limiter.status() if self.rate_limiter is not None else None
+
+    def get_circuit_status(self):
+        """
+        Získání stavu jističů endpointů
+        
+        Returns:
+            dict: Stav jističe podle endpointu
+        """
+        return {endpoint: breaker.status() for endpoint, breaker in list(self.breakers.items())}
+
+    def _auth_error(self):
+        """Chyba pro volání, před kterým se nepodařilo obnovit token ani se přihlásit"""
+        return UpstreamError(ERROR_AUTH_EXPIRED, "Přihlášení se nezdařilo", "auth")
+
+    def _rejected(self, endpoint, response, context, status=None):
+        """
+        Zpracování odpovědi API se success=false
+        
+        Args:
+            endpoint (str): Název endpointu
+            response (dict): Odpověď API
+            context (str): Popis operace pro log
+            status (int, optional): HTTP status odpovědi
+            
+        Returns:
+            UpstreamError: Klasifikovaná chyba
+        """
+        self._emit("rejected", endpoint=endpoint)
+        error = error_from_response(response, endpoint, status)
+        logger.error(f"{context}: {error.message}")
+        if error.kind == ERROR_AUTH_EXPIRED:
+            # Odmítnutý token se při dalším volání obnoví
+            self.token_expires = 0
+        return error
+
+    def _failed(self, endpoint, exception, context):
+        """
+        Zpracování výjimky při volání API
+        
+        Args:
+            endpoint (str): Název endpointu
+            exception (Exception): Zachycená výjimka
+            context (str): Popis operace pro log
+            
+        Returns:
+            UpstreamError: Klasifikovaná chyba
+        """
+        error = error_from_exception(exception, endpoint)
+        logger.error(f"{context}: {exception}")
+        return error
+
+    def _request(self, endpoint, method, url, **kwargs):
+        """
+        Odeslání HTTP požadavku na API
+        
+        Všechny požadavky na API procházejí touto metodou, aby bylo možné
+        měřit jejich dobu a chyby na jednom místě. Počet požadavků hlídá
+        omezovač, ve kterém mají přednost interaktivní požadavky. Každý
+        endpoint má svůj jistič - po opakovaných chybách se požadavky na
+        chvíli vůbec neodesílají a timeout se přizpůsobuje odezvě endpointu.
+        
+        Args:
+            endpoint (str): Název endpointu pro metriky (např. "stream-url")
+            method (str): HTTP metoda
+            url (str): URL požadavku
+            **kwargs: Další argumenty pro requests
+            
+        Returns:
+            requests.Response: Odpověď serveru
+            
+        Raises:
+            RateLimitedError: Požadavek se nedočkal na odeslání
+            CircuitOpenError: Jistič endpointu je rozpojený
+        """
+        if self.rate_limiter is not None:
+            priority = current_priority(ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_NORMAL))
+            waited = self.rate_limiter.acquire(priority)
+            if waited is None or waited > 0:
+                self._emit("throttled", endpoint=endpoint, priority=PRIORITY_NAMES[priority], wait=waited)
+            if waited is None:
+                raise RateLimitedError(f"Požadavek na {endpoint} překročil limit počtu požadavků")
+        
+        breaker = self._get_breaker(endpoint)
+        if not breaker.allow():
+            self._emit("circuit_open", endpoint=endpoint)
+            raise CircuitOpenError(f"Endpoint {endpoint} je dočasně nedostupný")
+        if "timeout" in kwargs:
+            kwargs["timeout"] = breaker.timeout(kwargs["timeout"])
+        
+        start = time.perf_counter()
+        response = None
+        error = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            # Chyby serveru a přenosu rozpojují jistič, odpovědi 4xx ne
+            if response is None or response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success(duration)
+            self._emit(
+                "request",
+                endpoint=endpoint,
+                duration=duration,
+                status=response.status_code if response is not None else None,
+                error=error
+            )
+
+    @traced("magenta.login")
     def login(self):
         """
         Přihlášení k službě MagentaTV
@@ -94,11 +410,26 @@ class MagentaTV:
         Returns:
             bool: True v případě úspěšného přihlášení, jinak False
         """
+        with self._token_lock:
+            return self._login()
+
+    def _login(self):
+        """Přihlášení k službě MagentaTV (volá se pod zámkem tokenu)"""
         # Ověření platnosti současného tokenu
         if self.refresh_token and self.token_expires > time.time() + 60:
             logger.info("Současný token je stále platný")
             return self.refresh_access_token()
         
+        with file_lock(self.token_file):
+            # Jiný proces se mohl mezitím přihlásit, sdílí stejný soubor s tokeny
+            self._load_tokens()
+            if self.refresh_token and self.token_expires > time.time() + 60:
+                logger.info("Tokeny mezitím obnovil jiný proces")
+                return True
+            return self._authenticate()
+
+    def _authenticate(self):
+        """Přihlášení jménem a heslem (volá se pod zámkem tokenu a souboru s tokeny)"""
         app_version = current_app.config.get("APP_VERSION", "4.0.25-hf.0")
         # Parametry pro inicializaci přihlášení
         params = {
@@ -118,7 +449,8 @@ class MagentaTV:
         
         try:
             # První požadavek na inicializaci přihlášení
-            init_response = self.session.post(
+            init_response = self._request(
+                "auth/init", "POST",
                 f"{self.base_url}/v2/auth/init",
                 params=params,
                 headers=headers,
@@ -126,6 +458,7 @@ class MagentaTV:
             ).json()
             
             if not init_response.get("success", False):
+                self._emit("rejected", endpoint="auth/init")
                 error_msg = init_response.get('errorMessage', 'Neznámá chyba')
                 logger.error(f"Chyba inicializace: {error_msg}")
                 return False
@@ -147,7 +480,8 @@ class MagentaTV:
             }
             
             # Požadavek na přihlášení
-            login_response = self.session.post(
+            login_response = self._request(
+                "auth/login", "POST",
                 f"{self.base_url}/v2/auth/login",
                 json=login_params,
                 headers=login_headers,
@@ -155,6 +489,7 @@ class MagentaTV:
             ).json()
             
             if not login_response.get("success", False):
+                self._emit("rejected", endpoint="auth/login")
                 error_msg = login_response.get('errorMessage', 'Neznámá chyba')
                 logger.error(f"Chyba přihlášení: {error_msg}")
                 return False
@@ -166,6 +501,7 @@ class MagentaTV:
             
             # Uložení tokenů do souboru
             self._save_tokens()
+            self._emit("token", kind="login")
             
             logger.info("Přihlášení úspěšné")
             return True
@@ -174,6 +510,7 @@ class MagentaTV:
             logger.error(f"Chyba při přihlášení: {e}")
             return False
 
+    @traced("magenta.refresh_access_token")
     def refresh_access_token(self):
         """
         Obnovení přístupového tokenu pomocí refresh tokenu
@@ -181,6 +518,15 @@ class MagentaTV:
         Returns:
             bool: True v případě úspěšného obnovení tokenu, jinak False
         """
+        # Rychlá kontrola platnosti bez zámku
+        if self.refresh_token and self.token_expires > time.time() + 60:
+            return True
+        
+        with self._token_lock:
+            return self._refresh_access_token()
+
+    def _refresh_access_token(self):
+        """Obnovení přístupového tokenu (volá se pod zámkem tokenu)"""
         if not self.refresh_token:
             logger.warning("Refresh token není k dispozici, je nutné se znovu přihlásit")
             return self.login()
@@ -188,7 +534,26 @@ class MagentaTV:
         # Kontrola vypršení tokenu
         if self.token_expires > time.time() + 60:
             return True
-            
+        
+        with file_lock(self.token_file):
+            # Jiný proces mohl token mezitím obnovit, náš refresh token by už neplatil
+            self._load_tokens()
+            if self.refresh_token and self.token_expires > time.time() + 60:
+                logger.info("Token mezitím obnovil jiný proces")
+                return True
+            if self.refresh_token and self._request_tokens():
+                return True
+        
+        # Přihlášení až po uvolnění zámku souboru, login si ho bere sám
+        return self.login()
+
+    def _request_tokens(self):
+        """
+        Výměna refresh tokenu za nové tokeny (volá se pod zámkem tokenu a souboru s tokeny)
+        
+        Returns:
+            bool: True v případě úspěšného obnovení tokenu, jinak False
+        """
         params = {
             "refreshToken": self.refresh_token
         }
@@ -200,7 +565,8 @@ class MagentaTV:
         }
         
         try:
-            response = self.session.post(
+            response = self._request(
+                "auth/tokens", "POST",
                 f"{self.base_url}/v2/auth/tokens",
                 json=params,
                 headers=headers,
@@ -208,9 +574,10 @@ class MagentaTV:
             ).json()
             
             if not response.get("success", False):
+                self._emit("rejected", endpoint="auth/tokens")
                 error_msg = response.get('errorMessage', 'Neznámá chyba')
                 logger.error(f"Chyba obnovení tokenu: {error_msg}")
-                return self.login()
+                return False
                 
             self.access_token = response["token"]["accessToken"]
             self.refresh_token = response["token"]["refreshToken"]
@@ -218,23 +585,25 @@ class MagentaTV:
             
             # Uložení tokenů do souboru
             self._save_tokens()
+            self._emit("token", kind="refresh")
             
             logger.info("Token úspěšně obnoven")
             return True
             
         except Exception as e:
             logger.error(f"Chyba při obnovení tokenu: {e}")
-            return self.login()
+            return False
 
+    @traced("magenta.get_channels")
     def get_channels(self):
         """
         Získání seznamu dostupných kanálů
         
         Returns:
-            list: Seznam kanálů s jejich ID, názvem, logem a kategorií
+            list: Seznam kanálů (Channel) s jejich ID, názvem, logem a kategorií nebo UpstreamError
         """
         if not self.refresh_access_token():
-            return []
+            return self._auth_error()
             
         headers = {
             "Authorization": f"Bearer {self.access_token}",
@@ -244,7 +613,8 @@ class MagentaTV:
         
         try:
             # Získání kategorií pro kanály
-            categories_response = self.session.get(
+            categories_response = self._request(
+                "categories", "GET",
                 f"{self.base_url}/home/categories",
                 params={"language": self.language},
                 headers=headers,
@@ -262,56 +632,63 @@ class MagentaTV:
                 "queryScope": "LIVE"
             }
             
-            channels_response = self.session.get(
+            http_response = self._request(
+                "channels", "GET",
                 f"{self.base_url}/v2/television/channels",
                 params=params,
                 headers=headers,
                 timeout=30
-            ).json()
+            )
+            channels_response = decode_response(http_response)
             
             if not channels_response.get("success", True):
-                logger.error("Chyba při získání kanálů")
-                return []
+                return self._rejected("channels", channels_response, "Chyba při získání kanálů", http_response.status_code)
                 
             channels = []
             for item in channels_response.get("items", []):
                 channel = item.get("channel", {})
                 channel_id = channel.get("channelId")
                 
-                channels.append({
-                    "id": channel_id,
-                    "name": channel.get("name", ""),
-                    "original_name": channel.get("originalName", ""),
-                    "logo": channel.get("logoUrl", ""),
-                    "group": categories.get(channel_id, "Ostatní"),
-                    "has_archive": channel.get("hasArchive", False)
-                })
+                channels.append(Channel(
+                    id=channel_id,
+                    name=channel.get("name", ""),
+                    original_name=channel.get("originalName", ""),
+                    logo=channel.get("logoUrl", ""),
+                    group=categories.get(channel_id, "Ostatní"),
+                    has_archive=channel.get("hasArchive", False)
+                ))
                 
             return channels
             
         except Exception as e:
-            logger.error(f"Chyba při získání kanálů: {e}")
-            return []
+            return self._failed("channels", e, "Chyba při získání kanálů")
 
-    def get_stream_url(self, channel_id):
+    @traced("magenta.get_stream_url")
+    def get_stream_url(self, channel_id, quality=None):
         """
         Získání URL pro streamování kanálu
         
         Args:
             channel_id (int): ID kanálu
+            quality (str, optional): Kvalita streamu, výchozí je nastavená kvalita klienta
             
         Returns:
-            dict: Informace o streamu včetně URL nebo None v případě chyby
+            Stream: Informace o streamu včetně URL nebo UpstreamError
         """
+        try:
+            channel_id = int(channel_id)
+        except (TypeError, ValueError):
+            return UpstreamError(ERROR_INVALID, f"Neplatné ID kanálu: {channel_id}", "stream-url")
+        
         if not self.refresh_access_token():
-            return None
+            return self._auth_error()
             
         params = {
             "service": "LIVE",
             "name": self.device_name,
             "devtype": self.device_type,
-            "id": int(channel_id),
-            "prof": self.quality,
+            "id": channel_id,
+            "prof": quality or self.quality,
             "ecid": "",
             "drm": "widevine",
             "start": "LIVE",
@@ -328,21 +705,21 @@ class MagentaTV:
         }
         
         try:
-            response = self.session.get(
+            http_response = self._request(
+                "stream-url", "GET",
                 f"{self.base_url}/v2/television/stream-url",
                 params=params,
                 headers=headers,
                 timeout=10
-            ).json()
+            )
+            response = decode_response(http_response)
             
             if not response.get("success", False):
-                error_msg = response.get('errorMessage', 'Neznámá chyba')
-                logger.error(f"Chyba při získání stream URL: {error_msg}")
-                return None
+                return self._rejected("stream-url", response, "Chyba při získání stream URL", http_response.status_code)
                 
             url = response["url"]
             
-            # Následování přesměrování pro získání skutečné URL
+            # Hlavičky pro přehrávač a pro následování přesměrování
             headers_redirect = {
                 "Host": urlparse(url).netloc,
                 "User-Agent": self.user_agent,
@@ -351,41 +728,135 @@ class MagentaTV:
                 "Referer": f"https://{self.language}go.magio.tv/"
             }
             
-            redirect_response = self.session.get(
-                url,
-                headers=headers_redirect,
-                allow_redirects=False,
-                timeout=10
-            )
-            
-            final_url = redirect_response.headers.get("location", url)
+            final_url, content_type = self._resolve_redirect(("LIVE", channel_id, quality or self.quality), url, headers_redirect)
             
             # Vrátíme informace o streamu
-            return {
-                "url": final_url,
-                "headers": dict(headers_redirect),
-                "content_type": redirect_response.headers.get("Content-Type", "application/vnd.apple.mpegurl"),
-                "is_live": True
-            }
+            return Stream(
+                url=final_url,
+                headers=dict(headers_redirect),
+                content_type=content_type,
+                is_live=True
+            )
             
         except Exception as e:
-            logger.error(f"Chyba při získání stream URL: {e}")
-            return None
+            return self._failed("stream-url", e, "Chyba při získání stream URL")
 
-    def get_epg(self, channel_id=None, days_back=1, days_forward=1):
+    def _resolve_redirect(self, cache_key, url, headers):
+        """
+        Získání výsledné URL streamu podle nastavené strategie přesměrování
+        
+        - eager: přesměrování se vždy následuje (další požadavek navíc)
+        - lazy: přehrávač dostane URL z prvního kroku a přesměrování následuje sám
+        - background: vrátí se výsledná URL z vlastní cache, pokud je k dispozici,
+          jinak URL z prvního kroku a přesměrování se vyřeší na pozadí
+        
+        Args:
+            cache_key (tuple): Klíč streamu pro cache výsledných URL
+            url (str): URL vrácená z /v2/television/stream-url
+            headers (dict): Hlavičky pro požadavek na přesměrování
+            
+        Returns:
+            tuple: Výsledná URL a content type (None, pokud není znám)
+        """
+        if self.redirect_mode == REDIRECT_LAZY:
+            with self._redirect_lock:
+                self.redirect_stats["lazy"] += 1
+            return url, None
+        
+        if self.redirect_mode == REDIRECT_BACKGROUND:
+            with self._redirect_lock:
+                cached = self._redirect_cache.get(cache_key)
+                if cached and cached[2] > time.time():
+                    self.redirect_stats["cache_hits"] += 1
+                    return cached[0], cached[1]
+                
+                self.redirect_stats["cache_misses"] += 1
+                # Uzavřený klient už nic na pozadí nespouští
+                if self._closed or cache_key in self._redirect_pending:
+                    return url, None
+                self._redirect_pending.add(cache_key)
+                
+                # Vlákna vznikají pod zámkem, aby souběžné požadavky nevytvořily dva pooly
+                if self._redirect_executor is None:
+                    self._redirect_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="redirect")
+                self._redirect_executor.submit(self._resolve_redirect_background, cache_key, url, dict(headers))
+            return url, None
+        
+        return self._follow_redirect(url, headers)
+
+    def _follow_redirect(self, url, headers):
+        """
+        Následování přesměrování pro získání skutečné URL
+        
+        Returns:
+            tuple: Výsledná URL a content type
+        """
+        start = time.perf_counter()
+        redirect_response = self._request(
+            "redirect", "GET",
+            url,
+            headers=headers,
+            allow_redirects=False,
+            timeout=10
+        )
+        
+        with self._redirect_lock:
+            self.redirect_stats["resolved"] += 1
+            self.redirect_stats["resolve_time"] += time.perf_counter() - start
+        
+        return (
+            redirect_response.headers.get("location", url),
+            redirect_response.headers.get("Content-Type")
+        )
+
+    def _resolve_redirect_background(self, cache_key, url, headers):
+        """Vyřešení přesměrování na pozadí a uložení do cache výsledných URL"""
+        try:
+            final_url, content_type = self._follow_redirect(url, headers)
+            with self._redirect_lock:
+                self._redirect_cache[cache_key] = (final_url, content_type, time.time() + self.redirect_cache_timeout)
+        except Exception as e:
+            logger.error(f"Chyba při řešení přesměrování na pozadí: {e}")
+        finally:
+            with self._redirect_lock:
+                self._redirect_pending.discard(cache_key)
+
+    def get_redirect_stats(self):
+        """
+        Statistiky řešení přesměrování pro porovnání strategií
+        
+        Returns:
+            dict: Strategie, počty a průměrná doba řešení přesměrování v ms
+        """
+        with self._redirect_lock:
+            stats = dict(self.redirect_stats)
+            now = time.time()
+            cached = sum(1 for entry in self._redirect_cache.values() if entry[2] > now)
+        
+        resolved = stats["resolved"]
+        stats["avg_resolve_ms"] = round(stats.pop("resolve_time") * 1000 / resolved, 1) if resolved else None
+        stats["mode"] = self.redirect_mode
+        stats["cached_urls"] = cached
+        return stats
+
+    @traced("magenta.get_epg")
+    def get_epg(self, channel_id=None, days_back=1, days_forward=1, start_timestamp=None, end_timestamp=None):
         """
         Získání EPG (Electronic Program Guide) pro zadaný kanál nebo všechny kanály
         
         Args:
-            channel_id (int, optional): ID kanálu nebo None pro všechny kanály
+            channel_id (int|list, optional): ID kanálu, seznam ID kanálů nebo None pro všechny kanály
             days_back (int): Počet dní zpět
             days_forward (int): Počet dní dopředu
+            start_timestamp (int, optional): Začátek rozsahu (Unix timestamp), přebíjí days_back
+            end_timestamp (int, optional): Konec rozsahu (Unix timestamp), přebíjí days_forward
             
         Returns:
-            dict: EPG data rozdělená podle kanálů nebo None v případě chyby
+            dict: Seznamy pořadů (Program) podle kanálů nebo UpstreamError
+                (not_found, pokud API nevrátilo žádné pořady)
         """
         if not self.refresh_access_token():
-            return None
+            return self._auth_error()
             
         headers = {
             "Authorization": f"Bearer {self.access_token}",
@@ -393,21 +864,28 @@ class MagentaTV:
             "User-Agent": self.user_agent
         }
         
-        # Časový rozsah pro EPG
-        current_date = datetime.now()
-        start_time = (current_date - timedelta(days=days_back)).strftime("%Y-%m-%dT00:00:00.000Z")
-        end_time = (current_date + timedelta(days=days_forward)).strftime("%Y-%m-%dT23:59:59.000Z")
+        # Časový rozsah pro EPG (celé dny v UTC)
+        today = int(time.time()) // DAY_SECONDS * DAY_SECONDS
+        if start_timestamp is None:
+            start_timestamp = today - days_back * DAY_SECONDS
+        if end_timestamp is None:
+            end_timestamp = today + (days_forward + 1) * DAY_SECONDS - 1
+        start_time = utc_api_time(start_timestamp)
+        end_time = utc_api_time(end_timestamp)
         
         # Vytvoření filtru podle toho, zda je zadáno ID kanálu
-        if channel_id:
+        if isinstance(channel_id, (list, tuple)):
+            channel_ids = [str(item) for item in channel_id]
+            filter_str = f"channel.id=in=({','.join(channel_ids)}) and startTime=ge={start_time} and endTime=le={end_time}"
+        elif channel_id:
             filter_str = f"channel.id=={channel_id} and startTime=ge={start_time} and endTime=le={end_time}"
         else:
             # Získat seznam všech kanálů
             channels = self.get_channels()
             if not channels:
-                return None
+                return channels if is_error(channels) else UpstreamError(ERROR_NOT_FOUND, "Žádné kanály", "channels")
                 
-            channel_ids = [str(channel["id"]) for channel in channels]
+            channel_ids = [str(channel.id) for channel in channels]
             filter_str = f"channel.id=in=({','.join(channel_ids)}) and startTime=ge={start_time} and endTime=le={end_time}"
         
         params = {
@@ -418,76 +896,90 @@ class MagentaTV:
         }
         
         try:
-            response = self.session.get(
+            http_response = self._request(
+                "epg", "GET",
                 f"{self.base_url}/v2/television/epg",
                 params=params,
                 headers=headers,
                 timeout=30
-            ).json()
+            )
+            response = decode_response(http_response)
             
             if not response.get("success", True):
-                logger.error(f"Chyba při získání EPG: {response.get('errorMessage', 'Neznámá chyba')}")
-                return None
+                return self._rejected("epg", response, "Chyba při získání EPG", http_response.status_code)
                 
-            # Zpracování EPG dat
+            # Zpracování EPG dat - časy zůstávají jako UTC epoch sekundy,
+            # formátují se až při výstupu
             epg_data = {}
             
-            for item in response.get("items", []):
-                item_channel_id = item.get("channel", {}).get("id")
-                if not item_channel_id:
-                    continue
-                    
-                # Vytvoření záznamu pro kanál
-                if item_channel_id not in epg_data:
-                    epg_data[item_channel_id] = []
-                
-                # Přidání programů
-                for program in item.get("programs", []):
-                    # Převod časových údajů z milisekund na sekundy
-                    start_time = datetime.fromtimestamp(program["startTimeUTC"] / 1000)
-                    end_time = datetime.fromtimestamp(program["endTimeUTC"] / 1000)
-                    
-                    prog_info = program.get("program", {})
-                    prog_value = prog_info.get("programValue", {})
+            with hot_timer("epg_parse"):
+                for item in response.get("items", []):
+                    item_channel_id = item.get("channel", {}).get("id")
+                    if not item_channel_id:
+                        continue
                     
-                    epg_data[item_channel_id].append({
-                        "schedule_id": program.get("scheduleId"),
-                        "title": prog_info.get("title", ""),
-                        "description": prog_info.get("description", ""),
-                        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
-                        "duration": int((end_time - start_time).total_seconds()),
-                        "category": prog_info.get("programCategory", {}).get("desc", ""),
-                        "year": prog_value.get("creationYear"),
-                        "episode": prog_value.get("episodeId"),
-                        "images": prog_info.get("images", [])
-                    })
+                    # Vytvoření záznamu pro kanál
+                    programs = epg_data.get(item_channel_id)
+                    if programs is None:
+                        programs = epg_data[item_channel_id] = []
+                    append = programs.append
                     
+                    # Přidání programů
+                    for program in item.get("programs", []):
+                        # Převod časových údajů z milisekund na sekundy
+                        start = program["startTimeUTC"] // 1000
+                        end = program["endTimeUTC"] // 1000
+                        
+                        prog_info = program.get("program") or {}
+                        prog_value = prog_info.get("programValue") or {}
+                        
+                        # Poziční argumenty - nejžhavější smyčka parsování
+                        append(Program(
+                            program.get("scheduleId"),
+                            prog_info.get("title", ""),
+                            start,
+                            end,
+                            prog_info.get("description", ""),
+                            end - start,
+                            (prog_info.get("programCategory") or {}).get("desc", ""),
+                            prog_value.get("creationYear"),
+                            prog_value.get("episodeId"),
+                            prog_info.get("images", [])
+                        ))
+            
+            if not epg_data:
+                return UpstreamError(ERROR_NOT_FOUND, "EPG neobsahuje žádné pořady", "epg")
             return epg_data
             
         except Exception as e:
-            logger.error(f"Chyba při získání EPG: {e}")
-            return None
+            return self._failed("epg", e, "Chyba při získání EPG")
     
-    def get_catchup_url(self, schedule_id):
+    @traced("magenta.get_catchup_url")
+    def get_catchup_url(self, schedule_id, quality=None):
         """
         Získání URL pro přehrávání archivu podle ID pořadu
         
         Args:
             schedule_id (int): ID pořadu v programu
+            quality (str, optional): Kvalita streamu, výchozí je nastavená kvalita klienta
             
         Returns:
-            dict: Informace o streamu včetně URL nebo None v případě chyby
+            Stream: Informace o streamu včetně URL nebo UpstreamError
         """
+        try:
+            schedule_id = int(schedule_id)
+        except (TypeError, ValueError):
+            return UpstreamError(ERROR_INVALID, f"Neplatné ID pořadu: {schedule_id}", "stream-url")
+        
         if not self.refresh_access_token():
-            return None
+            return self._auth_error()
             
         params = {
             "service": "ARCHIVE",
             "name": self.device_name,
             "devtype": self.device_type,
-            "id": int(schedule_id),
-            "prof": self.quality,
+            "id": schedule_id,
+            "prof": quality or self.quality,
             "ecid": "",
             "drm": "widevine"
         }
@@ -501,21 +993,21 @@ class MagentaTV:
         }
         
         try:
-            response = self.session.get(
+            http_response = self._request(
+                "stream-url", "GET",
                 f"{self.base_url}/v2/television/stream-url",
                 params=params,
                 headers=headers,
                 timeout=10
-            ).json()
+            )
+            response = decode_response(http_response)
             
             if not response.get("success", False):
-                error_msg = response.get('errorMessage', 'Neznámá chyba')
-                logger.error(f"Chyba při získání catchup URL: {error_msg}")
-                return None
+                return self._rejected("stream-url", response, "Chyba při získání catchup URL", http_response.status_code)
                 
             url = response["url"]
             
-            # Následování přesměrování pro získání skutečné URL
+            # Hlavičky pro přehrávač a pro následování přesměrování
             headers_redirect = {
                 "Host": urlparse(url).netloc,
                 "User-Agent": self.user_agent,
@@ -524,28 +1016,21 @@ class MagentaTV:
                 "Referer": f"https://{self.language}go.magio.tv/"
             }
             
-            redirect_response = self.session.get(
-                url,
-                headers=headers_redirect,
-                allow_redirects=False,
-                timeout=10
-            )
-            
-            final_url = redirect_response.headers.get("location", url)
+            final_url, content_type = self._resolve_redirect(("ARCHIVE", schedule_id, quality or self.quality), url, headers_redirect)
             
             # Vrátíme informace o streamu
-            return {
-                "url": final_url,
-                "headers": dict(headers_redirect),
-                "content_type": redirect_response.headers.get("Content-Type", "application/vnd.apple.mpegurl"),
-                "is_live": False
-            }
+            return Stream(
+                url=final_url,
+                headers=dict(headers_redirect),
+                content_type=content_type,
+                is_live=False
+            )
             
         except Exception as e:
-            logger.error(f"Chyba při získání catchup URL: {e}")
-            return None
+            return self._failed("stream-url", e, "Chyba při získání catchup URL")
 
-    def get_catchup_by_time(self, channel_id, start_timestamp, end_timestamp):
+    @traced("magenta.get_catchup_by_time")
+    def get_catchup_by_time(self, channel_id, start_timestamp, end_timestamp, quality=None):
         """
         Získání URL pro přehrávání archivu podle času začátku a konce
         
@@ -553,20 +1038,17 @@ class MagentaTV:
             channel_id (int): ID kanálu
             start_timestamp (int): Čas začátku v Unix timestamp
             end_timestamp (int): Čas konce v Unix timestamp
+            quality (str, optional): Kvalita streamu, výchozí je nastavená kvalita klienta
             
         Returns:
-            dict: Informace o streamu včetně URL nebo None v případě chyby
+            Stream: Informace o streamu včetně URL nebo UpstreamError
         """
         if not self.refresh_access_token():
-            return None
+            return self._auth_error()
             
-        # Převod timestampů na datetime objekty
-        start_time = datetime.fromtimestamp(start_timestamp)
-        end_time = datetime.fromtimestamp(end_timestamp)
-        
-        # Formátování pro API
-        start_time_str = start_time.strftime("%Y-%m-%dT%H:%M:%S")
-        end_time_str = end_time.strftime("%Y-%m-%dT%H:%M:%S")
+        # Formátování pro API (timestampy jsou v UTC)
+        start_time_str = utc_api_time(start_timestamp)
+        end_time_str = utc_api_time(end_timestamp)
         
         # Získání ID pořadu z EPG
         headers = {
@@ -575,7 +1057,7 @@ class MagentaTV:
             "User-Agent": self.user_agent
         }
         
-        filter_str = f"channel.id=={channel_id} and startTime=ge={start_time_str}.000Z and endTime=le={end_time_str}.000Z"
+        filter_str = f"channel.id=={channel_id} and startTime=ge={start_time_str} and endTime=le={end_time_str}"
         params = {
             "filter": filter_str,
             "limit": 10,
@@ -584,16 +1066,20 @@ class MagentaTV:
         }
         
         try:
-            epg_response = self.session.get(
+            http_response = self._request(
+                "epg", "GET",
                 f"{self.base_url}/v2/television/epg",
                 params=params,
                 headers=headers,
                 timeout=30
-            ).json()
+            )
+            epg_response = decode_response(http_response)
             
-            if not epg_response.get("success", True) or not epg_response.get("items"):
-                logger.error(f"Chyba při hledání pořadu v EPG: {epg_response.get('errorMessage', 'Pořad nebyl nalezen')}")
-                return None
+            if not epg_response.get("success", True):
+                return self._rejected("epg", epg_response, "Chyba při hledání pořadu v EPG", http_response.status_code)
+            if not epg_response.get("items"):
+                logger.error("Pořad nebyl nalezen v EPG")
+                return UpstreamError(ERROR_NOT_FOUND, "Pořad nebyl nalezen v EPG", "epg")
                 
             # Hledání pořadu, který odpovídá časovému rozsahu
             schedule_id = None
@@ -611,24 +1097,24 @@ class MagentaTV:
             
             if not schedule_id:
                 logger.error("Pořad nebyl nalezen v EPG")
-                return None
+                return UpstreamError(ERROR_NOT_FOUND, "Pořad nebyl nalezen v EPG", "epg")
             
             # Získání URL streamu
-            return self.get_catchup_url(schedule_id)
+            return self.get_catchup_url(schedule_id, quality)
             
         except Exception as e:
-            logger.error(f"Chyba při získání catchup podle času: {e}")
-            return None
+            return self._failed("epg", e, "Chyba při získání catchup podle času")
 
+    @traced("magenta.get_devices")
     def get_devices(self):
         """
         Získání seznamu registrovaných zařízení
         
         Returns:
-            list: Seznam zařízení s jejich ID a názvy
+            list: Seznam zařízení (Device) s jejich ID a názvy nebo UpstreamError
         """
         if not self.refresh_access_token():
-            return []
+            return self._auth_error()
             
         headers = {
             "Authorization": f"Bearer {self.access_token}",
@@ -637,7 +1123,8 @@ class MagentaTV:
         }
         
         try:
-            response = self.session.get(
+            response = self._request(
+                "devices", "GET",
                 f"{self.base_url}/v2/home/my-devices",
                 headers=headers,
                 timeout=30
@@ -647,37 +1134,35 @@ class MagentaTV:
             
             # Aktuální zařízení
             if "thisDevice" in response:
-                devices.append({
-                    "id": response["thisDevice"]["id"],
-                    "name": response["thisDevice"]["name"],
-                    "type": "current",
-                    "is_this_device": True
-                })
+                devices.append(Device(
+                    id=response["thisDevice"]["id"],
+                    name=response["thisDevice"]["name"],
+                    type="current",
+                    is_this_device=True
+                ))
             
             # Mobilní zařízení
             for device in response.get("smallScreenDevices", []):
-                devices.append({
-                    "id": device["id"],
-                    "name": device["name"],
-                    "type": "mobile",
-                    "is_this_device": False
-                })
+                devices.append(Device(
+                    id=device["id"],
+                    name=device["name"],
+                    type="mobile"
+                ))
             
             # STB a TV zařízení
             for device in response.get("stbAndBigScreenDevices", []):
-                devices.append({
-                    "id": device["id"],
-                    "name": device["name"],
-                    "type": "stb",
-                    "is_this_device": False
-                })
+                devices.append(Device(
+                    id=device["id"],
+                    name=device["name"],
+                    type="stb"
+                ))
                 
             return devices
             
         except Exception as e:
-            logger.error(f"Chyba při získání seznamu zařízení: {e}")
-            return []
+            return self._failed("devices", e, "Chyba při získání seznamu zařízení")
 
+    @traced("magenta.delete_device")
     def delete_device(self, device_id):
         """
         Odstranění zařízení podle ID
@@ -686,10 +1171,10 @@ class MagentaTV:
             device_id (str): ID zařízení
             
         Returns:
-            bool: True v případě úspěšného odstranění, jinak False
+            bool: True v případě úspěšného odstranění, jinak UpstreamError
         """
         if not self.refresh_access_token():
-            return False
+            return self._auth_error()
             
         headers = {
             "Authorization": f"Bearer {self.access_token}",
@@ -698,68 +1183,78 @@ class MagentaTV:
         }
         
         try:
-            response = self.session.get(
+            http_response = self._request(
+                "delete-device", "GET",
                 f"{self.base_url}/home/deleteDevice",
                 params={"id": device_id},
                 headers=headers,
                 timeout=30
-            ).json()
+            )
+            response = decode_response(http_response)
             
             if response.get("success", False):
                 logger.info(f"Zařízení s ID {device_id} bylo úspěšně odstraněno")
                 return True
-            else:
-                logger.error(f"Chyba při odstraňování zařízení: {response.get('errorMessage', 'Neznámá chyba')}")
-                return False
+            return self._rejected("delete-device", response, "Chyba při odstraňování zařízení", http_response.status_code)
                 
         except Exception as e:
-            logger.error(f"Chyba při odstraňování zařízení: {e}")
-            return False
+            return self._failed("delete-device", e, "Chyba při odstraňování zařízení")
 
-    def generate_m3u_playlist(self, server_url=""):
+    @traced("magenta.generate_m3u_playlist")
+    def generate_m3u_playlist(self, server_url="", image_url=None):
         """
         Vygenerování M3U playlistu pro použití v IPTV přehrávačích
         
         Args:
             server_url (str): URL serveru pro přesměrování
+            image_url (callable, optional): Přepis URL log, např. na lokální cache obrázků
             
         Returns:
-            str: Obsah M3U playlistu
+            str: Obsah M3U playlistu, None pro prázdný seznam kanálů nebo UpstreamError
         """
+        # Sestavení playlistu má přednost před synchronizací EPG,
+        # ale nesmí zdržovat přepínání kanálů
+        with request_priority(PRIORITY_NORMAL):
+            return self._generate_m3u_playlist(server_url, image_url)
+
+    def _generate_m3u_playlist(self, server_url, image_url):
         channels = self.get_channels()
         if not channels:
-            return ""
+            return channels if is_error(channels) else None
             
         playlist = "#EXTM3U\n"
         
-        for channel in channels:
-            channel_id = channel["id"]
-            name = channel["name"].replace(" HD", "")
-            group = channel["group"]
-            logo = channel["logo"]
-            has_archive = channel["has_archive"]
-            
-            # Zápis informací o kanálu
-            playlist += f'#EXTINF:-1 tvg-id="{channel_id}" tvg-name="{name}" group-title="{group}"'
-            
-            # Přidání informací o archivu, pokud je dostupný
-            if has_archive and server_url:
-                playlist += f' catchup="default" catchup-source="{server_url}/api/catchup/{channel_id}/' + '${start}-${end}' + '" catchup-days="7"'
-            
-            # Přidání loga, pokud je dostupné
-            if logo:
-                playlist += f' tvg-logo="{logo}"'
+        with hot_timer("playlist_build"):
+            for channel in channels:
+                channel_id = channel.id
+                name = channel.name.replace(" HD", "")
+                group = channel.group
+                logo = channel.logo
+                has_archive = channel.has_archive
                 
-            playlist += f',{name}\n'
-            
-            # URL pro streamování
-            if server_url:
-                playlist += f'{server_url}/api/stream/{channel_id}?redirect=1\n'
-            else:
-                stream_info = self.get_stream_url(channel_id)
-                if stream_info:
-                    playlist += f'{stream_info["url"]}\n'
-                else:
-                    playlist += f'http://127.0.0.1/error.m3u8\n'
+                # Zápis informací o kanálu
+                playlist += f'#EXTINF:-1 tvg-id="{channel_id}" tvg-name="{name}" group-title="{group}"'
                 
+                # Přidání informací o archivu, pokud je dostupný
+                if has_archive and server_url:
+                    playlist += f' catchup="default" catchup-source="{server_url}/api/catchup/{channel_id}/' + '${start}-${end}' + '" catchup-days="7"'
+                
+                # Přidání loga, pokud je dostupné
+                if logo:
+                    if image_url is not None:
+                        logo = image_url(logo)
+                    playlist += f' tvg-logo="{logo}"'
+                
+                playlist += f',{name}\n'
+                
+                # URL pro streamování
+                if server_url:
+                    playlist += f'{server_url}/api/stream/{channel_id}?redirect=1\n'
+                else:
+                    stream_info = self.get_stream_url(channel_id)
+                    if stream_info:
+                        playlist += f'{stream_info.url}\n'
+                    else:
+                        playlist += f'http://127.0.0.1/error.m3u8\n'
+        
         return playlist
\ No newline at end of file
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Playback session tracking
+
+An in-memory table of what is being watched right now. Sessions are
+opened by the stream and catchup routes (also with redirect=1, as used
+by the M3U playlist) and kept alive by heartbeats: every repeated stream
+or redirect request of the same client and channel, and every segment a
+player fetches through the proxy. Players that fetch streams directly
+from the CDN are counted until PLAYBACK_SESSION_TIMEOUT after their last
+stream request.
+
+Sessions are keyed by client, kind and channel, so a client identifier
+shared by several players (e.g. behind one NAT with the same User-Agent)
+can hold several concurrent streams.
+"""
+import threading
+import time
+
+KIND_LIVE = "live"
+KIND_CATCHUP = "catchup"
+
+
+def _url_prefix(url):
+    """Stream URL without the scheme and the file name, shared by its segments"""
+    return url.split("://", 1)[-1].rsplit("/", 1)[0]
+
+
+class PlaybackTracker:
+    """
+    Active playback sessions by client
+    """
+    def __init__(self, session_timeout=300, stream_limit=0):
+        """
+        Args:
+            session_timeout (int): Seconds without a heartbeat before a session ends
+            stream_limit (int): Concurrent streams allowed by the provider (0 = unknown)
+        """
+        self.session_timeout = session_timeout
+        self.stream_limit = stream_limit
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.stats = {"started": 0, "heartbeats": 0, "expired": 0}
+
+    def start(self, client_id, channel_id, kind=KIND_LIVE, account=None, language=None, quality=None, url=None):
+        """
+        Open a session, or refresh it if the client already plays the channel
+
+        Args:
+            client_id (str): Client identifier
+            channel_id (str): Channel ID
+            kind (str): KIND_LIVE or KIND_CATCHUP
+            account (str, optional): Account serving the stream ("*" if any)
+            language (str, optional): Language
+            quality (str, optional): Stream quality
+            url (str, optional): Stream URL, used to match proxied segments
+        """
+        now = time.time()
+        key = (kind, str(channel_id))
+        with self._lock:
+            client_sessions = self._sessions.setdefault(client_id, {})
+            previous = client_sessions.get(key)
+            active = previous is not None and not self._expired(previous, now)
+            client_sessions[key] = {
+                "client": client_id,
+                "channel_id": str(channel_id),
+                "kind": kind,
+                "account": account or "*",
+                "language": language,
+                "quality": quality,
+                "url_prefix": _url_prefix(url) if url else None,
+                "started": previous["started"] if active else now,
+                "last_seen": now
+            }
+            self.stats["heartbeats" if active else "started"] += 1
+
+    def heartbeat(self, client_id, url=None):
+        """
+        Keep the sessions of a client alive, called for proxied requests
+
+        Args:
+            client_id (str): Client identifier
+            url (str, optional): Proxied URL, only the session of that stream is refreshed
+
+        Returns:
+            bool: True if a session of the client was refreshed
+        """
+        now = time.time()
+        prefix = _url_prefix(url) if url else None
+        refreshed = False
+        with self._lock:
+            for session in self._sessions.get(client_id, {}).values():
+                # Segments of another stream (e.g. a direct URL opened earlier) do not count
+                if prefix and session["url_prefix"] and not prefix.startswith(session["url_prefix"]):
+                    continue
+                session["last_seen"] = now
+                refreshed = True
+            if refreshed:
+                self.stats["heartbeats"] += 1
+        return refreshed
+
+    def _expired(self, session, now):
+        return now - session["last_seen"] > self.session_timeout
+
+    def sessions(self):
+        """
+        Active sessions, expired ones are removed
+
+        Returns:
+            list: Session dictionaries, newest first
+        """
+        now = time.time()
+        active = []
+        with self._lock:
+            for client_id, client_sessions in list(self._sessions.items()):
+                for key, session in list(client_sessions.items()):
+                    if self._expired(session, now):
+                        del client_sessions[key]
+                        self.stats["expired"] += 1
+                    else:
+                        active.append(dict(session))
+                if not client_sessions:
+                    del self._sessions[client_id]
+
+        for session in active:
+            session.pop("url_prefix")
+            session["duration"] = int(now - session["started"])
+            session["idle"] = int(now - session["last_seen"])
+        return sorted(active, key=lambda session: session["started"], reverse=True)
+
+    def counts(self, sessions=None):
+        """
+        Concurrent streams by channel, client, account and kind
+
+        Args:
+            sessions (list, optional): Result of sessions(), read if not given
+
+        Returns:
+            dict: Counts
+        """
+        if sessions is None:
+            sessions = self.sessions()
+
+        counts = {"total": len(sessions), "channels": {}, "clients": {}, "accounts": {}, "kinds": {}}
+        for session in sessions:
+            for group, value in (("channels", session["channel_id"]), ("clients", session["client"]),
+                                 ("accounts", session["account"]), ("kinds", session["kind"])):
+                counts[group][value] = counts[group].get(value, 0) + 1
+        return counts
+
+    def hot_channels(self):
+        """
+        Channels being watched, most viewers first
+
+        Returns:
+            list: Channel IDs
+        """
+        channels = self.counts()["channels"]
+        return sorted(channels, key=channels.get, reverse=True)
+
+    def gauge_values(self):
+        """Session counts by (kind, account) for the metrics gauge"""
+        values = {}
+        for session in self.sessions():
+            key = (session["kind"], session["account"])
+            values[key] = values.get(key, 0) + 1
+        return values
+
+    def status(self):
+        """
+        Get tracker state
+
+        Returns:
+            dict: Sessions, counts, stream limit usage and counters
+        """
+        sessions = self.sessions()
+        counts = self.counts(sessions)
+        return {
+            "sessions": sessions,
+            "counts": counts,
+            "stream_limit": self.stream_limit or None,
+            "limit_usage": round(counts["total"] / self.stream_limit, 2) if self.stream_limit else None,
+            "stats": dict(self.stats)
+        }
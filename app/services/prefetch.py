@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background cache prefetching
+
+Warms cache entries that clients are likely to request next (e.g. the
+next-lower stream quality an adaptive player falls back to). Prefetches
+run on a small thread pool at prefetch priority: their upstream requests
+are sent only when the rate limiter has spare tokens and are dropped
+otherwise. Prefetches are also dropped when the queue is full.
+"""
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from app.cache import get_from_cache, is_cached
+from app.services.rate_limiter import request_priority, PRIORITY_PREFETCH
+from app.services.results import is_error
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Bounded background warming of cache entries
+    """
+    def __init__(self, app, workers=2, max_pending=100):
+        """
+        Args:
+            app (Flask): Application, prefetches run in its context
+            workers (int): Concurrent prefetches
+            max_pending (int): Queued prefetches, further ones are dropped
+        """
+        self.app = app
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "skipped": 0, "dropped": 0, "fetched": 0, "failed": 0}
+
+    def submit(self, cache_key, fetch_function, *args, tags=(), **kwargs):
+        """
+        Fetch a cache entry in the background unless it is cached or queued
+
+        Args:
+            cache_key (str): Cache key
+            fetch_function (callable): Function to get the data
+            *args: Arguments for the fetch function
+            tags (iterable): Tags of the entry
+            **kwargs: Keyword arguments for the fetch function
+
+        Returns:
+            bool: True if the prefetch was queued
+        """
+        with self._lock:
+            if cache_key in self._pending or is_cached(cache_key):
+                self.stats["skipped"] += 1
+                return False
+            if len(self._pending) >= self.max_pending:
+                self.stats["dropped"] += 1
+                return False
+            self._pending.add(cache_key)
+            self.stats["submitted"] += 1
+
+        self._executor.submit(self._run, cache_key, fetch_function, args, kwargs, tags)
+        return True
+
+    def _run(self, cache_key, fetch_function, args, kwargs, tags):
+        try:
+            with self.app.app_context(), request_priority(PRIORITY_PREFETCH):
+                result = get_from_cache(cache_key, fetch_function, *args, tags=tags, **kwargs)
+            self.stats["failed" if result is None or is_error(result) else "fetched"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.warning(f"Prefetch of {cache_key} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(cache_key)
+
+    def status(self):
+        """
+        Get prefetcher state
+
+        Returns:
+            dict: Queued prefetches and counters
+        """
+        with self._lock:
+            return {"pending": len(self._pending), **self.stats}
+
+    def shutdown(self):
+        """Stop the worker threads, queued prefetches are dropped"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
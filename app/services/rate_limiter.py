@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upstream rate limiter with priority classes
+
+A token bucket shared by all requests of one MagentaTV client. When the
+bucket is empty, requests wait in a queue ordered by priority, so
+interactive requests (stream URLs) are sent before queued normal and
+background work (playlist builds, EPG synchronization).
+
+Prefetches never wait: they are sent only while the bucket holds more
+than half of its burst and nobody is queued, and are dropped otherwise,
+so speculative work cannot delay requests of real clients.
+
+The priority is taken from the calling thread, see request_priority.
+
+The limiter is off by default (UPSTREAM_RATE_LIMIT 0) and meant for
+deployments with a known upstream budget. Every client request costs
+upstream requests, e.g. a zap to a channel whose stream URL is not
+cached costs two (stream-url and the redirect). With a limit of 10
+requests/s and a burst of 20, one client key serves about 5 uncached
+zaps per second sustained and 10 in a burst; cached streams cost nothing.
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_PREFETCH = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_BACKGROUND: "background",
+    PRIORITY_PREFETCH: "prefetch"
+}
+
+_local = threading.local()
+
+
+class RateLimitedError(requests.RequestException):
+    """
+    Raised when a request waited too long for the rate limiter
+    """
+
+
+@contextmanager
+def request_priority(priority):
+    """
+    Set the priority of upstream requests made by the current thread
+
+    Args:
+        priority (int): PRIORITY_INTERACTIVE, PRIORITY_NORMAL or PRIORITY_BACKGROUND
+    """
+    previous = getattr(_local, "priority", None)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority(default=PRIORITY_NORMAL):
+    """
+    Priority of the current thread
+
+    Args:
+        default (int): Priority used if the thread did not set one
+
+    Returns:
+        int: Priority
+    """
+    priority = getattr(_local, "priority", None)
+    return default if priority is None else priority
+
+
+class RateLimiter:
+    """
+    Token bucket with a priority-ordered wait queue
+    """
+    def __init__(self, rate, burst=None, max_wait=30):
+        """
+        Args:
+            rate (float): Sustained requests per second
+            burst (int, optional): Bucket size, defaults to one second of requests
+            max_wait (float): Maximum time a request waits in the queue, in seconds
+        """
+        self.rate = rate
+        self.burst = max(1, burst or int(rate))
+        self.max_wait = max_wait
+
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._waiting = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+        self.stats = {
+            name: {"granted": 0, "queued": 0, "wait_time": 0.0, "timeouts": 0}
+            for name in PRIORITY_NAMES.values()
+        }
+
+    def configure(self, rate, burst=None):
+        """
+        Change the limits, queued requests keep their place
+
+        Args:
+            rate (float): Sustained requests per second
+            burst (int, optional): Bucket size, defaults to one second of requests
+        """
+        with self._condition:
+            self._refill(time.monotonic())
+            self.rate = rate
+            self.burst = max(1, burst or int(rate))
+            self.tokens = min(self.tokens, self.burst)
+            self._condition.notify_all()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority=PRIORITY_NORMAL):
+        """
+        Wait for a request slot
+
+        Args:
+            priority (int): Request priority
+
+        Returns:
+            float: Seconds spent waiting, or None if max_wait was exceeded
+                or a prefetch found no spare token
+        """
+        stats = self.stats[PRIORITY_NAMES[priority]]
+        if priority == PRIORITY_PREFETCH:
+            return self._acquire_spare(stats)
+
+        entry = (priority, next(self._counter))
+
+        with self._condition:
+            start = time.monotonic()
+            deadline = start + self.max_wait
+            queued = False
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    first = self._waiting[0] == entry
+                    if first and self.tokens >= 1:
+                        self.tokens -= 1
+                        waited = now - start if queued else 0.0
+                        stats["granted"] += 1
+                        if queued:
+                            stats["queued"] += 1
+                            stats["wait_time"] += waited
+                        return waited
+                    if now >= deadline:
+                        stats["timeouts"] += 1
+                        return None
+                    # The first in the queue waits for the next token,
+                    # the others until they move up
+                    wait = (1 - self.tokens) / self.rate if first else deadline - now
+                    self._condition.wait(min(wait, deadline - now))
+                    queued = True
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def _acquire_spare(self, stats):
+        """Take a token for a prefetch without waiting, keeping half of the burst for clients"""
+        with self._condition:
+            self._refill(time.monotonic())
+            if self._waiting or self.tokens < 1 + self.burst / 2:
+                stats["timeouts"] += 1
+                return None
+            self.tokens -= 1
+            stats["granted"] += 1
+            return 0.0
+
+    def status(self):
+        """
+        Get limiter state
+
+        Returns:
+            dict: Configuration, queue length and statistics by priority
+        """
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": round(self.tokens, 2),
+                "queued": len(self._waiting),
+                "priorities": {
+                    name: {
+                        "granted": stats["granted"],
+                        "queued": stats["queued"],
+                        "avg_wait_ms": round(stats["wait_time"] * 1000 / stats["queued"], 2) if stats["queued"] else 0,
+                        "timeouts": stats["timeouts"]
+                    }
+                    for name, stats in self.stats.items()
+                }
+            }
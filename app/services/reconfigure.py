@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Hot configuration reload
+
+Applies configuration changes to the running application with scoped
+effects, so tuning does not require a restart and keeps warm caches:
+
+- quality: running clients switch quality, only playlists with direct
+  stream URLs are dropped (stream and catchup keys include the quality)
+- cache timeout: existing entries are moved to the new timeout
+- credentials, accounts, language, API address: only the affected
+  clients are replaced, their stream URLs are dropped
+- redirect, rate limit and circuit breaker settings: running clients
+  are updated in place
+- EPG sync: the worker is started, stopped or updated
+
+Settings that are read on every use (timezone, tracing, access log, ...)
+take effect by updating app.config. Server settings need a restart.
+
+Values must be validated first (app.config.validate_config). If an
+effect fails, the previous values are restored and the effects that
+already ran are undone in reverse order.
+"""
+import logging
+
+from app.cache import clear_prefix, invalidate, make_key, rescale_expiry
+from app.config import DEFAULT_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Settings of the MagentaTV clients that can be changed in place
+CLIENT_SETTINGS = (
+    "QUALITY", "STREAM_REDIRECT_MODE", "STREAM_REDIRECT_CACHE_TIMEOUT",
+    "CIRCUIT_FAILURE_THRESHOLD", "CIRCUIT_RESET_TIMEOUT", "UPSTREAM_MIN_TIMEOUT",
+    "UPSTREAM_RATE_LIMIT", "UPSTREAM_BURST"
+)
+
+# Settings that define which clients exist and how they log in
+ACCOUNT_SETTINGS = ("USERNAME", "PASSWORD", "LANGUAGE", "ACCOUNTS", "API_BASE_URL")
+
+EPG_SYNC_SETTINGS = (
+    "EPG_SYNC_ENABLED", "EPG_SYNC_DAYS_BACK", "EPG_SYNC_DAYS_FORWARD", "EPG_SYNC_INTERVAL",
+    "EPG_SYNC_SHARD_SIZE", "EPG_SYNC_WORKERS", "EPG_SYNC_JITTER"
+)
+
+# Settings used only when the server starts
+RESTART_SETTINGS = ("HOST", "PORT", "DATA_DIR", "DEVICE_ID", "PREFETCH_WORKERS", "DEBUG")
+
+
+def apply_config(app, new_config):
+    """
+    Apply configuration changes to the running application
+
+    Args:
+        app (Flask): Application instance
+        new_config (dict): Validated configuration values, keys in any case
+
+    Returns:
+        dict: Changed keys, keys that need a restart and applied effects
+
+    Raises:
+        Exception: Error of a failed effect, after the previous values were restored
+    """
+    changes = {}
+    for key, value in new_config.items():
+        key = key.upper()
+        if key in DEFAULT_CONFIG and app.config.get(key) != value:
+            changes[key] = value
+
+    restart_required = sorted(key for key in changes if key in RESTART_SETTINGS)
+    changes = {key: value for key, value in changes.items() if key not in RESTART_SETTINGS}
+    previous = {key: app.config.get(key) for key in changes}
+    app.config.update(changes)
+
+    effects = []
+    applied = []
+    try:
+        for keys, step in _EFFECTS:
+            if any(key in keys for key in changes):
+                effect = step(app, changes, previous)
+                applied.append(step)
+                if effect:
+                    effects.append(effect)
+    except Exception:
+        logger.exception(f"Failed to apply configuration {', '.join(sorted(changes))}, restoring previous values")
+        app.config.update(previous)
+        # Only effects that ran are undone, latest first
+        for step in reversed(applied):
+            try:
+                step(app, previous, changes)
+            except Exception:
+                logger.exception(f"Failed to undo {step.__name__}")
+        raise
+
+    if changes:
+        logger.info(f"Configuration applied: {', '.join(sorted(changes))}")
+    return {"changed": sorted([*changes, *restart_required]), "restart_required": restart_required, "effects": effects}
+
+
+# Effect steps below are called as step(app, changes, previous) with the new
+# values already in app.config, and undone by calling them with the two
+# swapped. They return a description of the effect or None.
+
+def _apply_accounts(app, changes, previous):
+    """Replace the clients whose account settings changed"""
+    replaced = app.extensions["client_pool"].reconfigure()
+    for client_key in replaced:
+        # Stream URLs are signed for the account that resolved them
+        language = client_key.split("/", 1)[1]
+        for namespace in ("stream", "catchup"):
+            clear_prefix(make_key(namespace, client_key, ""))
+            clear_prefix(make_key(namespace, f"*/{language}", ""))
+    return f"replaced clients: {', '.join(replaced)}" if replaced else None
+
+
+def _apply_client_settings(app, changes, previous):
+    """Update the settings of running clients in place"""
+    config = app.config
+    for client in app.extensions["client_pool"].clients():
+        client.update_settings(
+            quality=config["QUALITY"],
+            redirect_mode=config["STREAM_REDIRECT_MODE"],
+            redirect_cache_timeout=config["STREAM_REDIRECT_CACHE_TIMEOUT"],
+            breaker_settings={
+                "failure_threshold": config["CIRCUIT_FAILURE_THRESHOLD"],
+                "reset_timeout": config["CIRCUIT_RESET_TIMEOUT"],
+                "min_timeout": config["UPSTREAM_MIN_TIMEOUT"]
+            },
+            rate_limit=config["UPSTREAM_RATE_LIMIT"],
+            rate_burst=config["UPSTREAM_BURST"]
+        )
+    return "updated client settings"
+
+
+def _apply_quality(app, changes, previous):
+    """Drop playlists with direct stream URLs in the default quality"""
+    return f"cleared {invalidate('quality')} default-quality cache entries"
+
+
+def _apply_cache_timeout(app, changes, previous):
+    """Move existing cache entries to the new timeout"""
+    rescale_expiry(previous["CACHE_TIMEOUT"], changes["CACHE_TIMEOUT"])
+    return "rescaled cache expiry"
+
+
+def _apply_image_cache(app, changes, previous):
+    """Update the age limit of stored images"""
+    app.extensions["image_cache"].max_age = app.config["IMAGE_CACHE_MAX_AGE"]
+    return "updated image cache"
+
+
+def _apply_playback(app, changes, previous):
+    """Update the playback session timeout and stream limit"""
+    playback = app.extensions["playback"]
+    playback.session_timeout = app.config["PLAYBACK_SESSION_TIMEOUT"]
+    playback.stream_limit = app.config["PLAYBACK_STREAM_LIMIT"]
+    return "updated playback tracking"
+
+
+def _apply_epg_sync(app, changes, previous):
+    """Start, stop or update the EPG sync worker"""
+    from app.services.epg_sync import EPGSyncWorker
+
+    worker = app.extensions.get("epg_sync")
+    if not app.config["EPG_SYNC_ENABLED"]:
+        if worker is None:
+            return "EPG sync not running"
+        worker.stop()
+        del app.extensions["epg_sync"]
+        return "stopped EPG sync"
+
+    if worker is None:
+        worker = EPGSyncWorker.from_config(app)
+        app.extensions["epg_sync"] = worker
+        worker.start()
+        return "started EPG sync"
+
+    worker.configure(app.config)
+    return "updated EPG sync"
+
+
+# Settings and their effect steps, in the order they are applied
+_EFFECTS = (
+    (ACCOUNT_SETTINGS, _apply_accounts),
+    (CLIENT_SETTINGS, _apply_client_settings),
+    (("QUALITY",), _apply_quality),
+    (("CACHE_TIMEOUT",), _apply_cache_timeout),
+    (("IMAGE_CACHE_MAX_AGE",), _apply_image_cache),
+    (("PLAYBACK_SESSION_TIMEOUT", "PLAYBACK_STREAM_LIMIT"), _apply_playback),
+    (EPG_SYNC_SETTINGS, _apply_epg_sync)
+)
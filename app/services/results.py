@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Typed error results of the MagentaTV client
+
+Client methods return their value on success and an UpstreamError on
+failure instead of a bare None, so callers can tell why a call failed:
+
+- timeout: the upstream API did not answer in time
+- auth_expired: the token was refused or could not be refreshed
+- rejected: the API answered with success=false
+- not_found: the requested channel, program or schedule does not exist
+- unavailable: transport error, server error, open circuit or rate limit
+- invalid: the request itself is invalid (e.g. a non-numeric ID)
+
+UpstreamError is falsy, so existing "if not result" checks keep working.
+The cache caches not_found negatively for a short time and never caches
+transient errors (see app.cache.get_from_cache).
+"""
+import re
+
+import requests
+
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.rate_limiter import RateLimitedError
+
+ERROR_TIMEOUT = "timeout"
+ERROR_AUTH_EXPIRED = "auth_expired"
+ERROR_REJECTED = "rejected"
+ERROR_NOT_FOUND = "not_found"
+ERROR_UNAVAILABLE = "unavailable"
+ERROR_INVALID = "invalid"
+
+# Errors that may go away on retry - never cached, stale data is served instead
+TRANSIENT_ERRORS = frozenset((ERROR_TIMEOUT, ERROR_AUTH_EXPIRED, ERROR_UNAVAILABLE))
+
+# HTTP status of API responses for each error kind
+ERROR_STATUS = {
+    ERROR_TIMEOUT: 504,
+    ERROR_AUTH_EXPIRED: 503,
+    ERROR_REJECTED: 502,
+    ERROR_NOT_FOUND: 404,
+    ERROR_UNAVAILABLE: 503,
+    ERROR_INVALID: 400
+}
+
+# Error kinds of HTTP statuses that identify the failure on their own
+_STATUS_KINDS = {
+    401: ERROR_AUTH_EXPIRED,
+    403: ERROR_AUTH_EXPIRED,
+    404: ERROR_NOT_FOUND,
+    410: ERROR_NOT_FOUND,
+    408: ERROR_TIMEOUT,
+    429: ERROR_UNAVAILABLE,
+    504: ERROR_TIMEOUT
+}
+
+# Upstream errorCode values, compared case-insensitively as whole codes
+_CODE_KINDS = {
+    "NOT_FOUND": ERROR_NOT_FOUND,
+    "CHANNEL_NOT_FOUND": ERROR_NOT_FOUND,
+    "PROGRAM_NOT_FOUND": ERROR_NOT_FOUND,
+    "SCHEDULE_NOT_FOUND": ERROR_NOT_FOUND,
+    "ITEM_NOT_FOUND": ERROR_NOT_FOUND,
+    "UNAUTHORIZED": ERROR_AUTH_EXPIRED,
+    "INVALID_TOKEN": ERROR_AUTH_EXPIRED,
+    "TOKEN_EXPIRED": ERROR_AUTH_EXPIRED,
+    "ACCESS_TOKEN_EXPIRED": ERROR_AUTH_EXPIRED
+}
+
+# Last resort for responses without a status or code: whole phrases of the message
+_MESSAGE_KINDS = (
+    (re.compile(r"\b(not found|does not exist|neexistuje)\b", re.IGNORECASE), ERROR_NOT_FOUND),
+    (re.compile(r"\b(token (has )?expired|invalid (access )?token|unauthori[sz]ed)\b", re.IGNORECASE), ERROR_AUTH_EXPIRED)
+)
+
+
+class UpstreamError:
+    """
+    Failed upstream call
+    """
+    __slots__ = ("kind", "message", "endpoint")
+
+    def __init__(self, kind, message="", endpoint=None):
+        """
+        Args:
+            kind (str): Error kind (ERROR_*)
+            message (str): Description
+            endpoint (str, optional): Upstream endpoint that failed
+        """
+        self.kind = kind
+        self.message = message
+        self.endpoint = endpoint
+
+    def __bool__(self):
+        return False
+
+    def __eq__(self, other):
+        return isinstance(other, UpstreamError) and (self.kind, self.endpoint) == (other.kind, other.endpoint)
+
+    def __hash__(self):
+        return hash((self.kind, self.endpoint))
+
+    def __repr__(self):
+        return f"UpstreamError({self.kind!r}, {self.message!r}, endpoint={self.endpoint!r})"
+
+    @property
+    def transient(self):
+        """True if a retry may succeed"""
+        return self.kind in TRANSIENT_ERRORS
+
+    @property
+    def status_code(self):
+        """HTTP status for API responses"""
+        return ERROR_STATUS.get(self.kind, 500)
+
+    def to_dict(self):
+        """Convert to dictionary representation"""
+        return {"kind": self.kind, "message": self.message, "endpoint": self.endpoint}
+
+
+def is_error(value):
+    """Check whether a client result is an UpstreamError"""
+    return isinstance(value, UpstreamError)
+
+
+def error_from_exception(error, endpoint=None):
+    """
+    Classify an exception raised by an upstream call
+
+    Args:
+        error (Exception): Raised exception
+        endpoint (str, optional): Upstream endpoint
+
+    Returns:
+        UpstreamError: Classified error
+    """
+    if isinstance(error, requests.Timeout):
+        kind = ERROR_TIMEOUT
+    elif isinstance(error, (CircuitOpenError, RateLimitedError, requests.RequestException)):
+        # Includes undecodable responses, e.g. an HTML error page
+        kind = ERROR_UNAVAILABLE
+    elif isinstance(error, (KeyError, TypeError, ValueError)):
+        # Unexpected response structure
+        kind = ERROR_REJECTED
+    else:
+        kind = ERROR_UNAVAILABLE
+    return UpstreamError(kind, str(error) or type(error).__name__, endpoint)
+
+
+def decode_response(response):
+    """
+    Decode the JSON body of an API response
+
+    Error responses without a JSON body (e.g. an HTML error page) decode
+    as a failed response, so they are classified by their HTTP status.
+
+    Args:
+        response (requests.Response): API response
+
+    Returns:
+        dict: Decoded body
+
+    Raises:
+        ValueError: If a successful response is not JSON
+    """
+    try:
+        return response.json()
+    except ValueError:
+        if response.status_code >= 400:
+            return {"success": False, "errorMessage": f"HTTP {response.status_code}"}
+        raise
+
+
+def error_from_response(data, endpoint=None, status=None):
+    """
+    Classify an API response with success=false
+
+    The HTTP status decides first, then the errorCode field. The message
+    text is only matched as a last resort, against whole phrases.
+
+    Args:
+        data (dict): Decoded response
+        endpoint (str, optional): Upstream endpoint
+        status (int, optional): HTTP status of the response
+
+    Returns:
+        UpstreamError: Classified error, rejected if nothing identifies it
+    """
+    message = data.get("errorMessage") or "Unknown error"
+    code = str(data.get("errorCode") or "").strip().upper()
+
+    kind = _STATUS_KINDS.get(status)
+    if kind is None and status is not None and status >= 500:
+        kind = ERROR_UNAVAILABLE
+    if kind is None:
+        kind = _CODE_KINDS.get(code)
+    if kind is None and not code:
+        kind = next((kind for pattern, kind in _MESSAGE_KINDS if pattern.search(message)), None)
+    return UpstreamError(kind or ERROR_REJECTED, message, endpoint)
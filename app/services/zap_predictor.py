@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Channel-zap prediction
+
+After a client tunes to a channel it usually zaps to the next or previous
+channel in the playlist, or back to one of the channels it watches most.
+The predictor remembers what each client watches and names the channels
+whose stream URLs are worth resolving in advance, so the next zap is a
+cache hit. The API routes feed it, with the playlist order from the
+channel registry, and hand the predictions to the prefetcher.
+"""
+import threading
+from collections import Counter, OrderedDict
+
+# Clients whose viewing history is kept, the least recently seen are dropped
+MAX_CLIENTS = 1000
+
+
+class ZapPredictor:
+    """
+    Predicts the next channels of a client from the playlist order and its history
+    """
+    def __init__(self, max_clients=MAX_CLIENTS):
+        """
+        Args:
+            max_clients (int): Clients whose history is kept
+        """
+        self.max_clients = max_clients
+        self._history = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"zaps": 0, "predicted": 0}
+
+    def record(self, client_id, channel_id):
+        """
+        Record that a client tuned to a channel
+
+        Args:
+            client_id (str): Client identifier
+            channel_id (str): Channel ID
+        """
+        with self._lock:
+            watched = self._history.get(client_id)
+            if watched is None:
+                watched = self._history[client_id] = Counter()
+                if len(self._history) > self.max_clients:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(client_id)
+            watched[str(channel_id)] += 1
+            self.stats["zaps"] += 1
+
+    def favourites(self, client_id, count):
+        """
+        Most watched channels of a client
+
+        Args:
+            client_id (str): Client identifier
+            count (int): Number of channels
+
+        Returns:
+            list: Channel IDs, most watched first
+        """
+        with self._lock:
+            watched = self._history.get(client_id)
+            return [channel_id for channel_id, _ in watched.most_common(count)] if watched else []
+
+    def predict(self, client_id, channel_id, order, neighbours=1, favourites=3):
+        """
+        Channels a client is likely to zap to next
+
+        Args:
+            client_id (str): Client identifier
+            channel_id (str): Channel the client just tuned to
+            order (tuple): Channel order from ChannelRegistry.order
+            neighbours (int): Channels on each side in the playlist
+            favourites (int): Most watched channels of the client
+
+        Returns:
+            list: Channel IDs, most likely first, without the current channel
+        """
+        channel_id = str(channel_id)
+        ids, positions = order
+        candidates = []
+
+        position = positions.get(channel_id)
+        if position is not None:
+            for distance in range(1, neighbours + 1):
+                # Zapping up is more common than down
+                candidates.append(ids[(position + distance) % len(ids)])
+                candidates.append(ids[(position - distance) % len(ids)])
+
+        # One extra favourite, the current channel is usually among them
+        candidates.extend(self.favourites(client_id, favourites + 1))
+
+        predicted = [candidate for candidate in dict.fromkeys(candidates) if candidate != channel_id]
+        predicted = predicted[:2 * neighbours + favourites]
+        self.stats["predicted"] += len(predicted)
+        return predicted
+
+    def status(self):
+        """
+        Get predictor state
+
+        Returns:
+            dict: Tracked clients and counters
+        """
+        with self._lock:
+            return {"clients": len(self._history), **self.stats}
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time handling helpers for the MagentaTV backend
+
+EPG data is kept as UTC epoch seconds internally and only formatted
+when a response is built.
+"""
+import functools
+import logging
+from datetime import datetime, timezone
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # pragma: no cover - Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+logger = logging.getLogger(__name__)
+
+# Output formats
+DEFAULT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIME_FORMAT_ISO = "iso"
+
+
+@functools.lru_cache(maxsize=32)
+def get_timezone(name=None):
+    """
+    Resolve a timezone name
+
+    Args:
+        name (str, optional): IANA timezone name (e.g. "Europe/Prague") or None for UTC
+
+    Returns:
+        tzinfo: Timezone object, UTC if the name is unknown
+    """
+    if not name or name.upper() == "UTC" or ZoneInfo is None:
+        return timezone.utc
+
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError) as e:
+        logger.warning(f"Unknown timezone {name}, falling back to UTC: {e}")
+        return timezone.utc
+
+
+class TimestampFormatter:
+    """
+    Formats epoch timestamps for output
+
+    Program boundaries repeat a lot (the end of one program is the start
+    of the next one), so every distinct timestamp is converted only once.
+    """
+    __slots__ = ("_format", "_tz", "_memo")
+
+    def __init__(self, time_format=None, tz=None):
+        self._format = time_format or DEFAULT_TIME_FORMAT
+        self._tz = tz if tz is not None and not isinstance(tz, str) else get_timezone(tz)
+        self._memo = {}
+
+    def __call__(self, timestamp):
+        if timestamp is None:
+            return None
+
+        value = self._memo.get(timestamp)
+        if value is None:
+            dt = datetime.fromtimestamp(timestamp, self._tz)
+            if self._format == TIME_FORMAT_ISO:
+                value = dt.isoformat()
+            else:
+                value = dt.strftime(self._format)
+            self._memo[timestamp] = value
+
+        return value
+
+
+def utc_api_time(timestamp):
+    """
+    Format epoch seconds for the Magenta API filter syntax
+
+    Args:
+        timestamp (int): Unix timestamp
+
+    Returns:
+        str: UTC time in the form used by the API (e.g. 2025-04-15T08:00:00.000Z)
+    """
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight request tracing for the MagentaTV backend
+
+A trace is started for a request when it asks for one (trace=1 query
+parameter or X-Trace: 1 header) or when it is sampled (TRACE_SAMPLE_RATE).
+Spans recorded during the request are returned in the Server-Timing
+header and optionally logged as one JSON line per request.
+"""
+import functools
+import json
+import random
+import re
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# Characters not allowed in Server-Timing metric names
+_INVALID_NAME_CHARS = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class Trace:
+    """
+    Spans recorded during one request
+    """
+    __slots__ = ("trace_id", "start", "spans")
+
+    def __init__(self):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, start, end):
+        """
+        Record a finished span
+
+        Args:
+            name (str): Span name
+            start (float): perf_counter value at the start
+            end (float): perf_counter value at the end
+        """
+        self.spans.append((name, start - self.start, end - start))
+
+    def server_timing(self, total):
+        """
+        Build the Server-Timing header value
+
+        Spans with the same name are summed.
+
+        Args:
+            total (float): Total request time in seconds
+
+        Returns:
+            str: Header value
+        """
+        durations = {}
+        counts = {}
+        for name, _, duration in self.spans:
+            durations[name] = durations.get(name, 0) + duration
+            counts[name] = counts.get(name, 0) + 1
+
+        entries = [f"total;dur={total * 1000:.1f}"]
+        for name, duration in durations.items():
+            entry = f"{_INVALID_NAME_CHARS.sub('-', name)};dur={duration * 1000:.1f}"
+            if counts[name] > 1:
+                entry += f';desc="{counts[name]}x"'
+            entries.append(entry)
+        return ", ".join(entries)
+
+    def to_dict(self, total):
+        """Structured representation for logging"""
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(total * 1000, 2),
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                for name, offset, duration in self.spans
+            ]
+        }
+
+
+def current_trace():
+    """
+    Get the trace of the current request
+
+    Returns:
+        Trace: Active trace or None if the request isn't traced
+    """
+    if not has_request_context():
+        return None
+    return g.get("trace")
+
+
+@contextmanager
+def span(name):
+    """
+    Record a span for the block if the current request is traced
+
+    Args:
+        name (str): Span name
+    """
+    trace = current_trace()
+    if trace is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter())
+
+
+def traced(name):
+    """
+    Decorator recording a span for each call if the current request is traced
+
+    Args:
+        name (str): Span name
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = current_trace()
+            if trace is None:
+                return fn(*args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                trace.add(name, start, time.perf_counter())
+        return wrapper
+    return decorator
+
+
+def on_upstream_event(event, **data):
+    """MagentaTV client hook - one span per upstream HTTP request"""
+    if event != "request":
+        return
+
+    trace = current_trace()
+    if trace is not None:
+        end = time.perf_counter()
+        trace.add(f"upstream.{data['endpoint']}", end - data["duration"], end)
+
+
+def _before_request():
+    requested = request.args.get("trace") == "1" or request.headers.get("X-Trace") == "1"
+    sample_rate = current_app.config["TRACE_SAMPLE_RATE"]
+    if requested or (sample_rate and random.random() < sample_rate):
+        g.trace = Trace()
+
+
+def _after_request(response):
+    trace = g.pop("trace", None)
+    if trace is None:
+        return response
+
+    total = time.perf_counter() - trace.start
+    response.headers["Server-Timing"] = trace.server_timing(total)
+    response.headers["X-Trace-Id"] = trace.trace_id
+
+    if current_app.config["TRACE_LOG"]:
+        record = trace.to_dict(total)
+        record["route"] = request.url_rule.rule if request.url_rule is not None else request.path
+        record["status"] = response.status_code
+        logger.info(json.dumps(record))
+
+    return response
+
+
+def init_tracing(app):
+    """
+    Register tracing hooks
+
+    Args:
+        app (Flask): Application instance
+    """
+    from app.services.magenta_tv import MagentaTV
+
+    MagentaTV.add_hook(on_upstream_event)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    logger.debug("Tracing initialized")
@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the MagentaTV backend
+
+Run against a local stand-in of the Magenta TV API, see
+benchmarks.fake_magenta and benchmarks.run.
+"""
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in of the Magenta TV API
+
+Serves the endpoints used by MagentaTV (auth/init, auth/login,
+auth/tokens, home/categories, television/channels, television/epg,
+television/stream-url with a redirect, home/my-devices and
+home/deleteDevice) with realistic, deterministic payloads and a
+configurable injected latency. Upstream calls are counted per path.
+
+Usage:
+    python -m benchmarks.fake_magenta --port 8081 --latency 50
+"""
+import argparse
+import json
+import re
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("Zpravodajské", "Sport", "Filmy", "Dětské", "Dokumenty", "Hudba")
+
+# Program lengths cycled through, in seconds
+PROGRAM_LENGTHS = (1800, 2700, 3600, 5400)
+
+# Channel IDs above this value are unknown to the stand-in
+MAX_CHANNEL_ID = 100000
+
+_CHANNEL_FILTER = re.compile(r"channel\.id=in=\(([^)]*)\)|channel\.id==(\d+)")
+_START_FILTER = re.compile(r"startTime=ge=([0-9T:.\-]+)Z")
+_END_FILTER = re.compile(r"endTime=le=([0-9T:.\-]+)Z")
+
+
+def _parse_api_time(value):
+    return int(datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+
+
+class FakeMagenta:
+    """
+    Stand-in API state and payload generators
+    """
+    def __init__(self, channels=150, latency=0.0, segment_size=188 * 1000):
+        """
+        Args:
+            channels (int): Number of channels in the lineup
+            latency (float): Injected latency per request in seconds
+            segment_size (int): Size of the media payload served for streams
+        """
+        self.channel_count = channels
+        self.latency = latency
+        self.segment = b"\x47" * segment_size
+        self.calls = {}
+        self._lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def count(self, path):
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+
+    def get_calls(self, reset=False):
+        """Upstream call counts by path"""
+        with self._lock:
+            calls = dict(self.calls)
+            if reset:
+                self.calls.clear()
+        return calls
+
+    def channels(self):
+        return {
+            "success": True,
+            "items": [
+                {
+                    "channel": {
+                        "channelId": channel_id,
+                        "name": f"Kanál {channel_id} HD",
+                        "originalName": f"Kanal {channel_id}",
+                        "logoUrl": f"https://cdn.example.com/logos/{channel_id}.png",
+                        "hasArchive": channel_id % 3 != 0
+                    }
+                }
+                for channel_id in range(1, self.channel_count + 1)
+            ]
+        }
+
+    def categories(self):
+        categories = {name: [] for name in CATEGORIES}
+        for channel_id in range(1, self.channel_count + 1):
+            categories[CATEGORIES[channel_id % len(CATEGORIES)]].append({"channelId": channel_id})
+        return {"categories": [{"name": name, "channels": channels} for name, channels in categories.items()]}
+
+    def programs(self, channel_id, start, end):
+        """Programs of one channel covering the window, aligned to the day start"""
+        programs = []
+        timestamp = start - start % 86400
+        index = 0
+        while timestamp < end:
+            length = PROGRAM_LENGTHS[(channel_id + index) % len(PROGRAM_LENGTHS)]
+            if timestamp + length > start:
+                programs.append({
+                    "scheduleId": channel_id * 1000000 + (timestamp // 60) % 1000000,
+                    "startTimeUTC": timestamp * 1000,
+                    "endTimeUTC": (timestamp + length) * 1000,
+                    "program": {
+                        "title": f"Pořad {index} na kanálu {channel_id}",
+                        "description": "Popis pořadu. " * 20,
+                        "programCategory": {"desc": CATEGORIES[index % len(CATEGORIES)]},
+                        "programValue": {"creationYear": 2000 + index % 25, "episodeId": f"S01E{index % 20:02d}"},
+                        "images": [f"https://cdn.example.com/epg/{channel_id}/{index}.jpg"]
+                    }
+                })
+            timestamp += length
+            index += 1
+        return programs
+
+    def epg(self, query):
+        filter_str = query.get("filter", [""])[0]
+        match = _CHANNEL_FILTER.search(filter_str)
+        if match is None:
+            return {"success": False, "errorMessage": "Invalid filter"}
+        if match.group(1):
+            channel_ids = [int(value) for value in match.group(1).split(",") if value]
+        else:
+            channel_ids = [int(match.group(2))]
+
+        start = _parse_api_time(_START_FILTER.search(filter_str).group(1))
+        end = _parse_api_time(_END_FILTER.search(filter_str).group(1))
+        return {
+            "success": True,
+            "items": [
+                {"channel": {"id": channel_id}, "programs": self.programs(channel_id, start, end)}
+                for channel_id in channel_ids if channel_id <= MAX_CHANNEL_ID
+            ]
+        }
+
+    def stream_url(self, query):
+        item_id = int(query.get("id", ["0"])[0])
+        if query.get("service", ["LIVE"])[0] == "LIVE" and item_id > self.channel_count:
+            return {"success": False, "errorMessage": "Channel not found"}
+        return {"success": True, "url": f"{self.url}/redirect/{item_id}?prof={query.get('prof', ['p5'])[0]}"}
+
+    def devices(self):
+        return {
+            "thisDevice": {"id": "device-current", "name": "Android TV"},
+            "smallScreenDevices": [{"id": f"mobile-{index}", "name": f"Phone {index}"} for index in range(3)],
+            "stbAndBigScreenDevices": [{"id": f"stb-{index}", "name": "Android TV"} for index in range(12)]
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, data, status=200):
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def do_POST(self):
+        self.do_GET()
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlparse(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        fake.count(path)
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        token = {"success": True, "token": {"accessToken": "access", "refreshToken": "refresh", "expiresIn": 3600000}}
+        if path in ("/v2/auth/init", "/v2/auth/login", "/v2/auth/tokens"):
+            return self._json(token)
+        if path == "/home/categories":
+            return self._json(fake.categories())
+        if path == "/v2/television/channels":
+            return self._json(fake.channels())
+        if path == "/v2/television/epg":
+            return self._json(fake.epg(query))
+        if path == "/v2/television/stream-url":
+            return self._json(fake.stream_url(query))
+        if path.startswith("/redirect/"):
+            location = f"{fake.url}/hls/{path.rsplit('/', 1)[-1]}/index.m3u8"
+            return self._send(302, headers={"Location": location})
+        if path.startswith("/hls/"):
+            return self._send(200, fake.segment, content_type="application/vnd.apple.mpegurl")
+        if path == "/v2/home/my-devices":
+            return self._json(fake.devices())
+        if path == "/home/deleteDevice":
+            return self._json({"success": True})
+        if path == "/_calls":
+            return self._json(fake.get_calls(reset=query.get("reset") == ["1"]))
+
+        self._json({"success": False, "errorMessage": "Not found"}, 404)
+
+
+def start_server(fake=None, host="127.0.0.1", port=0):
+    """
+    Start the stand-in API in a background thread
+
+    Args:
+        fake (FakeMagenta, optional): API state, a default one is created if None
+        host (str): Address to listen on
+        port (int): Port, 0 for a random free port
+
+    Returns:
+        FakeMagenta: Running API state, its url property points to the server
+    """
+    fake = fake or FakeMagenta()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.fake = fake
+    fake.server = server
+    threading.Thread(target=server.serve_forever, name="fake-magenta", daemon=True).start()
+    return fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in of the Magenta TV API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--channels", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=0, help="Injected latency in ms")
+    args = parser.parse_args()
+
+    fake = start_server(FakeMagenta(args.channels, args.latency / 1000), args.host, args.port)
+    print(f"Fake Magenta API listening on {fake.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Load-test scenario generator and traffic replay
+
+Builds a load scenario from recorded traffic and synthetic patterns and
+replays it against a running backend at a configurable speed-up:
+
+- recorded: requests from an access log (ACCESS_LOG_FILE JSON lines) or
+  from werkzeug request lines in server.log
+- surf: a prime-time channel-surf storm, clients zapping through
+  neighbouring channels with short dwell times
+- epg-storm: clients refreshing the EPG of many channels at once
+- playlist: many boxes reloading the playlist around the same time
+
+Besides latency per route, the report shows cache hit ratios and upstream
+call counts taken from the /metrics endpoint before and after the run.
+
+Usage:
+    python -m benchmarks.replay --target http://127.0.0.1:5000 \\
+        --recorded data/access.log --scenario surf --scenario playlist --speed 10
+    python -m benchmarks.replay --local --scenario surf --scenario epg-storm
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from benchmarks.run import percentile
+
+SCENARIOS = ("surf", "epg-storm", "playlist")
+
+# werkzeug request line in server.log
+_LOG_LINE = re.compile(
+    r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d),(\d{3}).*"(GET|POST) (/\S*) HTTP/[\d.]+" (\d{3})'
+)
+_METRIC_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+class Event:
+    """
+    One request of a scenario
+    """
+    __slots__ = ("offset", "method", "path", "body", "client")
+
+    def __init__(self, offset, method, path, body=None, client=None):
+        self.offset = offset
+        self.method = method
+        self.path = path
+        self.body = body
+        self.client = client
+
+
+def route_of(path):
+    """Route pattern of a path, used to group results"""
+    path = path.split("?", 1)[0]
+    path = re.sub(r"/\d+(?=/|$)", "/<id>", path)
+    path = re.sub(r"/<id>/\d+-\d+$", "/<id>/<range>", path)
+    if path.startswith("/api/proxy/"):
+        return "/api/proxy/<url>"
+    return path
+
+
+def load_recorded(file_path):
+    """
+    Load recorded requests
+
+    Args:
+        file_path (str): Access log (JSON lines) or server.log
+
+    Returns:
+        list: Events with offsets relative to the first request
+    """
+    events = []
+    with open(file_path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                path = record["path"]
+                if path == "/api/proxy/-":
+                    # Proxied URLs are not recorded
+                    continue
+                if record.get("args"):
+                    path += "?" + "&".join(f"{key}={value}" for key, value in record["args"].items())
+                events.append(Event(record["ts"], record["method"], path, record.get("body"), record.get("client")))
+                continue
+
+            match = _LOG_LINE.search(line)
+            if match and match.group(4).startswith("/api/") and not match.group(4).startswith("/api/proxy/"):
+                timestamp = datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").timestamp()
+                events.append(Event(timestamp + int(match.group(2)) / 1000, match.group(3), match.group(4)))
+
+    if events:
+        events.sort(key=lambda event: event.offset)
+        first = events[0].offset
+        for event in events:
+            event.offset -= first
+    return events
+
+
+def scenario_surf(channel_ids, clients, duration):
+    """Channel-surf storm: clients zap up and down with short dwell times"""
+    events = []
+    for client in range(clients):
+        position = random.randrange(len(channel_ids))
+        offset = random.uniform(0, duration * 0.1)
+        while offset < duration:
+            events.append(Event(offset, "GET", f"/api/stream/{channel_ids[position]}?redirect=1", client=f"surf-{client}"))
+            position = (position + random.choice((1, 1, 1, -1, random.randint(-20, 20)))) % len(channel_ids)
+            offset += random.expovariate(1 / 4.0)
+    return events
+
+
+def scenario_epg_storm(channel_ids, clients, duration):
+    """EPG refresh storm: guide grids loading the EPG of all channels at once"""
+    events = []
+    for client in range(clients):
+        start = random.uniform(0, duration * 0.2)
+        for index, channel_id in enumerate(channel_ids):
+            events.append(Event(start + index * 0.01, "GET", f"/api/epg/{channel_id}", client=f"epg-{client}"))
+    return events
+
+
+def scenario_playlist(channel_ids, clients, duration):
+    """Playlist reloads: boxes refreshing the playlist on a common schedule"""
+    events = []
+    reloads = max(1, int(duration // 60))
+    for client in range(clients):
+        for reload in range(reloads):
+            offset = reload * 60 + random.gauss(5, 2)
+            events.append(Event(max(0, offset), "GET", "/api/playlist.m3u", client=f"box-{client}"))
+    return events
+
+
+def build_scenario(args, channel_ids):
+    """Mix recorded and synthetic events into one timeline"""
+    generators = {"surf": scenario_surf, "epg-storm": scenario_epg_storm, "playlist": scenario_playlist}
+
+    events = []
+    if args.recorded:
+        events.extend(load_recorded(args.recorded))
+    for name in args.scenario:
+        events.extend(generators[name](channel_ids, args.clients, args.duration))
+    events.sort(key=lambda event: event.offset)
+    return events
+
+
+def scrape_metrics(target):
+    """
+    Read cache and upstream counters from /metrics
+
+    Returns:
+        dict: Counter values by (metric, label) or None if unavailable
+    """
+    try:
+        response = requests.get(f"{target}/metrics", timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return None
+
+    values = defaultdict(float)
+    for line in response.text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.groups()
+        labels = dict(_LABEL.findall(labels or ""))
+        if name in ("magenta_cache_hits_total", "magenta_cache_misses_total"):
+            values[(name, labels.get("namespace", ""))] += float(value)
+        elif name == "magenta_upstream_request_duration_seconds_count":
+            values[(name, labels.get("endpoint", ""))] += float(value)
+    return values
+
+
+def replay(target, events, speed, concurrency):
+    """
+    Replay events against the target
+
+    Returns:
+        tuple: Results by route (latencies, statuses) and elapsed seconds
+    """
+    results = defaultdict(lambda: {"latencies": [], "statuses": defaultdict(int)})
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(event):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.request(
+                event.method, target + event.path, json=event.body,
+                allow_redirects=False, timeout=60
+            )
+            status = response.status_code
+        except requests.RequestException:
+            status = "error"
+        latency = time.perf_counter() - start
+
+        with lock:
+            result = results[route_of(event.path)]
+            result["latencies"].append(latency)
+            result["statuses"][status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for event in events:
+            delay = started + event.offset / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, event)
+    return results, time.perf_counter() - started
+
+
+def report(results, elapsed, before, after):
+    """Build the replay report"""
+    routes = {}
+    for route, result in sorted(results.items()):
+        latencies = sorted(result["latencies"])
+        routes[route] = {
+            "requests": len(latencies),
+            "statuses": {str(status): count for status, count in result["statuses"].items()},
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "p90_ms": round(percentile(latencies, 0.9) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2)
+        }
+
+    summary = {"elapsed_s": round(elapsed, 2), "routes": routes, "cache": None, "upstream_calls": None}
+    if before is not None and after is not None:
+        delta = {key: after.get(key, 0) - before.get(key, 0) for key in after}
+        namespaces = {namespace for name, namespace in delta if name.startswith("magenta_cache_")}
+        summary["cache"] = {}
+        for namespace in sorted(namespaces):
+            hits = delta.get(("magenta_cache_hits_total", namespace), 0)
+            misses = delta.get(("magenta_cache_misses_total", namespace), 0)
+            summary["cache"][namespace] = {
+                "hits": int(hits),
+                "misses": int(misses),
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None
+            }
+        summary["upstream_calls"] = {
+            endpoint: int(value)
+            for (name, endpoint), value in sorted(delta.items())
+            if name == "magenta_upstream_request_duration_seconds_count" and value
+        }
+    return summary
+
+
+def channel_lineup(target):
+    """Channel IDs of the target, in playlist order"""
+    try:
+        response = requests.get(f"{target}/api/channels", timeout=60)
+        return [channel["id"] for channel in response.json()["channels"]]
+    except (requests.RequestException, ValueError, KeyError):
+        return list(range(1, 151))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded and synthetic traffic against the backend")
+    parser.add_argument("--target", help="Backend base URL, e.g. http://127.0.0.1:5000")
+    parser.add_argument("--local", action="store_true", help="Start the backend against the fake API locally")
+    parser.add_argument("--latency", type=float, default=30, help="Injected upstream latency in ms (--local)")
+    parser.add_argument("--recorded", help="Access log or server.log to replay")
+    parser.add_argument("--scenario", action="append", default=[], choices=SCENARIOS)
+    parser.add_argument("--clients", type=int, default=50, help="Clients per synthetic scenario")
+    parser.add_argument("--duration", type=float, default=120, help="Synthetic scenario length in seconds")
+    parser.add_argument("--speed", type=float, default=1.0, help="Speed-up multiplier")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if not args.target and not args.local:
+        parser.error("either --target or --local is required")
+    if not args.recorded and not args.scenario:
+        parser.error("nothing to replay, use --recorded and/or --scenario")
+
+    data_dir = None
+    if args.local:
+        import tempfile
+        from benchmarks.fake_magenta import FakeMagenta, start_server
+        from benchmarks.run import create_backend, start_backend
+
+        data_dir = tempfile.TemporaryDirectory()
+        fake = start_server(FakeMagenta(latency=args.latency / 1000))
+        _, args.target = start_backend(create_backend(fake, 3600, data_dir.name))
+    target = args.target.rstrip("/")
+
+    events = build_scenario(args, channel_lineup(target))
+    print(f"Replaying {len(events)} requests at {args.speed}x...", file=sys.stderr)
+
+    before = scrape_metrics(target)
+    results, elapsed = replay(target, events, args.speed, args.concurrency)
+    after = scrape_metrics(target)
+
+    output = json.dumps(report(results, elapsed, before, after), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+    if data_dir is not None:
+        data_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
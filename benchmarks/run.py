@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark harness for the MagentaTV backend
+
+Starts the stand-in Magenta API (benchmarks.fake_magenta) and the backend
+on local ports, then measures:
+
+- throughput and latency of the channels, stream, epg, playlist and proxy
+  routes under concurrency
+- EPG parse time and memory for a full-lineup multi-day payload
+
+Results are written as JSON tagged with the current git commit and can be
+compared with an earlier run.
+
+Usage:
+    python -m benchmarks.run --latency 50 --concurrency 16 --output results.json
+    python -m benchmarks.run --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fake_magenta import FakeMagenta, start_server
+
+ROUTES = ("channels", "stream", "epg", "playlist", "proxy")
+
+
+def git_commit():
+    """Current git commit or None"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, fraction):
+    """Percentile of sorted values"""
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Latency percentiles in ms and throughput"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round((len(latencies) + errors) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        "p90_ms": round(percentile(latencies, 0.9) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else None
+    }
+
+
+def create_backend(fake, cache_timeout, data_dir):
+    """Create the backend application configured against the stand-in API"""
+    from app.services import create_app
+
+    config_file = os.path.join(data_dir, "config.json")
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump({
+            "username": "benchmark",
+            "password": "benchmark",
+            "api_base_url": fake.url,
+            "data_dir": data_dir,
+            "cache_timeout": cache_timeout,
+            "debug": False
+        }, f)
+
+    app = create_app(config_file)
+    logging.getLogger().setLevel(logging.WARNING)
+    return app
+
+
+def start_backend(app):
+    """Serve the application on a local port in a background thread"""
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="backend", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def route_url(route, base_url, fake, channel_count):
+    """Build a request URL for a route"""
+    channel_id = random.randint(1, channel_count)
+    if route == "channels":
+        return f"{base_url}/api/channels"
+    if route == "stream":
+        return f"{base_url}/api/stream/{channel_id}"
+    if route == "epg":
+        return f"{base_url}/api/epg/{channel_id}"
+    if route == "playlist":
+        return f"{base_url}/api/playlist.m3u"
+    if route == "proxy":
+        return f"{base_url}/api/proxy/{fake.url}/hls/{channel_id}/index.m3u8"
+    raise ValueError(f"Unknown route: {route}")
+
+
+def bench_route(route, base_url, fake, channel_count, requests_count, concurrency):
+    """Run requests against one route and collect latencies"""
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        url = route_url(route, base_url, fake, channel_count)
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=60)
+            response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    fake.get_calls(reset=True)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(requests_count)))
+    elapsed = time.perf_counter() - start
+
+    summary = summarize([latency for latency, ok in results if ok], sum(1 for _, ok in results if not ok), elapsed)
+    summary["upstream_calls"] = sum(fake.get_calls().values())
+    return summary
+
+
+def bench_epg_parse(app, days_back, days_forward, repeat):
+    """Time and memory of parsing a full-lineup EPG payload"""
+    from app.api.helpers import get_api
+    from app.profiling import get_timers
+
+    with app.app_context():
+        api = get_api()
+        get_timers(reset=True)
+
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        epg_data = api.get_epg(None, days_back, days_forward)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        tracemalloc.stop()
+
+        total = time.perf_counter()
+        for _ in range(repeat - 1):
+            api.get_epg(None, days_back, days_forward)
+        total = time.perf_counter() - total
+
+        timers = get_timers(reset=True)
+
+    return {
+        "channels": len(epg_data or {}),
+        "programs": sum(len(programs) for programs in (epg_data or {}).values()),
+        "days": days_back + days_forward + 1,
+        "parse_avg_ms": timers.get("epg_parse", {}).get("avg_ms"),
+        "fetch_and_parse_avg_ms": round(total * 1000 / (repeat - 1), 2) if repeat > 1 else None,
+        "retained_bytes": retained,
+        "peak_bytes": peak
+    }
+
+
+def run(args):
+    fake = start_server(FakeMagenta(channels=args.channels, latency=args.latency / 1000))
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        app = create_backend(fake, 0 if args.cold else args.cache_timeout, data_dir)
+        server, base_url = start_backend(app)
+
+        results = {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": sys.version.split()[0],
+            "params": {
+                "channels": args.channels,
+                "latency_ms": args.latency,
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "cold": args.cold
+            },
+            "routes": {},
+            "epg_parse": None
+        }
+
+        # Warm-up: login and first cache fill
+        requests.get(f"{base_url}/api/channels", timeout=60)
+
+        for route in args.routes:
+            print(f"Benchmarking {route}...", file=sys.stderr)
+            results["routes"][route] = bench_route(
+                route, base_url, fake, args.channels, args.requests, args.concurrency
+            )
+
+        if not args.skip_epg_parse:
+            print("Benchmarking EPG parsing...", file=sys.stderr)
+            results["epg_parse"] = bench_epg_parse(app, args.epg_days_back, args.epg_days_forward, args.epg_repeat)
+
+        server.shutdown()
+
+    return results
+
+
+def compare(old, new):
+    """Print a comparison of two result files"""
+    print(f"{'metric':<40} {'old':>12} {'new':>12} {'change':>9}")
+    rows = []
+    for route in sorted(set(old.get("routes", {})) | set(new.get("routes", {}))):
+        for metric in ("throughput_rps", "p50_ms", "p99_ms", "upstream_calls"):
+            rows.append((f"{route}.{metric}", old["routes"].get(route, {}).get(metric),
+                         new["routes"].get(route, {}).get(metric)))
+    for metric in ("parse_avg_ms", "fetch_and_parse_avg_ms", "retained_bytes", "peak_bytes"):
+        rows.append((f"epg_parse.{metric}", (old.get("epg_parse") or {}).get(metric),
+                     (new.get("epg_parse") or {}).get(metric)))
+
+    for name, old_value, new_value in rows:
+        if old_value and new_value is not None:
+            change = f"{(new_value - old_value) * 100 / old_value:+.1f}%"
+        else:
+            change = "-"
+        print(f"{name:<40} {str(old_value):>12} {str(new_value):>12} {change:>9}")
+    print(f"\ncommits: {old.get('commit')} -> {new.get('commit')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MagentaTV backend benchmarks")
+    parser.add_argument("--routes", nargs="+", choices=ROUTES, default=list(ROUTES))
+    parser.add_argument("--requests", type=int, default=500, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--channels", type=int, default=150)
+    parser.add_argument("--latency", type=float, default=30, help="Injected upstream latency in ms")
+    parser.add_argument("--cache-timeout", type=int, default=3600)
+    parser.add_argument("--cold", action="store_true", help="Disable caching (CACHE_TIMEOUT=0)")
+    parser.add_argument("--epg-days-back", type=int, default=3)
+    parser.add_argument("--epg-days-forward", type=int, default=3)
+    parser.add_argument("--epg-repeat", type=int, default=5)
+    parser.add_argument("--skip-epg-parse", action="store_true")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.compare[1], encoding="utf-8") as f:
+            new = json.load(f)
+        compare(old, new)
+        return
+
+    results = run(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures of the MagentaTV backend tests"""
+import pytest
+from flask import Flask
+
+from app import cache
+from app.config import DEFAULT_CONFIG
+
+
+@pytest.fixture
+def app():
+    """Bare application with the default configuration and an empty cache"""
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    cache.init_cache()
+    cache.namespace_stats.clear()
+    with app.app_context():
+        yield app
+    cache.init_cache()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Stale, error and single-flight paths of app.cache"""
+import threading
+import time
+
+import pytest
+
+from app import cache
+from app.services.results import UpstreamError, ERROR_NOT_FOUND, ERROR_UNAVAILABLE, ERROR_REJECTED
+
+
+class Upstream:
+    """Fetch function returning queued results, exceptions are raised"""
+
+    def __init__(self, *results, delay=0):
+        self.results = list(results)
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        time.sleep(self.delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def expire(key, seconds_ago=1):
+    with cache.cache_lock:
+        cache.cache_expiry[key] = time.time() - seconds_ago
+
+
+def test_hit_does_not_fetch(app):
+    upstream = Upstream("fresh")
+    assert cache.get_from_cache("channels:a", upstream) == "fresh"
+    assert cache.get_from_cache("channels:a", upstream) == "fresh"
+    assert upstream.calls == 1
+
+
+def test_raise_with_stale_serves_stale(app):
+    upstream = Upstream("old", RuntimeError("upstream down"))
+    cache.get_from_cache("channels:a", upstream)
+    expire("channels:a")
+
+    with app.test_request_context():
+        assert cache.get_from_cache("channels:a", upstream) == "old"
+        assert cache.is_stale()
+    assert cache.namespace_stats["channels"]["stale"] == 1
+
+
+def test_raise_without_stale_propagates(app):
+    with pytest.raises(RuntimeError):
+        cache.get_from_cache("channels:a", Upstream(RuntimeError("upstream down")))
+    assert not cache.is_cached("channels:a")
+
+
+def test_raise_past_stale_window_propagates(app):
+    upstream = Upstream("old", RuntimeError("upstream down"))
+    cache.get_from_cache("channels:a", upstream)
+    expire("channels:a", app.config["CACHE_STALE_MAX_AGE"] + 1)
+
+    with pytest.raises(RuntimeError):
+        cache.get_from_cache("channels:a", upstream)
+
+
+def test_none_with_stale_serves_stale(app):
+    upstream = Upstream("old", None)
+    cache.get_from_cache("channels:a", upstream)
+    expire("channels:a")
+
+    assert cache.get_from_cache("channels:a", upstream) == "old"
+
+
+def test_transient_error_serves_stale_and_is_not_cached(app):
+    error = UpstreamError(ERROR_UNAVAILABLE, "down", "channels")
+    upstream = Upstream("old", error)
+    cache.get_from_cache("channels:a", upstream)
+    expire("channels:a")
+
+    assert cache.get_from_cache("channels:a", upstream) == "old"
+    assert cache.get_cached("channels:a") is None
+
+    assert cache.get_from_cache("channels:b", Upstream(error)) is error
+    assert "channels:b" not in cache.cache
+
+
+def test_rejected_error_is_returned_not_stale(app):
+    error = UpstreamError(ERROR_REJECTED, "refused", "channels")
+    upstream = Upstream("old", error)
+    cache.get_from_cache("channels:a", upstream)
+    expire("channels:a")
+
+    assert cache.get_from_cache("channels:a", upstream) is error
+
+
+def test_not_found_is_cached_negatively(app):
+    error = UpstreamError(ERROR_NOT_FOUND, "missing", "stream")
+    upstream = Upstream(error)
+
+    assert cache.get_from_cache("stream:a:1", upstream) is error
+    assert cache.get_from_cache("stream:a:1", upstream) is error
+    assert upstream.calls == 1
+    timeout = cache.cache_expiry["stream:a:1"] - cache.cache_meta["stream:a:1"]["stored"]
+    assert timeout == pytest.approx(app.config["NEGATIVE_CACHE_TIMEOUT"])
+
+
+def _concurrent(app, count, function):
+    """Run function in count threads with the application context, return results"""
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def run(index):
+        with app.app_context():
+            start.wait()
+            try:
+                results[index] = function()
+            except Exception as e:
+                results[index] = e
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_misses_share_one_fetch(app):
+    upstream = Upstream("fresh", delay=0.2)
+
+    results = _concurrent(app, 8, lambda: cache.get_from_cache("channels:a", upstream))
+
+    assert results == ["fresh"] * 8
+    assert upstream.calls == 1
+    assert cache.namespace_stats["channels"]["coalesced"] == 7
+    assert not cache._in_flight
+
+
+def test_concurrent_misses_share_the_error(app):
+    upstream = Upstream(RuntimeError("upstream down"), delay=0.2)
+
+    results = _concurrent(app, 4, lambda: cache.get_from_cache("channels:a", upstream))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert upstream.calls == 1
+    assert not cache._in_flight
+
+
+def test_concurrent_misses_share_the_stale_fallback(app):
+    upstream = Upstream("old", RuntimeError("upstream down"))
+    cache.get_from_cache("channels:a", upstream)
+    expire("channels:a")
+    upstream.delay = 0.2
+
+    results = _concurrent(app, 4, lambda: cache.get_from_cache("channels:a", upstream))
+
+    assert results == ["old"] * 4
+    assert upstream.calls == 2
+    assert not cache._in_flight
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""States and adaptive timeout of app.services.circuit_breaker"""
+import time
+
+from app.services.circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN, STATE_HALF_OPEN
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("channels", failure_threshold=3)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+    assert breaker.status()["rejected"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("channels", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success(0.1)
+    breaker.record_failure()
+    assert breaker.state == STATE_CLOSED
+
+
+def test_single_probe_after_reset_timeout():
+    breaker = CircuitBreaker("channels", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    assert breaker.state == STATE_HALF_OPEN
+    assert not breaker.allow()
+
+    breaker.record_success(0.1)
+    assert breaker.state == STATE_CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_again():
+    breaker = CircuitBreaker("channels", failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == STATE_OPEN
+    assert not breaker.allow()
+
+
+def test_timeout_adapts_within_bounds():
+    breaker = CircuitBreaker("channels", min_timeout=2)
+    assert breaker.timeout(30) == 30
+
+    breaker.record_success(0.1)
+    assert breaker.timeout(30) == 2
+
+    for _ in range(20):
+        breaker.record_success(10)
+    assert 2 < breaker.timeout(30) <= 30
+    assert breaker.timeout(5) == 5
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Client creation, backoff and failover of app.services.client_pool"""
+import threading
+import time
+
+import pytest
+
+from app.services import client_pool
+from app.services.client_pool import ClientPool
+from app.services.results import UpstreamError, ERROR_UNAVAILABLE, ERROR_NOT_FOUND
+
+
+class Client:
+    def __init__(self, account, language, results=()):
+        self.key = f"{account}/{language}"
+        self.username = f"{account}-user"
+        self.password = "password"
+        self.base_url = f"https://{language}go.magio.tv"
+        self.results = list(results)
+        self.closed = False
+
+    def get_channels(self):
+        return self.results.pop(0) if self.results else f"channels of {self.key}"
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(app, monkeypatch):
+    app.config.update(USERNAME="default-user", PASSWORD="password", LANGUAGE="cz", ACCOUNTS=[
+        {"name": "family", "username": "family-user", "password": "password", "languages": ["cz"]}
+    ])
+    retired = []
+    monkeypatch.setattr(ClientPool, "_retire", lambda self, clients: retired.extend(clients))
+    pool = ClientPool(app)
+    pool.created = []
+    pool.retired = retired
+    pool.results = {}
+
+    def create(account, language):
+        time.sleep(0.05)
+        pool.created.append((account, language))
+        if pool.results.get(account) is None:
+            return None
+        return Client(account, language, pool.results[account])
+
+    pool._create = create
+    return pool
+
+
+def test_concurrent_first_requests_share_one_login(pool):
+    pool.results["default"] = []
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(pool.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert pool.created == [("default", "cz")]
+    assert len({id(client) for client in clients}) == 1
+
+
+def test_failed_creation_backs_off(pool, monkeypatch):
+    assert pool.get() is None
+    assert pool.get() is None
+    assert pool.created == [("default", "cz")]
+
+    pool.results["default"] = []
+    monkeypatch.setattr(client_pool, "MIN_BACKOFF", 0)
+    pool._failures[("default", "cz")]["retry_at"] = 0
+    assert pool.get() is not None
+    assert pool.status()["backoff"] == {}
+
+
+def test_reset_during_login_does_not_keep_the_old_client(pool):
+    pool.results["default"] = []
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pool.get()))
+    thread.start()
+    time.sleep(0.02)
+    pool.reset()
+    thread.join(5)
+
+    assert result[0] is not None
+    assert pool.retired == [result[0]]
+    assert pool.clients() == []
+
+
+def test_call_fails_over_on_transient_errors(pool):
+    pool.results["default"] = [UpstreamError(ERROR_UNAVAILABLE, "down", "channels")]
+    pool.results["family"] = []
+
+    assert pool.call("get_channels") == "channels of family/cz"
+
+
+def test_call_returns_not_found_without_failover(pool):
+    missing = UpstreamError(ERROR_NOT_FOUND, "missing", "channels")
+    pool.results["default"] = [missing]
+    pool.results["family"] = [missing]
+
+    assert pool.call("get_channels") is missing
+    assert len(pool.created) == 1
+
+
+def test_reconfigure_replaces_only_changed_accounts(pool):
+    pool.results["default"] = []
+    pool.results["family"] = []
+    default, family = pool.get("default"), pool.get("family")
+
+    pool.app.config["ACCOUNTS"] = [
+        {"name": "family", "username": "family-user", "password": "changed", "languages": ["cz"]}
+    ]
+    assert pool.reconfigure() == ["family/cz"]
+    assert pool.retired == [family]
+    assert pool.clients() == [default]
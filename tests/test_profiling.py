@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""Parameter validation of app.profiling.Profiler"""
+import pytest
+
+from app.profiling import Profiler
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"duration": None},
+    {"duration": [1]},
+    {"duration": "soon"},
+    {"duration": True},
+    {"duration": 0},
+    {"requests": [1]},
+    {"requests": 1.5},
+    {"requests": -1},
+    {"requests": 1, "interval_ms": None},
+    {"requests": 1, "interval_ms": {"ms": 5}},
+    {"requests": 1, "all_threads": "false"},
+    {"requests": 1, "mode": ["sampling"]},
+])
+def test_invalid_parameters_are_rejected(kwargs):
+    profiler = Profiler()
+    with pytest.raises(ValueError):
+        profiler.start(**kwargs)
+    assert not profiler.active
+
+
+def test_numeric_strings_are_accepted():
+    profiler = Profiler()
+    assert profiler.start(mode="cprofile", requests="2", interval_ms="5")
+    assert profiler.remaining_requests == 2
+    profiler.stop()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Token bucket and priority queue of app.services.rate_limiter"""
+import threading
+import time
+
+from app.services.rate_limiter import (
+    RateLimiter, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_PREFETCH
+)
+
+
+def test_burst_is_granted_without_waiting():
+    limiter = RateLimiter(rate=1, burst=3)
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_empty_bucket_waits_for_the_next_token():
+    limiter = RateLimiter(rate=20, burst=1)
+    limiter.acquire()
+    waited = limiter.acquire()
+    assert 0.02 < waited < 0.5
+
+
+def test_wait_longer_than_max_wait_gives_up():
+    limiter = RateLimiter(rate=0.1, burst=1, max_wait=0.05)
+    limiter.acquire()
+    assert limiter.acquire() is None
+    assert limiter.status()["priorities"]["normal"]["timeouts"] == 1
+
+
+def test_interactive_requests_go_before_queued_background_work():
+    limiter = RateLimiter(rate=10, burst=1)
+    limiter.acquire()
+    order = []
+
+    def request(priority, name):
+        limiter.acquire(priority)
+        order.append(name)
+
+    background = [threading.Thread(target=request, args=(PRIORITY_BACKGROUND, f"background-{index}")) for index in range(3)]
+    for thread in background:
+        thread.start()
+    time.sleep(0.03)
+    interactive = threading.Thread(target=request, args=(PRIORITY_INTERACTIVE, "interactive"))
+    interactive.start()
+    for thread in [*background, interactive]:
+        thread.join(5)
+
+    # The first background request may already hold the next token
+    assert order.index("interactive") <= 1
+
+
+def test_prefetch_never_waits_and_keeps_half_of_the_burst():
+    limiter = RateLimiter(rate=0.1, burst=4)
+    assert limiter.acquire(PRIORITY_PREFETCH) == 0.0
+    assert limiter.acquire(PRIORITY_PREFETCH) == 0.0
+    assert limiter.acquire(PRIORITY_PREFETCH) is None
+    # Clients still get the rest of the bucket
+    assert [limiter.acquire() for _ in range(2)] == [0.0, 0.0]
+
+
+def test_configure_keeps_tokens_within_the_new_burst():
+    limiter = RateLimiter(rate=10, burst=10)
+    limiter.configure(rate=5, burst=2)
+    status = limiter.status()
+    assert status["burst"] == 2
+    assert status["tokens"] <= 2
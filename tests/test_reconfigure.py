@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Rollback of app.services.reconfigure.apply_config"""
+import pytest
+
+from app.services import reconfigure
+
+
+class Client:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.qualities = []
+
+    def update_settings(self, quality, **settings):
+        if quality == self.fail_on:
+            raise RuntimeError("client refused the settings")
+        self.qualities.append(quality)
+
+
+class Pool:
+    def __init__(self, client):
+        self.client = client
+
+    def clients(self):
+        return [self.client]
+
+    def reconfigure(self):
+        return []
+
+
+class ImageCache:
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self._max_age = None
+
+    @property
+    def max_age(self):
+        return self._max_age
+
+    @max_age.setter
+    def max_age(self, value):
+        if value == self.fail_on:
+            raise RuntimeError("image cache refused the setting")
+        self._max_age = value
+
+
+@pytest.fixture
+def rescales(monkeypatch):
+    calls = []
+    monkeypatch.setattr(reconfigure, "rescale_expiry", lambda old, new: calls.append((old, new)))
+    return calls
+
+
+def setup(app, client=None, image_cache=None):
+    app.extensions["client_pool"] = Pool(client or Client())
+    app.extensions["image_cache"] = image_cache or ImageCache()
+    return app
+
+
+def test_effects_are_applied(app, rescales):
+    setup(app)
+
+    result = reconfigure.apply_config(app, {"cache_timeout": 60, "quality": "p3"})
+
+    assert rescales == [(3600, 60)]
+    assert app.extensions["client_pool"].client.qualities == ["p3"]
+    assert result["changed"] == ["CACHE_TIMEOUT", "QUALITY"]
+
+
+def test_effects_after_the_failure_are_not_undone(app, rescales):
+    # Client settings run before the cache timeout is rescaled
+    setup(app, client=Client(fail_on="p3"))
+
+    with pytest.raises(RuntimeError):
+        reconfigure.apply_config(app, {"cache_timeout": 60, "quality": "p3"})
+
+    assert rescales == []
+    assert app.config["CACHE_TIMEOUT"] == 3600
+    assert app.config["QUALITY"] == "p5"
+
+
+def test_effects_before_the_failure_are_undone_in_reverse(app, rescales):
+    client = Client()
+    setup(app, client=client, image_cache=ImageCache(fail_on=60))
+
+    with pytest.raises(RuntimeError):
+        reconfigure.apply_config(app, {"cache_timeout": 60, "quality": "p3", "image_cache_max_age": 60})
+
+    assert rescales == [(3600, 60), (60, 3600)]
+    assert client.qualities == ["p3", "p5"]
+    assert app.config["IMAGE_CACHE_MAX_AGE"] == 604800
+    assert app.extensions["image_cache"].max_age is None
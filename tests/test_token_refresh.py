@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Token refresh of MagentaTV clients sharing one token file"""
+import itertools
+import threading
+
+import pytest
+
+from app.services.magenta_tv import MagentaTV
+
+
+class Upstream:
+    """Auth endpoints that rotate the refresh token on every use"""
+
+    def __init__(self):
+        self.calls = []
+        self.refresh_token = None
+        self._serial = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def request(self, endpoint, method, url, json=None, **kwargs):
+        with self._lock:
+            self.calls.append(endpoint)
+            if endpoint == "auth/tokens" and json["refreshToken"] != self.refresh_token:
+                return Response({"success": False, "errorMessage": "Invalid refresh token"})
+            serial = next(self._serial)
+            self.refresh_token = f"refresh-{serial}"
+        return Response({
+            "success": True,
+            "token": {"accessToken": f"access-{serial}", "refreshToken": self.refresh_token, "expiresIn": 3600 * 1000}
+        })
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+        self.status_code = 200
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def upstream(app, tmp_path):
+    app.config["DATA_DIR"] = str(tmp_path)
+    return Upstream()
+
+
+def client(upstream):
+    api = MagentaTV("user", "password", device_id="device-1")
+    api._request = upstream.request
+    return api
+
+
+def expire(*clients):
+    for api in clients:
+        api.token_expires = 0
+    clients[0]._save_tokens()
+
+
+def test_refresh_reuses_tokens_rotated_by_another_worker(upstream):
+    first = client(upstream)
+    assert first.login()
+    second = client(upstream)
+    expire(first, second)
+
+    assert first.refresh_access_token()
+    upstream.calls.clear()
+
+    # The refresh token of the second worker was rotated away by the first
+    assert second.refresh_access_token()
+    assert upstream.calls == []
+    assert second.refresh_token == first.refresh_token
+
+
+def test_concurrent_refreshes_rotate_once(upstream):
+    first = client(upstream)
+    assert first.login()
+    workers = [first] + [client(upstream) for _ in range(3)]
+    expire(*workers)
+    upstream.calls.clear()
+
+    results = []
+    threads = [threading.Thread(target=lambda api=api: results.append(api.refresh_access_token())) for api in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [True] * 4
+    assert upstream.calls == ["auth/tokens"]
+
+
+def test_failed_refresh_falls_back_to_login(upstream):
+    api = client(upstream)
+    assert api.login()
+    expire(api)
+    upstream.refresh_token = "revoked"
+    upstream.calls.clear()
+
+    assert api.refresh_access_token()
+    assert upstream.calls == ["auth/tokens", "auth/init", "auth/login"]